@@ -1,16 +1,23 @@
 """GameBuilderAgent — orchestrates the three-phase game generation pipeline."""
 
-from phases import clarify, plan, execute
+import os
+
+import artifacts
+import idea_index
+from config import IDEA_REUSE
+from phases import bundle, clarify, plan, execute, edit, validate
+from phases.context import BuildContext
 
 
 class GameBuilderAgent:
-    """Orchestrates: clarify → plan → execute."""
+    """Orchestrates: clarify → plan → execute, then optional edits."""
 
     def __init__(self):
         self.history: list[dict] = []
         self.requirements: str = ""
         self.plan: dict = {}
         self.output_path: str = ""
+        self.ctx = BuildContext()
 
     def run(self):
         """Run the full pipeline interactively."""
@@ -25,15 +32,62 @@ class GameBuilderAgent:
             return
 
         # Phase 1: Clarify requirements
-        self.requirements, self.history = clarify.run(game_idea)
+        self.requirements, self.history = clarify.run(game_idea, self.ctx)
 
-        # Phase 2: Generate game plan
-        self.plan, self.history = plan.run(self.requirements, self.history)
+        if not self._reuse(game_idea):
+            # Phase 2: Generate game plan
+            self.plan, self.history = plan.run(self.requirements, self.history, self.ctx)
 
-        # Phase 3: Generate code
-        self.output_path = execute.run(self.plan, self.history)
+            # Phase 3: Generate code
+            self.output_path = execute.run(self.plan, self.history, self.ctx)
+            if idea_index.index and not validate.check(edit.read_files(self.output_path)):
+                idea_index.index.add(game_idea, self.requirements, self.plan,
+                                     artifacts.package(self.output_path))
 
         print("\n" + "=" * 60)
         print("  BUILD COMPLETE!")
-        print(f"  Open {self.output_path}/index.html in your browser to play.")
+        print(f"  Open {self._page()} in your browser to play.")
         print("=" * 60 + "\n")
+
+        self.edit_loop()
+
+    def edit_loop(self):
+        """Apply change requests to the built game until the user is done."""
+        while True:
+            instruction = input(
+                "\nDescribe a change (e.g. \"make the enemies faster\"), "
+                "or press Enter to finish:\n> ").strip()
+            if not instruction:
+                return
+            try:
+                result = edit.run(self.plan, instruction, self.ctx)
+            except edit.PatchError as e:
+                print(f"\nCould not apply the change: {e}")
+                continue
+            how = "patched" if result["mode"] == "patch" else "rewritten"
+            print(f"\n  {', '.join(result['files'])} {how}. "
+                  f"Reload {self._page()} to play.")
+
+    def _reuse(self, game_idea: str) -> bool:
+        """Offer (or, with ``IDEA_REUSE=auto``, take) an earlier build of a
+        near-identical request; True if it was linked into the output directory."""
+        similar = idea_index.index.lookup(game_idea, self.requirements) \
+            if idea_index.index else None
+        if not similar:
+            return False
+        print(f"\nA game for a very similar request was built before: "
+              f"'{similar['title']}' ({similar['score']:.0%} match).")
+        if IDEA_REUSE != "auto":
+            answer = input("Use it instead of building a new one? [Y/n] ").strip().lower()
+            if answer not in ("", "y", "yes"):
+                return False
+        entry = idea_index.index.reuse(similar["id"], self.ctx.output_path)
+        if entry is None:
+            return False
+        self.plan, self.output_path = entry.plan, self.ctx.output_path
+        return True
+
+    def _page(self) -> str:
+        """The game's page: the single-file bundle if one was made."""
+        page = os.path.join(self.output_path, bundle.BUNDLE_FILE)
+        return page if os.path.isfile(page) else os.path.join(self.output_path, "index.html")
@@ -0,0 +1,390 @@
+"""Request handling shared by the Flask (app.py) and ASGI (asgi.py) servers.
+
+Each route's checks, session updates, events and response headers are
+written once, here. A server parses the request, makes the model calls —
+blocking in app.py, awaited in asgi.py — and turns the results into its own
+responses. The helpers that read or write the session store, the artifact
+store or the idea index block, so asgi.py runs them in worker threads; each
+server keeps its own build queue and speculative plans.
+"""
+
+import json
+import unicodedata
+import uuid
+from typing import NamedTuple
+from urllib.parse import quote
+
+from werkzeug.datastructures import Headers
+
+import artifacts
+import idea_index
+import llm
+import metrics
+from config import IDEA_REUSE
+from jobs import JobQueue, QueueFull
+from phases import bundle
+from phases.context import BuildContext
+from session_store import create_store, start_sweeper
+
+# Game files at a versioned URL never change; the unversioned ones are revalidated
+PREVIEW_CACHE = "no-cache"
+VERSIONED_CACHE = "public, max-age=31536000, immutable"
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+KEEP_ALIVE = ": keep-alive\n\n"
+METRICS_MIMETYPE = "text/plain; version=0.0.4"
+# Sent with a 304 as with the file itself
+_REVALIDATION_HEADERS = ("ETag", "Cache-Control", "Vary")
+
+# Server-side session store: { session_id: { game_idea, history, requirements, plan, output_path } }
+sessions = create_store()
+# Called with the id of each expired session, e.g. to cancel its speculative plan
+expiry_hooks: list = []
+
+
+def _forget_session(session_id: str):
+    """Drop in-process state of an expired session (called on the sweeper thread)."""
+    llm.chat_pool.discard(session_id)
+    metrics.traces.discard(session_id)
+    for hook in expiry_hooks:
+        hook(session_id)
+
+
+def _output_evicted(session_id: str):
+    """Forget a session's output once the store quota has deleted it."""
+    session = sessions.get(session_id) if sessions.exists(session_id) else None
+    if session and session.get("output_path"):
+        session["output_path"] = None
+        sessions.save(session_id, session)
+
+
+start_sweeper(sessions, on_expire=_forget_session)
+# Deletes store objects no build refers to, and outputs of vanished sessions
+artifacts.start_collector(is_live=sessions.exists,
+                          pinned=idea_index.index.objects if idea_index.index else None,
+                          on_evict=_output_evicted)
+
+
+class ApiError(Exception):
+    """A request that cannot be served; answered with ``{"error": message}``."""
+
+    def __init__(self, message: str, status: int = 400, headers: dict | None = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def unavailable(e: llm.ModelUnavailable) -> ApiError:
+    """Quota and overload errors that outlasted the retries: 429 or 503, not 500."""
+    return ApiError(str(e), e.status, {"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+def payload(data) -> dict:
+    """The parsed JSON body of a POST, which must be an object."""
+    if not isinstance(data, dict):
+        raise ApiError("Expected a JSON object")
+    return data
+
+
+# ── Clarification ──────────────────────────────────────────────────────────
+
+def new_session(data: dict) -> tuple[str, dict]:
+    """A new session for the game idea in a ``/api/start`` body."""
+    game_idea = str(data.get("game_idea", "")).strip()
+    if not game_idea:
+        raise ApiError("No game idea provided")
+    session = {
+        "game_idea": game_idea,
+        "history": [],
+        "requirements": None,
+        "plan": None,
+        "output_path": None,
+    }
+    return str(uuid.uuid4()), session
+
+
+def reply_session(data: dict) -> tuple[str, dict, str]:
+    """The session and the user's reply in a ``/api/message`` body."""
+    session_id = data.get("session_id")
+    message = str(data.get("message", "")).strip()
+    session = sessions.get(session_id) if session_id else None
+    if not session:
+        raise ApiError("Invalid session")
+    if not message:
+        raise ApiError("Empty message")
+    return session_id, session, message
+
+
+def clarified(session_id: str, session: dict, reply: tuple) -> tuple[dict, bool]:
+    """Record a clarification turn, as ``clarify.run_web`` returned it.
+
+    Returns the response body and whether to plan speculatively now; if
+    not, a speculative plan from earlier turns is stale.
+    """
+    response_text, is_clear, requirements, history = reply
+    session["history"] = history
+    if is_clear:
+        session["requirements"] = requirements
+    similar = _find_similar(session) if is_clear else None
+    sessions.save(session_id, session)
+    body = {"response": response_text, "is_clear": is_clear, "similar": similar}
+    return body, bool(is_clear and not (similar and IDEA_REUSE == "auto"))
+
+
+def _find_similar(session: dict) -> dict | None:
+    """Look up an earlier build of the session's request; kept for /api/build."""
+    similar = None
+    if idea_index.index:
+        similar = idea_index.index.lookup(session["game_idea"], session["requirements"])
+    session["similar"] = similar
+    return similar
+
+
+# ── Builds and edits ───────────────────────────────────────────────────────
+
+def build_request(data: dict) -> tuple[str, dict, str | None]:
+    """The session of a ``/api/build`` body, and the indexed build to reuse, if any."""
+    session_id = data.get("session_id")
+    session = sessions.get(session_id) if session_id else None
+    if not session:
+        raise ApiError("Invalid session")
+    if not session.get("requirements"):
+        raise ApiError("Requirements not yet clarified")
+    # Serve the earlier build offered for this request, if asked to (or always, in auto mode)
+    similar = session.get("similar")
+    reuse = data.get("reuse") or (similar["id"] if similar and IDEA_REUSE == "auto" else None)
+    if reuse and reuse != (similar or {}).get("id"):
+        raise ApiError("No such game was offered for this session")
+    return session_id, session, reuse
+
+
+def edit_request(data: dict) -> tuple[str, dict, str]:
+    """The session and change request of a ``/api/edit`` body."""
+    session_id = data.get("session_id")
+    instruction = str(data.get("instruction", "")).strip()
+    session = sessions.get(session_id) if session_id else None
+    if not session:
+        raise ApiError("Invalid session")
+    if not session.get("output_path") or not session.get("plan"):
+        raise ApiError("Nothing built yet")
+    if artifacts.load(session["output_path"]) is None:
+        raise ApiError("Game not built yet", 404)
+    if not instruction:
+        raise ApiError("Empty instruction")
+    return session_id, session, instruction
+
+
+def submit(queue: JobQueue, session_id: str, events, exclusive: bool = False) -> dict:
+    """Queue ``events(job)`` for the session; the ``202`` response body.
+
+    The session's unfinished job is returned instead of starting another,
+    or with ``exclusive``, refused.
+    """
+    if exclusive and queue.active_job(session_id):
+        raise ApiError("A build or edit is already running", 409)
+    try:
+        job = queue.submit(session_id, events)
+    except QueueFull as e:
+        raise ApiError(str(e), 429, {"Retry-After": "10"})
+    return {"job_id": job.id, "status": job.status}
+
+
+def reused(session_id: str, session: dict, entry_id: str, ctx: BuildContext) -> dict | None:
+    """Serve an indexed build as the session's game; the ``done`` event, or None if it is gone."""
+    entry = idea_index.index.reuse(entry_id, ctx.output_path) if idea_index.index else None
+    if entry is None:
+        return None
+    manifest = artifacts.package(ctx.output_path)
+    session.update(plan=entry.plan, output_path=ctx.output_path, timings={})
+    sessions.save(session_id, session)
+    print(f"[ideas] {session_id}: serving the earlier build of '{entry.title}'")
+    page = bundle.BUNDLE_FILE if bundle.BUNDLE_FILE in manifest["files"] else "index.html"
+    return {"type": "done", "title": entry.title, "files": sorted(entry.files),
+            "timings": {}, "problems": 0, "reused": session["similar"],
+            "preview_url": preview_url(session_id, manifest["version"], page)}
+
+
+def planned(session_id: str, session: dict, game_plan: dict, history: list[dict]) -> dict:
+    """Record the session's plan; the ``plan`` event."""
+    session["plan"] = game_plan
+    session["history"] = history
+    sessions.save(session_id, session)
+    return {"type": "plan", "title": game_plan.get("title", "Your Game")}
+
+
+def built(session_id: str, session: dict, event: dict, ctx: BuildContext) -> dict:
+    """Package and record a finished build; its ``done`` event for the browser."""
+    # Compress and zip once here instead of on every preview/download
+    manifest = artifacts.package(event["output_path"])
+    session["output_path"] = event["output_path"]
+    session["timings"] = dict(ctx.timings)
+    session["compaction"] = dict(ctx.compaction)
+    sessions.save(session_id, session)
+    if idea_index.index and not event.get("problems"):
+        idea_index.index.add(session["game_idea"], session["requirements"],
+                             session["plan"], manifest)
+    return {"type": "done", "title": session["plan"].get("title", "Your Game"),
+            "files": event["files"], "timings": session["timings"],
+            "problems": event.get("problems", 0), "bundle": event.get("bundle"),
+            "preview_url": preview_url(session_id, manifest["version"], _entry_page(event))}
+
+
+def edited(session_id: str, session: dict, instruction: str, event: dict) -> dict:
+    """Package and record a finished edit; its ``done`` event for the browser."""
+    manifest = artifacts.package(event["output_path"])
+    session.setdefault("edits", []).append(instruction)
+    sessions.save(session_id, session)
+    return {"type": "done", "title": session["plan"].get("title", "Your Game"),
+            "files": event["files"], "edit": event["mode"],
+            "problems": event["problems"], "bundle": event.get("bundle"),
+            "preview_url": preview_url(session_id, manifest["version"], _entry_page(event))}
+
+
+def browser_event(event: dict) -> dict:
+    """A phase event as the browser gets it: file contents are sent as a size only."""
+    if event["type"] == "file_done":
+        return {"type": "file_done", "file": event["file"], "chars": len(event["content"])}
+    return event
+
+
+def _entry_page(event: dict) -> str:
+    """The page a build or edit is previewed with: its single-file bundle, if made."""
+    return event["bundle"]["file"] if event.get("bundle") else "index.html"
+
+
+# ── Jobs ───────────────────────────────────────────────────────────────────
+
+def job(queue: JobQueue, job_id: str):
+    found = queue.get(job_id)
+    if not found:
+        raise ApiError("Job not found", 404)
+    return found
+
+
+def job_status(queue: JobQueue, job_id: str) -> dict:
+    """A build job's status, with the game's title once it is done."""
+    found = job(queue, job_id)
+    result = found.to_dict()
+    session = sessions.get(found.session_id)
+    if found.status == "done" and session:
+        result["title"] = session["plan"].get("title", "Your Game")
+    return result
+
+
+def cancel(queue: JobQueue, job_id: str) -> dict:
+    found = job(queue, job_id)
+    if not queue.cancel(job_id):
+        raise ApiError(f"Job already {found.status}", 409)
+    return found.to_dict()
+
+
+def resume_from(last_event_id: str | None) -> int:
+    """The first event to stream; EventSource resends the last id it saw when it reconnects."""
+    try:
+        return int(last_event_id if last_event_id is not None else -1) + 1
+    except ValueError:
+        return 0
+
+
+def sse(event: dict, event_id: int) -> str:
+    """Format an event dict as a server-sent-events message."""
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+
+def trace(session_id: str) -> dict:
+    """Spans recorded for a session: phases, model calls and queue waits."""
+    spans = metrics.traces.get(session_id)
+    if spans is None:
+        raise ApiError("No trace for this session", 404)
+    return {"session_id": session_id, "spans": spans}
+
+
+def render_metrics(queue: JobQueue) -> str:
+    """Counters and histograms in the Prometheus text format."""
+    for status, count in queue.stats().items():
+        metrics.BUILD_JOBS_CURRENT.set(count, status=status)
+    if llm.concurrency:
+        metrics.LLM_CONCURRENCY_LIMIT.set(llm.concurrency.limit)
+        metrics.LLM_IN_FLIGHT.set(llm.concurrency.active)
+    return metrics.render()
+
+
+# ── Game files ─────────────────────────────────────────────────────────────
+
+class Artifact(NamedTuple):
+    """A file to send from the artifact store, with every header it is sent with."""
+
+    path: str
+    mimetype: str
+    etag: str
+    headers: dict
+
+
+def manifest(session_id: str) -> dict:
+    """The manifest of a built session, which locates its files in the artifact store."""
+    session = sessions.get(session_id)
+    if not session:
+        raise ApiError("Session not found", 404)
+    output_path = session.get("output_path")
+    found = artifacts.load(output_path) if output_path else None
+    if found is None:
+        raise ApiError("Game not built yet", 404)
+    return found
+
+
+def preview_url(session_id: str, version: str, filename: str = "index.html") -> str:
+    return f"/api/preview/{session_id}/v/{version}/{filename}"
+
+
+def game_file(manifest: dict, filename: str, accept_encoding: str | None,
+              cache_control: str) -> Artifact:
+    """A game file, precompressed if the client accepts it."""
+    entry = manifest["files"].get(filename)
+    if entry is None:
+        raise ApiError("File not found", 404)
+    encoding = artifacts.choose_encoding(accept_encoding or "", entry["encodings"])
+    etag = f"{entry['etag']}-{encoding}" if encoding else entry["etag"]
+    headers = _artifact_headers(etag, cache_control, _disposition("inline", filename))
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Artifact(artifacts.variant_path(manifest, filename, encoding),
+                    artifacts.MIME_TYPES[filename], etag, headers)
+
+
+def download(session_id: str) -> Artifact:
+    """All of a session's game files as a zip (built once, after the build)."""
+    found = manifest(session_id)
+    session = sessions.get(session_id)
+    title = "game"
+    if session.get("plan"):
+        title = session["plan"].get("title", "game").replace(" ", "_").lower()
+    etag = found["zip"]["etag"]
+    return Artifact(artifacts.zip_path(found), "application/zip", etag,
+                    _artifact_headers(etag, PREVIEW_CACHE,
+                                      _disposition("attachment", f"{title}.zip")))
+
+
+def not_modified(artifact: Artifact, if_none_match: str | None) -> dict | None:
+    """The headers of a 304 if the client already has the artifact, else None."""
+    if not artifacts.etag_matches(if_none_match, artifact.etag):
+        return None
+    return {k: v for k, v in artifact.headers.items() if k in _REVALIDATION_HEADERS}
+
+
+def _artifact_headers(etag: str, cache_control: str, disposition: str) -> dict:
+    return {"ETag": f'"{etag}"', "Cache-Control": cache_control,
+            "Content-Disposition": disposition}
+
+
+def _disposition(kind: str, filename: str) -> str:
+    """A Content-Disposition value, with an ASCII fallback name as send_file gives."""
+    headers = Headers()
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
+        headers.set("Content-Disposition", kind, filename=simple,
+                    **{"filename*": f"UTF-8''{quote(filename, safe='')}"})
+    else:
+        headers.set("Content-Disposition", kind, filename=filename)
+    return headers["Content-Disposition"]
@@ -1,18 +1,40 @@
-"""Flask web server for the Agentic Game-Builder AI."""
+"""Flask web server for the Agentic Game-Builder AI.
 
-import os
-import uuid
-import zipfile
-import io
+The routes' shared logic lives in api.py, which the ASGI server
+(asgi.py) uses too; here the phases run on worker threads.
+"""
 
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
+from flask import (
+    Flask, Response, redirect, render_template, request, jsonify, send_file,
+    stream_with_context,
+)
 
-from phases import clarify, plan, execute
+import api
+import llm
+from jobs import JobQueue
+from prefetch import PlanPrefetcher
+from phases import clarify, plan, execute, edit
+from phases.context import BuildContext
+from ratelimit import BULK
 
 app = Flask(__name__)
 
-# Server-side session store: { session_id: { game_idea, history, requirements, plan, output_path } }
-sessions: dict[str, dict] = {}
+# Plans started speculatively once requirements are clear, taken by /api/build
+plan_prefetcher = PlanPrefetcher()
+api.expiry_hooks.append(plan_prefetcher.cancel)
+
+# Background build workers — /api/build returns a job id immediately
+build_queue = JobQueue()
+
+
+@app.errorhandler(api.ApiError)
+def api_error(e):
+    return jsonify({"error": str(e)}), e.status, e.headers
+
+
+@app.errorhandler(llm.ModelUnavailable)
+def model_unavailable(e):
+    return api_error(api.unavailable(e))
 
 
 @app.route("/")
@@ -23,141 +45,175 @@ def index():
 @app.route("/api/start", methods=["POST"])
 def api_start():
     """Accept a game idea and run the first clarification round."""
-    data = request.get_json()
-    game_idea = data.get("game_idea", "").strip()
-    if not game_idea:
-        return jsonify({"error": "No game idea provided"}), 400
-
-    session_id = str(uuid.uuid4())
-
-    response_text, is_clear, requirements, history = clarify.run_web(game_idea)
-
-    sessions[session_id] = {
-        "game_idea": game_idea,
-        "history": history,
-        "requirements": requirements,
-        "plan": None,
-        "output_path": None,
-    }
-
-    return jsonify({
-        "session_id": session_id,
-        "response": response_text,
-        "is_clear": is_clear,
-    })
+    session_id, session = api.new_session(_payload())
+    reply = clarify.run_web(session["game_idea"], ctx=BuildContext.for_session(session_id))
+    body, prefetch = api.clarified(session_id, session, reply)
+    if prefetch:
+        plan_prefetcher.start(session_id, session["requirements"], session["history"])
+    return jsonify({"session_id": session_id, **body})
 
 
 @app.route("/api/message", methods=["POST"])
 def api_message():
     """Accept a user reply during the clarification phase."""
-    data = request.get_json()
-    session_id = data.get("session_id")
-    message = data.get("message", "").strip()
-
-    if not session_id or session_id not in sessions:
-        return jsonify({"error": "Invalid session"}), 400
-    if not message:
-        return jsonify({"error": "Empty message"}), 400
-
-    session = sessions[session_id]
-
-    response_text, is_clear, requirements, history = clarify.run_web(
+    session_id, session, message = api.reply_session(_payload())
+    reply = clarify.run_web(
         game_idea=session["game_idea"],
         history=session["history"],
         user_reply=message,
+        ctx=BuildContext.for_session(session_id),
     )
-
-    session["history"] = history
-    if is_clear:
-        session["requirements"] = requirements
-
-    return jsonify({
-        "response": response_text,
-        "is_clear": is_clear,
-    })
+    body, prefetch = api.clarified(session_id, session, reply)
+    # Requirements changed (or are being refined): replan from the new history
+    if prefetch:
+        plan_prefetcher.start(session_id, session["requirements"], session["history"])
+    else:
+        plan_prefetcher.cancel(session_id)
+    return jsonify(body)
 
 
 @app.route("/api/build", methods=["POST"])
 def api_build():
-    """Run plan + execute phases after requirements are clear."""
-    data = request.get_json()
-    session_id = data.get("session_id")
-
-    if not session_id or session_id not in sessions:
-        return jsonify({"error": "Invalid session"}), 400
-
-    session = sessions[session_id]
-    if not session.get("requirements"):
-        return jsonify({"error": "Requirements not yet clarified"}), 400
-
-    try:
-        # Phase 2: Plan
-        game_plan, history = plan.run(session["requirements"], session["history"])
-        session["plan"] = game_plan
-        session["history"] = history
-
-        # Phase 3: Execute — generate into a session-specific output dir
-        output_dir = os.path.join(os.path.abspath("output"), session_id)
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Temporarily override OUTPUT_DIR for this build
-        import config
-        original_output_dir = config.OUTPUT_DIR
-        config.OUTPUT_DIR = output_dir
-
-        output_path = execute.run(game_plan, history)
-
-        config.OUTPUT_DIR = original_output_dir
-        session["output_path"] = output_path
-
-        return jsonify({
-            "success": True,
-            "title": game_plan.get("title", "Your Game"),
-        })
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Queue plan + execute phases as a background job after requirements are clear."""
+    session_id, session, reuse = api.build_request(_payload())
+    body = api.submit(build_queue, session_id,
+                      lambda job: _build_events(session_id, session, reuse))
+    return jsonify(body), 202
+
+
+@app.route("/api/edit", methods=["POST"])
+def api_edit():
+    """Queue a change to a built game ("make the enemies faster") as a background job."""
+    session_id, session, instruction = api.edit_request(_payload())
+    body = api.submit(build_queue, session_id,
+                      lambda job: _edit_events(session_id, session, instruction),
+                      exclusive=True)
+    return jsonify(body), 202
+
+
+@app.route("/api/jobs/<job_id>")
+def api_job_status(job_id):
+    """Poll a build job's status."""
+    return jsonify(api.job_status(build_queue, job_id))
+
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    """Cancel a queued or running build job."""
+    return jsonify(api.cancel(build_queue, job_id))
+
+
+@app.route("/api/jobs/<job_id>/events")
+def api_job_events(job_id):
+    """Stream a build job's progress as server-sent events."""
+    job = api.job(build_queue, job_id)
+    start = api.resume_from(request.headers.get("Last-Event-ID"))
+
+    def generate():
+        for index, event in job.follow(start):
+            yield api.KEEP_ALIVE if event is None else api.sse(event, index)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers=api.STREAM_HEADERS)
+
+
+@app.route("/api/sessions/<session_id>/trace")
+def api_session_trace(session_id):
+    """Spans recorded for a session: phases, model calls and queue waits."""
+    return jsonify(api.trace(session_id))
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Counters and histograms in the Prometheus text format."""
+    return Response(api.render_metrics(build_queue), mimetype=api.METRICS_MIMETYPE)
+
+
+def _build_events(session_id: str, session: dict, reuse: str | None = None):
+    """Run Phase 2 and Phase 3 for a session, yielding browser-facing events.
+
+    With ``reuse``, the idea index entry's game is served instead, unless it
+    has gone from the store.
+    """
+    ctx = BuildContext.for_session(session_id, priority=BULK)
+    if reuse:
+        done = api.reused(session_id, session, reuse, ctx)
+        if done:
+            plan_prefetcher.cancel(session_id)
+            yield done
+            return
+    yield {"type": "phase", "phase": 2, "status": "started"}
+
+    # Phase 2: Plan — usually already running since requirements became clear
+    game_plan = None
+    prefetched = plan_prefetcher.take(session_id, session["requirements"], session["history"])
+    if prefetched:
+        try:
+            game_plan, history, plan_ctx = prefetched.result()
+            ctx.merge(plan_ctx)
+        except Exception as e:  # cancelled or failed: plan again below
+            print(f"[prefetch] plan for {session_id} unusable ({type(e).__name__}: {e}) "
+                  "— planning again")
+    if game_plan is None:
+        game_plan, history = plan.run(session["requirements"], session["history"], ctx)
+    yield api.planned(session_id, session, game_plan, history)
+
+    # Phase 3: Execute — generate into the session's own output dir
+    for event in execute.run_stream(game_plan, history, ctx):
+        if event["type"] == "done":
+            yield api.built(session_id, session, event, ctx)
+        else:
+            yield api.browser_event(event)
+
+
+def _edit_events(session_id: str, session: dict, instruction: str):
+    """Apply one change request to a session's game, yielding browser-facing events."""
+    ctx = BuildContext.for_session(session_id, priority=BULK)
+    ctx.output_dir = session["output_path"]
+    for event in edit.run_stream(session["plan"], instruction, ctx):
+        if event["type"] == "done":
+            yield api.edited(session_id, session, instruction, event)
+        else:
+            yield api.browser_event(event)
 
 
 @app.route("/api/preview/<session_id>/<path:filename>")
 def api_preview(session_id, filename):
-    """Serve generated game files for iframe preview."""
-    if session_id not in sessions:
-        return "Session not found", 404
+    """Serve generated game files for iframe preview, revalidated by ETag."""
+    manifest = api.manifest(session_id)
+    return _send(api.game_file(manifest, filename, request.headers.get("Accept-Encoding"),
+                               api.PREVIEW_CACHE))
 
-    session = sessions[session_id]
-    output_path = session.get("output_path")
-    if not output_path:
-        return "Game not built yet", 404
 
-    return send_from_directory(output_path, filename)
+@app.route("/api/preview/<session_id>/v/<version>/<path:filename>")
+def api_preview_versioned(session_id, version, filename):
+    """Serve one build's game files; the version in the path makes them immutable."""
+    manifest = api.manifest(session_id)
+    if version != manifest["version"]:
+        return redirect(api.preview_url(session_id, manifest["version"], filename))
+    return _send(api.game_file(manifest, filename, request.headers.get("Accept-Encoding"),
+                               api.VERSIONED_CACHE))
 
 
 @app.route("/api/download/<session_id>")
 def api_download(session_id):
-    """Download all generated game files as a zip."""
-    if session_id not in sessions:
-        return "Session not found", 404
-
-    session = sessions[session_id]
-    output_path = session.get("output_path")
-    if not output_path:
-        return "Game not built yet", 404
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fname in ("index.html", "style.css", "game.js"):
-            fpath = os.path.join(output_path, fname)
-            if os.path.exists(fpath):
-                zf.write(fpath, fname)
-    buf.seek(0)
-
-    title = "game"
-    if session.get("plan"):
-        title = session["plan"].get("title", "game").replace(" ", "_").lower()
-
-    return send_file(buf, mimetype="application/zip",
-                     as_attachment=True, download_name=f"{title}.zip")
+    """Download all generated game files as a zip (built once, after the build)."""
+    return _send(api.download(session_id))
+
+
+def _payload() -> dict:
+    return api.payload(request.get_json(silent=True))
+
+
+def _send(artifact: api.Artifact):
+    """Send a file from the artifact store, or 304 if the client already has it."""
+    headers = api.not_modified(artifact, request.headers.get("If-None-Match"))
+    if headers is not None:
+        return Response(status=304, headers=headers)
+    response = send_file(artifact.path, mimetype=artifact.mimetype, conditional=False,
+                         etag=False)
+    response.headers.update(artifact.headers)
+    return response
 
 
 if __name__ == "__main__":
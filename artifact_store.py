@@ -0,0 +1,126 @@
+"""Content-addressed artifact store — every distinct file kept once on disk.
+
+Objects live under ``<root>/objects/<first two hex digits>/<sha256>`` and
+never change once written (they are made read-only). Builds refer to them
+by digest: a session's game files are hardlinks to their objects (copies
+where the filesystem cannot link), and its manifest lists the digests of
+its compressed variants and download zip (see ``artifacts.package``).
+
+The store itself keeps no reference counts; ``sweep`` is given the counts
+gathered from the manifests (``artifacts.collect``) and deletes objects
+nothing refers to. Objects stored or reused within ``grace`` seconds are
+never swept, so a build being packaged is safe from a concurrent sweep.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+import metrics
+
+
+class ArtifactStore:
+    """Immutable objects keyed by the SHA-256 of their bytes."""
+
+    def __init__(self, root: str, grace: float = 300.0):
+        self.root = root
+        self.grace = grace
+        self._objects = os.path.join(root, "objects")
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` unless an identical object exists; return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        try:
+            # Reusing an object restarts its grace period
+            os.utime(path)
+            metrics.ARTIFACT_STORE_PUTS.inc(outcome="deduplicated")
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = _tmp_path(path)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, path)
+            metrics.ARTIFACT_STORE_PUTS.inc(outcome="stored")
+        return digest
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self._objects, digest[:2], digest)
+
+    def link(self, digest: str, path: str):
+        """Replace ``path`` with the object, as a hardlink if possible.
+
+        The old file at ``path`` is replaced atomically, never written to, so
+        other links to the object it was are unaffected.
+        """
+        obj = self.path(digest)
+        if os.path.exists(path) and os.path.samefile(obj, path):
+            return  # already linked; replacing a link with itself is a no-op
+        tmp = _tmp_path(path)
+        _remove(tmp)  # left by a crashed write
+        try:
+            try:
+                os.link(obj, tmp)
+            except OSError:  # another filesystem, or no hardlink support
+                shutil.copyfile(obj, tmp)
+                metrics.ARTIFACT_STORE_PUTS.inc(outcome="copied")
+            os.replace(tmp, path)
+        finally:
+            _remove(tmp)
+
+    def store(self, path: str, data: bytes) -> str:
+        """``put`` the data and ``link`` it at ``path``; return its digest."""
+        digest = self.put(data)
+        self.link(digest, path)
+        return digest
+
+    def objects(self) -> dict[str, tuple[int, float]]:
+        """Every object as ``{digest: (size, mtime)}``."""
+        found = {}
+        if not os.path.isdir(self._objects):
+            return found
+        for fan in os.scandir(self._objects):
+            if not fan.is_dir():
+                continue
+            for entry in os.scandir(fan.path):
+                if ".tmp" in entry.name:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found[entry.name] = (stat.st_size, stat.st_mtime)
+        return found
+
+    def sweep(self, references: dict[str, int]) -> tuple[int, int]:
+        """Delete objects with no references, past their grace period.
+
+        Returns:
+            ``(objects deleted, bytes freed)``.
+        """
+        cutoff = time.time() - self.grace
+        deleted = freed = 0
+        for digest, (size, mtime) in self.objects().items():
+            if references.get(digest, 0) > 0 or mtime > cutoff:
+                continue
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            freed += size
+        return deleted, freed
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,323 @@
+"""Build artifacts — precompressed game files and the download zip.
+
+After a build, ``package`` makes a gzip (and, if the optional ``brotli``
+package is installed, a brotli) copy of each game file plus the download
+zip, and writes a manifest of content-hash ETags to
+``<output>/.artifacts/``. The web server then serves these bytes as they
+are: no per-request compression or zipping, and unchanged files answer
+``304 Not Modified``.
+
+All of these bytes live in the content-addressed ``store``
+(``artifact_store.py``), so files identical across builds are kept once:
+the game files in the output directory become hardlinks to their objects,
+and the manifest names the objects holding each variant and the zip.
+``collect`` counts the manifests' references and deletes what no build
+uses any more.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from collections import Counter
+
+import metrics
+from artifact_store import ArtifactStore
+from config import (
+    OUTPUT_DIR, ARTIFACT_STORE_DIR, ARTIFACT_STORE_MAX_MB, ARTIFACT_GC_INTERVAL,
+    ARTIFACT_GC_GRACE,
+)
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+ARTIFACT_DIR = ".artifacts"
+MANIFEST = "manifest.json"
+# Content-Encodings served, in order of preference
+ENCODINGS = ("br", "gzip")
+# The game files, in zip order, with bare mimetypes; the servers add the charset
+MIME_TYPES = {
+    "index.html": "text/html",
+    "style.css": "text/css",
+    "game.js": "application/javascript",
+    # The single-file bundle (phases/bundle.py)
+    "game.html": "text/html",
+}
+# Fixed zip timestamps keep the archive, and so its ETag, deterministic
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+# Parsed manifests kept in memory, keyed by output path
+MAX_CACHED_MANIFESTS = 1024
+# Web session output directories are named by a uuid4; others (batch/, the
+# CLI's files) are not the collector's to delete
+SESSION_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Shared by every build in the process (and by processes sharing OUTPUT_DIR)
+store = ArtifactStore(ARTIFACT_STORE_DIR, ARTIFACT_GC_GRACE)
+
+_manifests: dict[str, tuple[int, dict]] = {}
+_lock = threading.Lock()
+
+
+def package(output_path: str) -> dict:
+    """Store the game files, their compressed variants and the zip; return the manifest.
+
+    The manifest maps each file to its ETag, size, available encodings and
+    the store ``objects`` holding each encoding (``identity`` = the file
+    itself), and carries a ``version`` that changes whenever any file does.
+    Call it again whenever the game files change.
+    """
+    artifact_dir = os.path.join(output_path, ARTIFACT_DIR)
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    files, digest = {}, hashlib.sha256()
+    zip_buf = io.BytesIO()
+    with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for name in _game_files(output_path):
+            with open(os.path.join(output_path, name), "rb") as f:
+                data = f.read()
+            etag = hashlib.sha256(data).hexdigest()[:32]
+            digest.update(f"{name}\0{etag}\0".encode())
+            objects = {"identity": store.store(os.path.join(output_path, name), data)}
+            for encoding, encoded in _variants(data).items():
+                objects[encoding] = store.put(encoded)
+            files[name] = {"etag": etag, "size": len(data),
+                           "encodings": [e for e in ENCODINGS if e in objects],
+                           "objects": objects}
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, data)
+
+    zip_data = zip_buf.getvalue()
+    manifest = {
+        "version": digest.hexdigest()[:16],
+        "files": files,
+        "zip": {"etag": hashlib.sha256(zip_data).hexdigest()[:32], "size": len(zip_data),
+                "object": store.put(zip_data)},
+    }
+    _write(os.path.join(artifact_dir, MANIFEST), json.dumps(manifest, indent=2).encode())
+    _remember(output_path, manifest)
+    return manifest
+
+
+def load(output_path: str) -> dict | None:
+    """The build's manifest, packaging the files first if there is none yet.
+
+    Returns None if the output directory has no game files.
+    """
+    path = os.path.join(output_path, ARTIFACT_DIR, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return package(output_path) if _game_files(output_path) else None
+    with _lock:
+        cached = _manifests.get(output_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if "object" not in manifest["zip"]:  # packaged before the store existed
+        return package(output_path)
+    _remember(output_path, manifest, mtime)
+    return manifest
+
+
+def variant_path(manifest: dict, name: str, encoding: str | None) -> str:
+    """Store path of a file's bytes for a Content-Encoding (None = the original)."""
+    return store.path(manifest["files"][name]["objects"][encoding or "identity"])
+
+
+def zip_path(manifest: dict) -> str:
+    return store.path(manifest["zip"]["object"])
+
+
+def objects(manifest: dict) -> list[str]:
+    """Digests of every store object a manifest refers to."""
+    digests = [manifest["zip"].get("object")]
+    for entry in manifest["files"].values():
+        digests += entry.get("objects", {}).values()
+    return [digest for digest in digests if digest]
+
+
+def collect(is_live=None, output_root: str = OUTPUT_DIR,
+            max_bytes: int = ARTIFACT_STORE_MAX_MB * 1024 * 1024, pinned=None,
+            on_evict=None) -> dict:
+    """Garbage-collect the store against the session outputs under ``output_root``.
+
+    1. Output directories of sessions that no longer exist
+       (``is_live(session_id)`` is false) are deleted — e.g. those left
+       behind when the in-memory session store was restarted.
+    2. References to each object are counted over the remaining manifests,
+       and objects without any are deleted.
+    3. While the store is over ``max_bytes`` (0 = no quota), the least
+       recently packaged outputs are deleted and their objects released;
+       ``on_evict(session_id)`` is called for each, so a live session stops
+       pointing at its deleted output.
+
+    Outputs changed within the store's grace period are never deleted, nor
+    are the objects ``pinned()`` returns (e.g. the idea index's games).
+
+    Returns:
+        Disk usage and what was removed (see README).
+    """
+    cutoff = time.time() - store.grace
+    removed = {"orphan": 0, "quota": 0}
+    outputs: dict[str, tuple[float, list[str]]] = {}
+    entries = os.scandir(output_root) if os.path.isdir(output_root) else []
+    for entry in entries:
+        if not entry.is_dir() or not SESSION_DIR.match(entry.name):
+            continue
+        manifest_path = os.path.join(entry.path, ARTIFACT_DIR, MANIFEST)
+        mtime = max(_mtime(entry.path), _mtime(manifest_path))
+        if is_live and mtime < cutoff and not is_live(entry.name):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed["orphan"] += 1
+            continue
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                outputs[entry.path] = (mtime, objects(json.load(f)))
+        except (OSError, ValueError, KeyError):  # not packaged (yet)
+            outputs[entry.path] = (mtime, [])
+
+    references = Counter(d for _, digests in outputs.values() for d in digests)
+    if pinned:
+        references.update(pinned())
+    deleted, freed = store.sweep(references)
+    stored = store.objects()
+    used = sum(size for size, _ in stored.values())
+    if max_bytes and used > max_bytes:
+        for path, (mtime, digests) in sorted(outputs.items(), key=lambda item: item[1][0]):
+            if used <= max_bytes or mtime >= cutoff:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            removed["quota"] += 1
+            del outputs[path]
+            if on_evict:
+                on_evict(os.path.basename(path))
+            for digest in digests:
+                references[digest] -= 1
+                if references[digest] == 0 and digest in stored:
+                    used -= stored[digest][0]
+        more_deleted, more_freed = store.sweep(references)
+        deleted, freed = deleted + more_deleted, freed + more_freed
+        stored = store.objects()
+
+    stats = {
+        "objects": len(stored),
+        "bytes": sum(size for size, _ in stored.values()),
+        "logical_bytes": sum(size * references[d] for d, (size, _) in stored.items()),
+        "shared_objects": sum(1 for d in stored if references[d] > 1),
+        "outputs": len(outputs),
+        "max_bytes": max_bytes,
+        "deleted_objects": deleted,
+        "freed_bytes": freed,
+        "removed_outputs": removed,
+    }
+    metrics.ARTIFACT_STORE_OBJECTS.set(stats["objects"])
+    metrics.ARTIFACT_STORE_BYTES.set(stats["bytes"], kind="stored")
+    metrics.ARTIFACT_STORE_BYTES.set(stats["logical_bytes"], kind="logical")
+    metrics.ARTIFACT_GC_REMOVED.inc(deleted, kind="object")
+    for reason, count in removed.items():
+        metrics.ARTIFACT_GC_REMOVED.inc(count, kind=f"{reason}_output")
+    metrics.ARTIFACT_GC_FREED.inc(freed)
+    return stats
+
+
+def start_collector(is_live=None, interval: float = ARTIFACT_GC_INTERVAL,
+                    pinned=None, on_evict=None) -> threading.Thread | None:
+    """Run ``collect`` at startup and then every ``interval`` seconds on a
+    daemon thread (``interval`` 0 = never)."""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                stats = collect(is_live, pinned=pinned, on_evict=on_evict)
+                print(f"[artifacts] {stats['objects']} objects, "
+                      f"{stats['bytes'] / 1e6:.1f} MB stored for "
+                      f"{stats['logical_bytes'] / 1e6:.1f} MB of builds; removed "
+                      f"{stats['deleted_objects']} objects, "
+                      f"{sum(stats['removed_outputs'].values())} outputs")
+            except Exception as e:
+                print(f"Artifact collection failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="artifact-collector", daemon=True)
+    thread.start()
+    return thread
+
+
+def choose_encoding(accept_encoding: str, available: list[str]) -> str | None:
+    """The preferred encoding among ``available`` that the client accepts."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.lower()] = q
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return f'"{etag}"' in tags
+
+
+def _game_files(output_path: str) -> list[str]:
+    return [name for name in MIME_TYPES
+            if os.path.isfile(os.path.join(output_path, name))]
+
+
+def _variants(data: bytes) -> dict[str, bytes]:
+    """Each compressed copy that is smaller than the original."""
+    encoded = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        encoded["br"] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in encoded.items() if len(body) < len(data)}
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _write(path: str, data: bytes):
+    """Replace a file atomically, so readers never see a partial artifact."""
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _remember(output_path: str, manifest: dict, mtime: int | None = None):
+    if mtime is None:
+        mtime = os.stat(os.path.join(output_path, ARTIFACT_DIR, MANIFEST)).st_mtime_ns
+    with _lock:
+        _manifests.pop(output_path, None)
+        _manifests[output_path] = (mtime, manifest)
+        while len(_manifests) > MAX_CACHED_MANIFESTS:
+            del _manifests[next(iter(_manifests))]
@@ -0,0 +1,385 @@
+"""ASGI web server — the Flask app's routes, served from one event loop.
+
+Each model call in a request, a build or an edit is awaited on the
+backend's async API (``clarify.run_web_async``, ``plan.run_async``,
+``execute.run_stream_async``, ``edit.run_stream_async``: the phase steps
+the Flask app runs too, see ``phases.steps``), so a slow generation holds
+a coroutine instead of an OS thread, and a single process can keep
+hundreds of builds in flight. The routes' logic is shared with app.py through api.py, whose
+session, file and artifact I/O runs in worker threads; routing, requests
+and responses are werkzeug's, as in Flask.
+
+Run it with any ASGI server, e.g. ``uvicorn asgi:app --port 5000``
+(``pip install uvicorn``). ``python bench.py --targets asgi`` load-tests it
+in-process against the fake model.
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import traceback
+
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, RequestRedirect, Rule
+from werkzeug.sansio.request import Request as SansIORequest
+from werkzeug.sansio.response import Response as SansIOResponse
+from werkzeug.security import safe_join
+
+import api
+import llm
+from jobs import AsyncJobQueue
+from prefetch import AsyncPlanPrefetcher
+from phases import clarify, plan, execute, edit
+from phases.context import BuildContext
+from ratelimit import BULK
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+INDEX_PAGE = os.path.join(ROOT, "templates", "index.html")
+
+# Speculative plans, as tasks on the event loop
+plan_prefetcher = AsyncPlanPrefetcher()
+# Builds and edits, as tasks on the event loop
+build_queue = AsyncJobQueue()
+# The server's event loop, for cleanup requested from the sweeper thread
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _cancel_plan(session_id: str):
+    if _loop:
+        _loop.call_soon_threadsafe(plan_prefetcher.cancel, session_id)
+
+
+api.expiry_hooks.append(_cancel_plan)
+
+
+class Request(SansIORequest):
+    """One HTTP request, with its body read in full."""
+
+    def __init__(self, scope: dict, body: bytes):
+        super().__init__(
+            method=scope["method"], scheme=scope.get("scheme", "http"),
+            server=scope.get("server"), root_path=scope.get("root_path", ""),
+            path=scope["path"], query_string=scope.get("query_string", b""),
+            headers=Headers([(k.decode("latin-1"), v.decode("latin-1"))
+                             for k, v in scope.get("headers", [])]),
+            remote_addr=(scope.get("client") or [None])[0])
+        self.body = body
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            data = None
+        return api.payload(data)
+
+
+class Response(SansIOResponse):
+    """Status and headers, and a body — or ``stream``, an async iterator of bytes."""
+
+    default_mimetype = None
+
+    def __init__(self, body: bytes | str = b"", status: int = 200, headers: dict | None = None,
+                 mimetype: str | None = None, stream=None):
+        super().__init__(status, headers, mimetype)
+        self.body = body.encode() if isinstance(body, str) else body
+        self.stream = stream
+
+
+def _json(data: dict, status: int = 200, headers: dict | None = None) -> Response:
+    return Response(json.dumps(data), status, headers, "application/json")
+
+
+# ── Routes ─────────────────────────────────────────────────────────────────
+
+url_map = Map()
+
+
+def route(rule: str, methods: tuple[str, ...] = ("GET",)):
+    """Register a handler for a werkzeug URL rule, as ``Flask.route`` does."""
+    def register(handler):
+        url_map.add(Rule(rule, endpoint=handler, methods=list(methods)))
+        return handler
+    return register
+
+
+@route("/")
+async def index(request):
+    return Response(await asyncio.to_thread(_read, INDEX_PAGE), mimetype="text/html")
+
+
+@route("/static/<path:filename>")
+async def static(request, filename):
+    path = safe_join(STATIC_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return Response("Not found", 404, mimetype="text/plain")
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return Response(await asyncio.to_thread(_read, path), mimetype=mimetype)
+
+
+@route("/api/start", methods=("POST",))
+async def api_start(request):
+    """Accept a game idea and run the first clarification round."""
+    session_id, session = api.new_session(request.json())
+    reply = await clarify.run_web_async(session["game_idea"],
+                                        ctx=BuildContext.for_session(session_id))
+    body, prefetch = await asyncio.to_thread(api.clarified, session_id, session, reply)
+    if prefetch:
+        plan_prefetcher.start(session_id, session["requirements"], session["history"])
+    return _json({"session_id": session_id, **body})
+
+
+@route("/api/message", methods=("POST",))
+async def api_message(request):
+    """Accept a user reply during the clarification phase."""
+    session_id, session, message = await asyncio.to_thread(api.reply_session, request.json())
+    reply = await clarify.run_web_async(
+        game_idea=session["game_idea"],
+        history=session["history"],
+        user_reply=message,
+        ctx=BuildContext.for_session(session_id),
+    )
+    body, prefetch = await asyncio.to_thread(api.clarified, session_id, session, reply)
+    if prefetch:
+        plan_prefetcher.start(session_id, session["requirements"], session["history"])
+    else:
+        plan_prefetcher.cancel(session_id)
+    return _json(body)
+
+
+@route("/api/build", methods=("POST",))
+async def api_build(request):
+    """Queue plan + execute phases as a background task after requirements are clear."""
+    session_id, session, reuse = await asyncio.to_thread(api.build_request, request.json())
+    body = api.submit(build_queue, session_id,
+                      lambda job: _build_events(session_id, session, reuse))
+    return _json(body, 202)
+
+
+@route("/api/edit", methods=("POST",))
+async def api_edit(request):
+    """Queue a change to a built game as a background task."""
+    session_id, session, instruction = await asyncio.to_thread(api.edit_request,
+                                                               request.json())
+    body = api.submit(build_queue, session_id,
+                      lambda job: _edit_events(session_id, session, instruction),
+                      exclusive=True)
+    return _json(body, 202)
+
+
+@route("/api/jobs/<job_id>")
+async def api_job_status(request, job_id):
+    """Poll a build job's status."""
+    return _json(await asyncio.to_thread(api.job_status, build_queue, job_id))
+
+
+@route("/api/jobs/<job_id>/cancel", methods=("POST",))
+async def api_job_cancel(request, job_id):
+    """Cancel a queued or running build job; a running one stops at once."""
+    return _json(api.cancel(build_queue, job_id))
+
+
+@route("/api/jobs/<job_id>/events")
+async def api_job_events(request, job_id):
+    """Stream a build job's progress as server-sent events."""
+    job = api.job(build_queue, job_id)
+    start = api.resume_from(request.headers.get("Last-Event-ID"))
+
+    async def generate():
+        async for index, event in job.follow_async(start):
+            yield (api.KEEP_ALIVE if event is None else api.sse(event, index)).encode()
+
+    return Response(headers=api.STREAM_HEADERS, mimetype="text/event-stream",
+                    stream=generate())
+
+
+@route("/api/sessions/<session_id>/trace")
+async def api_session_trace(request, session_id):
+    """Spans recorded for a session: phases, model calls and queue waits."""
+    return _json(api.trace(session_id))
+
+
+@route("/metrics")
+async def metrics_endpoint(request):
+    """Counters and histograms in the Prometheus text format."""
+    return Response(api.render_metrics(build_queue), mimetype=api.METRICS_MIMETYPE)
+
+
+@route("/api/preview/<session_id>/<path:filename>")
+async def api_preview(request, session_id, filename):
+    """Serve generated game files for iframe preview, revalidated by ETag."""
+    manifest = await asyncio.to_thread(api.manifest, session_id)
+    return await _send(request, api.game_file(
+        manifest, filename, request.headers.get("Accept-Encoding"), api.PREVIEW_CACHE))
+
+
+@route("/api/preview/<session_id>/v/<version>/<path:filename>")
+async def api_preview_versioned(request, session_id, version, filename):
+    """Serve one build's game files; the version in the path makes them immutable."""
+    manifest = await asyncio.to_thread(api.manifest, session_id)
+    if version != manifest["version"]:
+        return Response(status=302, headers={
+            "Location": api.preview_url(session_id, manifest["version"], filename)})
+    return await _send(request, api.game_file(
+        manifest, filename, request.headers.get("Accept-Encoding"), api.VERSIONED_CACHE))
+
+
+@route("/api/download/<session_id>")
+async def api_download(request, session_id):
+    """Download all generated game files as a zip (built once, after the build)."""
+    return await _send(request, await asyncio.to_thread(api.download, session_id))
+
+
+async def _send(request: Request, artifact: api.Artifact) -> Response:
+    """Send a file from the artifact store, or 304 if the client already has it."""
+    headers = api.not_modified(artifact, request.headers.get("If-None-Match"))
+    if headers is not None:
+        return Response(status=304, headers=headers)
+    return Response(await asyncio.to_thread(_read, artifact.path), headers=artifact.headers,
+                    mimetype=artifact.mimetype)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ── Builds ─────────────────────────────────────────────────────────────────
+
+async def _build_events(session_id: str, session: dict, reuse: str | None = None):
+    """Run Phase 2 and Phase 3 for a session, yielding browser-facing events.
+
+    With ``reuse``, the idea index entry's game is served instead, unless it
+    has gone from the store.
+    """
+    ctx = BuildContext.for_session(session_id, priority=BULK)
+    if reuse:
+        done = await asyncio.to_thread(api.reused, session_id, session, reuse, ctx)
+        if done:
+            plan_prefetcher.cancel(session_id)
+            yield done
+            return
+    yield {"type": "phase", "phase": 2, "status": "started"}
+
+    # Phase 2: Plan — usually already running since requirements became clear
+    game_plan = None
+    prefetched = plan_prefetcher.take(session_id, session["requirements"], session["history"])
+    if prefetched:
+        try:
+            game_plan, history, plan_ctx = await prefetched
+            ctx.merge(plan_ctx)
+        except (Exception, asyncio.CancelledError) as e:
+            if asyncio.current_task().cancelling():
+                raise  # the build itself was cancelled
+            print(f"[prefetch] plan for {session_id} unusable ({type(e).__name__}: {e}) "
+                  "— planning again")
+    if game_plan is None:
+        game_plan, history = await plan.run_async(
+            session["requirements"], session["history"], ctx)
+    yield await asyncio.to_thread(api.planned, session_id, session, game_plan, history)
+
+    # Phase 3: Execute — generate into the session's own output dir
+    async for event in execute.run_stream_async(game_plan, history, ctx):
+        if event["type"] == "done":
+            yield await asyncio.to_thread(api.built, session_id, session, event, ctx)
+        else:
+            yield api.browser_event(event)
+
+
+async def _edit_events(session_id: str, session: dict, instruction: str):
+    """Apply one change request to a session's game, yielding browser-facing events."""
+    ctx = BuildContext.for_session(session_id, priority=BULK)
+    ctx.output_dir = session["output_path"]
+    async for event in edit.run_stream_async(session["plan"], instruction, ctx):
+        if event["type"] == "done":
+            yield await asyncio.to_thread(api.edited, session_id, session, instruction, event)
+        else:
+            yield api.browser_event(event)
+
+
+# ── ASGI ───────────────────────────────────────────────────────────────────
+
+async def app(scope: dict, receive, send):
+    """The ASGI application."""
+    global _loop
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                _loop = asyncio.get_running_loop()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                build_queue.shutdown()
+                plan_prefetcher.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    _loop = _loop or asyncio.get_running_loop()
+
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    response = await _dispatch(Request(scope, body))
+
+    headers = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+               for k, v in response.headers.items()]
+    if response.stream is None:
+        headers.append((b"content-length", str(len(response.body)).encode()))
+    await send({"type": "http.response.start", "status": response.status_code,
+                "headers": headers})
+    if response.stream is None:
+        await send({"type": "http.response.body", "body": response.body})
+    else:
+        await _stream(response.stream, receive, send)
+
+
+async def _dispatch(request: Request) -> Response:
+    """Run the matching route's handler, mapping errors to status codes."""
+    urls = url_map.bind(request.host or "localhost", url_scheme=request.scheme)
+    try:
+        handler, values = urls.match(request.path, request.method)
+        return await handler(request, **values)
+    except RequestRedirect as e:
+        return Response(status=e.code, headers={"Location": e.new_url})
+    except HTTPException as e:  # no such route, or not for this method
+        return Response(e.name, e.code, mimetype="text/plain")
+    except api.ApiError as e:
+        return _json({"error": str(e)}, e.status, e.headers)
+    except llm.ModelUnavailable as e:
+        e = api.unavailable(e)
+        return _json({"error": str(e)}, e.status, e.headers)
+    except Exception:
+        traceback.print_exc()
+        return _json({"error": "Internal server error"}, 500)
+
+
+async def _stream(chunks, receive, send):
+    """Send a streamed body until it ends or the client disconnects."""
+    async def disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    gone = asyncio.ensure_future(disconnect())
+    try:
+        async for chunk in chunks:
+            if gone.done():
+                return
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        gone.cancel()
+        await chunks.aclose()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving the ASGI app needs an ASGI server: pip install uvicorn")
+    uvicorn.run(app, host="0.0.0.0", port=5000)
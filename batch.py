@@ -0,0 +1,151 @@
+"""Headless batch builder — run clarify → plan → execute for many game ideas.
+
+Input is JSONL, one game per line:
+
+    {"id": "snake", "game_idea": "A snake game with power-ups",
+     "answers": ["Arrow keys", "Neon on black"]}
+
+``id`` defaults to the line number. ``answers`` are replayed, in order, to
+the clarifying questions; once they run out the model is told to use its
+best judgment. Each finished item is appended to the manifest JSONL, and
+items already marked ``done`` there are skipped, so a crashed run can simply
+be restarted.
+
+Usage:
+    python batch.py ideas.jsonl --workers 4 --rpm 60
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm
+from config import LLM_RPM, OUTPUT_DIR
+from phases import clarify, plan, execute
+from phases.context import BuildContext
+from ratelimit import BULK
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build many games from a JSONL file.")
+    parser.add_argument("input", help="JSONL file of game ideas")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="games built concurrently (default: 4)")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="model requests per minute across all workers "
+                             "(default: LLM_RPM, 0 = unlimited)")
+    parser.add_argument("--tpm", type=float, default=None,
+                        help="model tokens per minute across all workers "
+                             "(default: LLM_TPM, 0 = unlimited)")
+    parser.add_argument("--output-dir", default=os.path.join(OUTPUT_DIR, "batch"),
+                        help="where each game's directory is created")
+    parser.add_argument("--manifest", default=None,
+                        help="results JSONL (default: <output-dir>/manifest.jsonl)")
+    args = parser.parse_args()
+
+    if args.rpm is not None or args.tpm is not None:
+        llm.set_rate_limit(LLM_RPM if args.rpm is None else args.rpm, args.tpm)
+    manifest = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    run_batch(load_items(args.input), args.output_dir, manifest, args.workers)
+
+
+def load_items(path: str) -> list[dict]:
+    """Read game ideas from JSONL, assigning ids to lines without one."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("game_idea"):
+                raise ValueError(f"{path}:{line_no}: missing game_idea")
+            item.setdefault("id", f"item-{line_no:04d}")
+            if not re.fullmatch(r"[\w.-]+", str(item["id"])) or item["id"] in ("..", "."):
+                raise ValueError(f"{path}:{line_no}: id must be a plain file name")
+            items.append(item)
+    return items
+
+
+def completed_ids(manifest: str) -> set[str]:
+    """Ids whose latest manifest record is ``done``."""
+    latest = {}
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash
+                latest[record["id"]] = record["status"]
+    return {item_id for item_id, status in latest.items() if status == "done"}
+
+
+def run_batch(items: list[dict], output_dir: str, manifest: str, workers: int):
+    """Build every item not yet done, appending one record per item to the manifest."""
+    done = completed_ids(manifest)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} item(s): {len(done & {i['id'] for i in items})} already done, "
+          f"{len(todo)} to build with {workers} worker(s)")
+    if not todo:
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(manifest)), exist_ok=True)
+    lock = threading.Lock()
+    counts = {"done": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = [pool.submit(build_item, item, output_dir) for item in todo]
+        for n, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            with lock, open(manifest, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            counts[record["status"]] += 1
+            detail = record.get("title") or record.get("error")
+            print(f"[{n}/{len(todo)}] {record['status']}: {record['id']} — {detail} "
+                  f"({record['duration']:.1f}s)")
+
+    print(f"Batch finished: {counts['done']} done, {counts['failed']} failed. "
+          f"Manifest: {manifest}")
+
+
+def build_item(item: dict, output_dir: str) -> dict:
+    """Run the full pipeline for one item and return its manifest record."""
+    ctx = BuildContext(session_id=item["id"], priority=BULK,
+                       output_dir=os.path.join(output_dir, item["id"]))
+    record = {"id": item["id"], "game_idea": item["game_idea"], "started_at": time.time()}
+    try:
+        requirements, history = _clarify(item, ctx)
+        game_plan, history = plan.run(requirements, history, ctx)
+        record["title"] = game_plan.get("title")
+        record["output_path"] = execute.run(game_plan, history, ctx)
+        record["status"] = "done"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+
+    record["finished_at"] = time.time()
+    record["duration"] = record["finished_at"] - record["started_at"]
+    record["timings"] = ctx.timings
+    record["tokens"] = ctx.tokens
+    return record
+
+
+def _clarify(item: dict, ctx: BuildContext) -> tuple[str, list[dict]]:
+    """Clarify non-interactively, answering from the item's pre-written replies."""
+    answers = list(item.get("answers", []))
+    _, is_clear, requirements, history = clarify.run_web(item["game_idea"], ctx=ctx)
+    while not is_clear:
+        reply = answers.pop(0) if answers else clarify.DEFAULT_REPLY
+        _, is_clear, requirements, history = clarify.run_web(
+            item["game_idea"], history, reply, ctx=ctx)
+    return requirements, history
+
+
+if __name__ == "__main__":
+    main()
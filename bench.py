@@ -0,0 +1,341 @@
+"""Latency and throughput benchmarks for each phase and the web API.
+
+Runs against the offline fake backend (see fake_model.py), so results
+measure our own overhead — history rebuilding, extraction, file writes,
+Flask and the job queue — on top of a simulated model speed. Each target is
+run at every concurrency level, and p50/p95/p99 latency, throughput and
+the peak number of threads are printed and saved as JSON for comparing
+runs. The ``asgi`` target drives the event-loop server (asgi.py) with
+concurrent sessions on one loop instead of one thread each.
+
+Usage:
+    python bench.py --concurrency 1,4,16 --requests 32
+    python bench.py --ttft 0 --tps 0   # instant model: pure overhead
+    BUILD_QUEUE_DEPTH=512 LLM_MAX_CONCURRENCY=0 \
+        python bench.py --targets api,asgi --concurrency 256 --requests 256
+"""
+
+import os
+import tempfile
+
+# Never touch the network, the shared response cache or ./output
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("OUTPUT_DIR", tempfile.mkdtemp(prefix="bench-output-"))
+
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+from config import (
+    FAKE_LLM_RECORDINGS, FAKE_LLM_TTFT, FAKE_LLM_TOKENS_PER_SEC, FAKE_LLM_ERROR_RATE,
+    FAKE_LLM_SLOW_RATE, FAKE_LLM_SLOW_TTFT,
+    MODEL_BACKEND, OUTPUT_DIR,
+)
+from phases import clarify, plan, execute
+from phases.context import BuildContext
+
+TARGETS = ("clarify", "plan", "execute", "api", "asgi")
+GAME_IDEA = "A game where you catch falling stars and dodge rocks"
+USER_REPLY = "Three lives, arrow keys, neon style."
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the build pipeline.")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help=f"comma-separated subset of {', '.join(TARGETS)}")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="comma-separated concurrent sessions (default: 1,2,4,8)")
+    parser.add_argument("--requests", type=int, default=16,
+                        help="samples per target and concurrency level (default: 16)")
+    parser.add_argument("--ttft", type=float, default=FAKE_LLM_TTFT,
+                        help="fake time to first token, seconds")
+    parser.add_argument("--tps", type=float, default=FAKE_LLM_TOKENS_PER_SEC,
+                        help="fake decode speed, tokens/sec (0 = instant)")
+    parser.add_argument("--slow-rate", type=float, default=FAKE_LLM_SLOW_RATE,
+                        help="fraction of fake requests with a slow first token")
+    parser.add_argument("--slow-ttft", type=float, default=FAKE_LLM_SLOW_TTFT,
+                        help="fake time to first token of slow requests, seconds")
+    parser.add_argument("--output", default=None,
+                        help="results JSON (default: bench_results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    if MODEL_BACKEND == "fake":
+        from fake_model import FakeBackend
+        llm.set_backend(FakeBackend(FAKE_LLM_RECORDINGS or None, args.ttft, args.tps,
+                                    FAKE_LLM_ERROR_RATE, args.slow_rate, args.slow_ttft))
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+    levels = [int(n) for n in args.concurrency.split(",")]
+
+    results = run_benchmarks(targets, levels, args.requests)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "backend": llm.backend.name,
+        "ttft": args.ttft,
+        "tokens_per_sec": args.tps,
+        "slow_rate": args.slow_rate,
+        "slow_ttft": args.slow_ttft,
+        "requests": args.requests,
+        "python": platform.python_version(),
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        "bench_results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+def run_benchmarks(targets: list[str], levels: list[int], requests: int) -> list[dict]:
+    """Run every target at every concurrency level and print a summary table."""
+    print(f"{'target':<10} {'conc':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'threads':>7} {'errors':>6}")
+    results = []
+    for target in targets:
+        for concurrency in levels:
+            with _quiet():
+                sample = BENCHMARKS[target]()
+            result = measure(target, sample, concurrency, requests)
+            results.append(result)
+            print(f"{target:<10} {concurrency:>4} {result['p50_ms']:>9.1f} "
+                  f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                  f"{result['throughput_rps']:>8.2f} {result['peak_threads']:>7} "
+                  f"{result['errors']:>6}")
+    return results
+
+
+def measure(target: str, sample, concurrency: int, requests: int) -> dict:
+    """Call ``sample()`` ``requests`` times from ``concurrency`` threads.
+
+    A coroutine function is awaited ``concurrency`` at a time on one event
+    loop instead.
+    """
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            sample()
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        return time.perf_counter() - start, None
+
+    async def timed_async(slots):
+        async with slots:
+            start = time.perf_counter()
+            try:
+                await sample()
+            except Exception as e:
+                return None, f"{type(e).__name__}: {e}"
+            return time.perf_counter() - start, None
+
+    async def run_async():
+        slots = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(timed_async(slots) for _ in range(requests)))
+
+    with _quiet(), _ThreadPeak() as threads:
+        start = time.perf_counter()
+        if asyncio.iscoroutinefunction(sample):
+            outcomes = _loop.run_until_complete(run_async())
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(timed, range(requests)))
+        wall = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes if latency is not None)
+    errors = [error for _, error in outcomes if error]
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "peak_threads": threads.peak,
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# ── Benchmarks: each returns a zero-argument callable timing one sample ────
+
+def bench_clarify():
+    """Both clarification turns of a fresh session."""
+    def sample():
+        ctx = BuildContext.for_session(str(uuid.uuid4()))
+        _, _, _, history = clarify.run_web(GAME_IDEA, ctx=ctx)
+        clarify.run_web(GAME_IDEA, history, USER_REPLY, ctx=ctx)
+    return sample
+
+
+def bench_plan():
+    requirements, history = _clarified()
+    return lambda: plan.run(requirements, history, BuildContext())
+
+
+def bench_execute():
+    requirements, history = _clarified()
+    game_plan, history = plan.run(requirements, history, BuildContext())
+
+    def sample():
+        ctx = BuildContext(output_dir=os.path.join(OUTPUT_DIR, str(uuid.uuid4())))
+        execute.run(game_plan, history, ctx)
+    return sample
+
+
+def bench_api():
+    """The browser's flow: start, reply, build, follow events, load the game."""
+    from app import app
+    client = app.test_client()
+
+    def sample():
+        started = client.post("/api/start", json={"game_idea": GAME_IDEA}).get_json()
+        session_id = started["session_id"]
+        if not started["is_clear"]:
+            client.post("/api/message",
+                        json={"session_id": session_id, "message": USER_REPLY})
+        response = client.post("/api/build", json={"session_id": session_id})
+        if response.status_code != 202:
+            raise RuntimeError(f"/api/build returned {response.status_code}")
+        job_id = response.get_json()["job_id"]
+        events = client.get(f"/api/jobs/{job_id}/events")
+        events.get_data()  # the stream ends when the job does
+        status = client.get(f"/api/jobs/{job_id}").get_json()["status"]
+        if status != "done":
+            raise RuntimeError(f"build {status}")
+        page = client.get(f"/api/preview/{session_id}/index.html")
+        if page.status_code != 200:
+            raise RuntimeError(f"preview returned {page.status_code}")
+    return sample
+
+
+def bench_asgi():
+    """The same flow as ``api``, against the ASGI app on one event loop."""
+    import asgi
+
+    async def sample():
+        _, started = await _asgi_request(asgi.app, "POST", "/api/start",
+                                         {"game_idea": GAME_IDEA})
+        session_id = started["session_id"]
+        if not started["is_clear"]:
+            await _asgi_request(asgi.app, "POST", "/api/message",
+                                {"session_id": session_id, "message": USER_REPLY})
+        status, build = await _asgi_request(asgi.app, "POST", "/api/build",
+                                            {"session_id": session_id})
+        if status != 202:
+            raise RuntimeError(f"/api/build returned {status}")
+        job_id = build["job_id"]
+        await _asgi_request(asgi.app, "GET", f"/api/jobs/{job_id}/events")
+        _, job = await _asgi_request(asgi.app, "GET", f"/api/jobs/{job_id}")
+        if job["status"] != "done":
+            raise RuntimeError(f"build {job['status']}")
+        status, _ = await _asgi_request(asgi.app, "GET", f"/api/preview/{session_id}/index.html")
+        if status != 200:
+            raise RuntimeError(f"preview returned {status}")
+    return sample
+
+
+async def _asgi_request(app, method: str, path: str, body: dict | None = None):
+    """Call an ASGI app in-process; ``(status, parsed JSON or raw bytes)``.
+
+    Streamed responses are read to the end.
+    """
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json")]}
+    request = json.dumps(body).encode() if body is not None else b""
+    sent = asyncio.Event()
+    response = {"body": b""}
+
+    async def receive():
+        nonlocal request
+        if request is not None:
+            chunk, request = request, None
+            return {"type": "http.request", "body": chunk}
+        await sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        else:
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                sent.set()
+
+    await app(scope, receive, send)
+    if response["headers"].get(b"content-type") == b"application/json":
+        return response["status"], json.loads(response["body"])
+    return response["status"], response["body"]
+
+
+def _clarified() -> tuple[str, list[dict]]:
+    """Requirements and history from one clarification, the input to later phases."""
+    ctx = BuildContext()
+    _, is_clear, requirements, history = clarify.run_web(GAME_IDEA, ctx=ctx)
+    if not is_clear:
+        _, _, requirements, history = clarify.run_web(
+            GAME_IDEA, history, USER_REPLY, ctx=ctx)
+    return requirements, history
+
+
+class _ThreadPeak:
+    """The most threads alive at once while the block runs, sampled every 10ms."""
+
+    def __enter__(self):
+        self.peak = threading.active_count()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._done.wait(0.01):
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the phases' progress prints so the table stays readable."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+BENCHMARKS = {
+    "clarify": bench_clarify,
+    "plan": bench_plan,
+    "execute": bench_execute,
+    "api": bench_api,
+    "asgi": bench_asgi,
+}
+
+# One loop for every async sample: the ASGI app's queue and tasks outlive a run
+_loop = asyncio.new_event_loop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,164 @@
-"""Configuration: Gemini client setup, system prompts, and constants."""
+"""Configuration: environment settings, system prompts, and constants.
+
+The Gemini SDK is not imported here; ``llm`` loads and configures it on the
+first model request, so importing the app stays fast.
+"""
 
 import os
 
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # ── Load .env if present ───────────────────────────────────────────────────
 load_dotenv()
 
+# ── Model Backend ──────────────────────────────────────────────────────────
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "gemini")  # gemini | fake
+# Fake backend: recorded replies to replay, and the simulated model speed
+FAKE_LLM_RECORDINGS = os.environ.get("FAKE_LLM_RECORDINGS", "")
+FAKE_LLM_TTFT = float(os.environ.get("FAKE_LLM_TTFT", "0.5"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.environ.get("FAKE_LLM_TOKENS_PER_SEC", "150"))
+# Fraction of fake requests failing with a 429 or 503, to exercise retries
+FAKE_LLM_ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+# Fraction of fake requests that wait FAKE_LLM_SLOW_TTFT seconds for their
+# first token instead, to give latency a tail (e.g. for hedging)
+FAKE_LLM_SLOW_RATE = float(os.environ.get("FAKE_LLM_SLOW_RATE", "0"))
+FAKE_LLM_SLOW_TTFT = float(os.environ.get("FAKE_LLM_SLOW_TTFT", "10"))
+# Append every model reply to this JSONL file (replayable by the fake backend)
+LLM_RECORD_PATH = os.environ.get("LLM_RECORD_PATH", "")
+
 # ── API Setup ──────────────────────────────────────────────────────────────
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise EnvironmentError(
-        "GOOGLE_API_KEY environment variable is required. "
-        "Get one at https://aistudio.google.com/app/apikey"
-    )
-
-genai.configure(api_key=GOOGLE_API_KEY)
+if MODEL_BACKEND == "gemini":
+    if not GOOGLE_API_KEY:
+        raise EnvironmentError(
+            "GOOGLE_API_KEY environment variable is required. "
+            "Get one at https://aistudio.google.com/app/apikey "
+            "(or set MODEL_BACKEND=fake to run offline)"
+        )
 
 MODEL_NAME = "gemini-2.0-flash"
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "./output")
 
+# ── Rate Limits & Retries ──────────────────────────────────────────────────
+# Caps on model requests and tokens per minute (0 = unlimited)
+LLM_RPM = float(os.environ.get("LLM_RPM", "0"))
+LLM_TPM = float(os.environ.get("LLM_TPM", "0"))
+# SQLite file holding the limits so several processes share them ("" = per process)
+LLM_RATE_LIMIT_DB = os.environ.get("LLM_RATE_LIMIT_DB", "")
+# In-flight requests: starts at the max, halves on quota errors (0 = no cap)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "1"))
+# Retries of 429/5xx errors with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "30"))
+LLM_RETRY_DEADLINE = float(os.environ.get("LLM_RETRY_DEADLINE", "120"))
+
+# ── LLM Response Cache ─────────────────────────────────────────────────────
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./.cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_MB = int(os.environ.get("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# ── Live Chat Pool (web clarification) ─────────────────────────────────────
+CHAT_POOL_MAX_SESSIONS = int(os.environ.get("CHAT_POOL_MAX_SESSIONS", "256"))
+CHAT_POOL_MAX_MB = int(os.environ.get("CHAT_POOL_MAX_MB", "64"))
+CHAT_POOL_IDLE_TTL = int(os.environ.get("CHAT_POOL_IDLE_TTL", "1800"))
+
+# ── Web Sessions ───────────────────────────────────────────────────────────
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")  # memory | sqlite
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "./.cache/sessions.sqlite3")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", "1000"))
+SESSION_MAX_MB = int(os.environ.get("SESSION_MAX_MB", "256"))
+SESSION_SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", "60"))
+
+# ── Context Compaction ─────────────────────────────────────────────────────
+COMPACT_ENABLED = os.environ.get("COMPACT_ENABLED", "1") == "1"
+COMPACT_TOKEN_BUDGET = int(os.environ.get("COMPACT_TOKEN_BUDGET", "2000"))
+
+# ── Plan Schema ────────────────────────────────────────────────────────────
+# Ask for the plan in the model's structured-output (JSON schema) mode
+PLAN_STRUCTURED_OUTPUT = os.environ.get("PLAN_STRUCTURED_OUTPUT", "1") == "1"
+# Follow-up requests for plan fields still missing or invalid after local repair
+PLAN_FIX_ROUNDS = int(os.environ.get("PLAN_FIX_ROUNDS", "2"))
+
+# ── Code Generation ────────────────────────────────────────────────────────
+EXECUTE_MODE = os.environ.get("EXECUTE_MODE", "single")  # single | fanout
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "6"))
+MAX_CONTINUATIONS = int(os.environ.get("MAX_CONTINUATIONS", "3"))
+# Prewritten boilerplate (skeletons/); the model writes only the game hooks
+SKELETONS_ENABLED = os.environ.get("SKELETONS_ENABLED", "1") == "1"
+SKELETON_DIR = os.environ.get(
+    "SKELETON_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "skeletons"))
+SKELETON_MIN_SCORE = int(os.environ.get("SKELETON_MIN_SCORE", "1"))
+# Rounds of static checks + single-file repairs after generation (0 = off)
+MAX_REPAIR_ROUNDS = int(os.environ.get("MAX_REPAIR_ROUNDS", "1"))
+
+# ── Hedged / Best-of-N Generation ──────────────────────────────────────────
+# Single-response Phase 3 requests: off | hedge (duplicate a request that has
+# no first token by the learned TTFT percentile) | best_of (N at once, the
+# first that passes the static checks wins)
+EXECUTE_HEDGE = os.environ.get("EXECUTE_HEDGE", "off")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+# Recent execute TTFTs learned from, and how many are needed before the
+# percentile replaces HEDGE_DEFAULT_DELAY (seconds)
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "10"))
+BEST_OF_N = int(os.environ.get("BEST_OF_N", "3"))
+# Extra tokens each mode may spend, as a fraction of the tokens of the
+# requests it duplicates, on top of a starting allowance
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.1"))
+BEST_OF_BUDGET_RATIO = float(os.environ.get("BEST_OF_BUDGET_RATIO", "1.0"))
+EXTRA_BUDGET_BURST_TOKENS = int(os.environ.get("EXTRA_BUDGET_BURST_TOKENS", "50000"))
+
+# ── Bundling ───────────────────────────────────────────────────────────────
+# Inline style.css and game.js into a single game.html after each build, so
+# previews load with one request; the readable files are kept alongside
+BUNDLE_ENABLED = os.environ.get("BUNDLE_ENABLED", "1") == "1"
+# Minify the inlined CSS and JS (comments and whitespace only; names are kept)
+BUNDLE_MINIFY = os.environ.get("BUNDLE_MINIFY", "1") == "1"
+
+# ── Artifact Store ─────────────────────────────────────────────────────────
+# Content-addressed game files and packaged variants; must be on the same
+# filesystem as OUTPUT_DIR for session outputs to be hardlinks into it
+ARTIFACT_STORE_DIR = os.environ.get("ARTIFACT_STORE_DIR", os.path.join(OUTPUT_DIR, ".store"))
+# Disk quota for the store (0 = none); oldest session outputs go first
+ARTIFACT_STORE_MAX_MB = int(os.environ.get("ARTIFACT_STORE_MAX_MB", "1024"))
+# Seconds between garbage collections (0 = off), and the age below which
+# objects and outputs are never collected
+ARTIFACT_GC_INTERVAL = int(os.environ.get("ARTIFACT_GC_INTERVAL", "600"))
+ARTIFACT_GC_GRACE = int(os.environ.get("ARTIFACT_GC_GRACE", "300"))
+
+# ── Idea Index ─────────────────────────────────────────────────────────────
+# Near-duplicate lookup of earlier builds before planning: off | offer (the
+# web UI offers the match) | auto (builds reuse a match without planning)
+IDEA_REUSE = os.environ.get("IDEA_REUSE", "offer")
+IDEA_INDEX_ENABLED = IDEA_REUSE != "off"
+IDEA_INDEX_PATH = os.environ.get("IDEA_INDEX_PATH", os.path.join(ARTIFACT_STORE_DIR, "ideas.sqlite3"))
+# Indexed builds kept (least recently used evicted first); their files stay
+# in the artifact store while indexed
+IDEA_INDEX_MAX_ENTRIES = int(os.environ.get("IDEA_INDEX_MAX_ENTRIES", "1000"))
+# TF-IDF cosine similarity a request needs to match an earlier build
+IDEA_MATCH_THRESHOLD = float(os.environ.get("IDEA_MATCH_THRESHOLD", "0.8"))
+
+# ── Build Queue ────────────────────────────────────────────────────────────
+BUILD_WORKERS = int(os.environ.get("BUILD_WORKERS", "4"))
+BUILD_QUEUE_DEPTH = int(os.environ.get("BUILD_QUEUE_DEPTH", "16"))
+BUILD_JOB_HISTORY = int(os.environ.get("BUILD_JOB_HISTORY", "200"))
+# Concurrent builds in the ASGI app, where a build holds no thread
+ASYNC_BUILD_WORKERS = int(os.environ.get("ASYNC_BUILD_WORKERS", "256"))
+
+# ── Plan Prefetch ──────────────────────────────────────────────────────────
+# Start planning as soon as requirements are clear, before /api/build
+PLAN_PREFETCH_ENABLED = os.environ.get("PLAN_PREFETCH_ENABLED", "1") == "1"
+PLAN_PREFETCH_WORKERS = int(os.environ.get("PLAN_PREFETCH_WORKERS", "2"))
+
+# ── Tracing ────────────────────────────────────────────────────────────────
+TRACE_MAX_SESSIONS = int(os.environ.get("TRACE_MAX_SESSIONS", "500"))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "200"))
+
 # ── System Prompts ─────────────────────────────────────────────────────────
 
 CLARIFY_SYSTEM_PROMPT = """\
@@ -60,6 +198,14 @@ Pick vanilla JS unless the game clearly needs physics or tilemaps (then pick Pha
 Be specific and concrete — this plan will be handed directly to a code generator.
 """
 
+PLAN_FIX_PROMPT = """\
+Some fields of the game plan are missing or invalid:
+{problems}
+
+Output ONLY a JSON object (inside ```json fences) with corrected values for
+exactly these fields: {fields}. They must fit the rest of the plan.
+"""
+
 EXECUTE_SYSTEM_PROMPT = """\
 You are an expert HTML5 game developer. Based on the game plan and requirements,
 generate a COMPLETE, playable game as three files.
@@ -90,8 +236,110 @@ Rules:
 - The game.js file must be substantial and complete — do not leave placeholders.
 """
 
+FANOUT_SYSTEM_PROMPT = """\
+You are an expert HTML5 game developer on a team that builds one game in
+parallel: each request asks you for ONE part of the game, and the parts are
+assembled afterwards. Output ONLY the fenced code block(s) requested, with no
+commentary. Match the names and interfaces you are given exactly, do not
+redefine code owned by other parts, and do not leave placeholders.
+"""
+
+SKELETON_PROMPT = """\
+Game plan:
+
+```json
+{plan}
+```
+
+This game is built on a prewritten skeleton that already provides:
+{description}
+
+Here is the skeleton's game.js; your code replaces the line
+`{marker}`:
+
+```js
+{skeleton}
+```
+
+Write ONLY the game-specific code, as one ```js block, with:
+{hooks}
+
+Use the skeleton's globals and helpers as they are; do not redeclare them,
+and do not write canvas/scene setup, input listeners, the state machine, the
+HUD, the menu and game-over screens or the main loop. Implement everything
+in the plan, with no placeholders.
+"""
+
 RETRY_PROMPT = """\
 The game.js file you generated was too short or missing. Please regenerate a
 COMPLETE game.js implementation with all game logic, rendering, input, and state
 management. Output it inside ```js fences.
 """
+
+CONTINUE_PROMPT = """\
+Your previous response was cut off by the output limit. Continue EXACTLY
+where it stopped: do not repeat anything already written, do not restart or
+reopen the current code block, and do not add commentary. Finish the current
+file, close its fence, then output any remaining files. Your response ended with:
+
+{tail}
+"""
+
+REPAIR_PROMPT = """\
+Repair {file}. A static check of the generated game found these problems in it:
+
+{problems}
+
+Here is the current {file}:
+
+```{lang}
+{content}
+```
+
+Fix these problems without changing anything else, and output the COMPLETE
+corrected {file} as a single ```{lang} block. Do not output any other file.
+"""
+
+MISSING_FILE_PROMPT = """\
+Repair {file}. The game needs it, but it was never written:
+{problems}
+
+Here are the game's other files it has to work with:
+
+{others}
+
+Write the complete {file} as a single ```{lang} block. Do not output any
+other file.
+"""
+
+EDIT_SYSTEM_PROMPT = """\
+You are an expert HTML5 game developer maintaining a game you already built.
+The user asks for a change; make the SMALLEST edit that implements it, and
+answer with ONLY a unified diff in a single ```diff block:
+- a `--- a/<file>` / `+++ b/<file>` header for each changed file
+  (index.html, style.css or game.js);
+- `@@ -<line>,<count> +<line>,<count> @@` hunks with 3 lines of unchanged
+  context, copied exactly from the current file;
+- hunk lines starting with ' ' (context), '-' (removed) or '+' (added).
+Do not repeat unchanged code outside the hunks, and add no commentary.
+"""
+
+EDIT_PROMPT = """\
+Game plan:
+
+```json
+{plan}
+```
+
+Current files:
+
+{files}
+
+Change request: {instruction}
+"""
+
+EDIT_FALLBACK_PROMPT = """\
+Your diff could not be applied: {reason}. Instead, output the COMPLETE
+updated version of each file that has to change, each in its own ```html,
+```css or ```js block. Do not output files that stay the same.
+"""
@@ -0,0 +1,464 @@
+"""Offline model backend — replays recorded replies with simulated latency.
+
+``FakeBackend`` stands in for Gemini when ``MODEL_BACKEND=fake``. It answers
+from a JSONL recording (written by ``Recorder`` when ``LLM_RECORD_PATH`` is
+set during a real run) and falls back to small canned replies for each
+phase, so the whole pipeline runs without network or an API key. Replies
+are paced by a time-to-first-token and a tokens/sec rate, which makes it
+possible to measure our own overhead and compare benchmark runs.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from config import (
+    CLARIFY_SYSTEM_PROMPT, PLAN_SYSTEM_PROMPT, EXECUTE_SYSTEM_PROMPT,
+    FANOUT_SYSTEM_PROMPT, EDIT_SYSTEM_PROMPT, RETRY_PROMPT, FAKE_LLM_RECORDINGS, FAKE_LLM_TTFT,
+    FAKE_LLM_TOKENS_PER_SEC, FAKE_LLM_ERROR_RATE, FAKE_LLM_SLOW_RATE, FAKE_LLM_SLOW_TTFT,
+)
+from llm import Reply
+from llm_cache import ResponseCache
+from phases.compact import count_tokens
+
+# Streamed replies arrive in chunks of about this many characters
+CHUNK_CHARS = 200
+
+
+class FakeModelError(Exception):
+    """A simulated API error; ``code`` is the HTTP status, as on google.api_core errors."""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} simulated model error")
+        self.code = code
+
+
+class FakeBackend:
+    """Backend answering from recordings, then canned replies, at a fixed speed.
+
+    Args:
+        recordings: Path of a JSONL recording, or None for canned replies only.
+        ttft: Seconds before the first token of every reply.
+        tokens_per_sec: Decode speed after the first token (0 = instant).
+        error_rate: Fraction of requests failing with a 429 (or 503) after ``ttft``.
+        slow_rate: Fraction of requests waiting ``slow_ttft`` seconds instead of ``ttft``.
+    """
+
+    name = "fake"
+
+    def __init__(self, recordings: str | None = None, ttft: float = 0.0,
+                 tokens_per_sec: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ttft: float = 0.0):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ttft = slow_ttft
+        self.replies: dict[str, dict] = {}
+        if recordings:
+            self.replies = load_recordings(recordings)
+
+    @classmethod
+    def from_config(cls) -> "FakeBackend":
+        return cls(FAKE_LLM_RECORDINGS or None, FAKE_LLM_TTFT, FAKE_LLM_TOKENS_PER_SEC,
+                   FAKE_LLM_ERROR_RATE, FAKE_LLM_SLOW_RATE, FAKE_LLM_SLOW_TTFT)
+
+    def start_chat(self, model_name: str, system_prompt: str,
+                   generation_config: dict, history: list[dict]) -> "FakeSession":
+        return FakeSession(self, system_prompt, history)
+
+    def respond(self, system_prompt: str, message: str,
+                history: list[dict]) -> tuple[str, str]:
+        """(text, finish_reason) for a request: recorded if known, else canned."""
+        recorded = self.replies.get(recording_key(system_prompt, message))
+        if recorded:
+            return recorded["text"], recorded.get("finish_reason", "STOP")
+        return _canned(system_prompt, message, history), "STOP"
+
+    def maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeModelError(random.choice((429, 429, 503)))
+
+    def first_token_time(self) -> float:
+        if self.slow_rate and random.random() < self.slow_rate:
+            return self.slow_ttft
+        return self.ttft
+
+    def decode_time(self, text: str) -> float:
+        if self.tokens_per_sec <= 0:
+            return 0.0
+        return count_tokens(text) / self.tokens_per_sec
+
+
+class FakeSession:
+    """Chat session of the fake backend; same interface as ``llm.GeminiSession``."""
+
+    def __init__(self, backend: FakeBackend, system_prompt: str, history: list[dict]):
+        self.backend = backend
+        self.system_prompt = system_prompt
+        self.history = [dict(msg) for msg in history]
+
+    def send(self, message: str) -> Reply:
+        text, finish_reason = self.backend.respond(
+            self.system_prompt, message, self.history)
+        time.sleep(self.backend.first_token_time())
+        self.backend.maybe_fail()
+        time.sleep(self.backend.decode_time(text))
+        return self._finish(message, text, finish_reason)
+
+    def stream(self, message: str):
+        text, finish_reason = self.backend.respond(
+            self.system_prompt, message, self.history)
+        time.sleep(self.backend.first_token_time())
+        self.backend.maybe_fail()
+        for start in range(0, len(text), CHUNK_CHARS):
+            chunk = text[start:start + CHUNK_CHARS]
+            time.sleep(self.backend.decode_time(chunk))
+            yield chunk
+        return self._finish(message, text, finish_reason)
+
+    async def send_async(self, message: str) -> Reply:
+        text, finish_reason = self.backend.respond(
+            self.system_prompt, message, self.history)
+        await asyncio.sleep(self.backend.first_token_time())
+        self.backend.maybe_fail()
+        await asyncio.sleep(self.backend.decode_time(text))
+        return self._finish(message, text, finish_reason)
+
+    async def stream_async(self, message: str):
+        text, finish_reason = self.backend.respond(
+            self.system_prompt, message, self.history)
+        await asyncio.sleep(self.backend.first_token_time())
+        self.backend.maybe_fail()
+        for start in range(0, len(text), CHUNK_CHARS):
+            chunk = text[start:start + CHUNK_CHARS]
+            await asyncio.sleep(self.backend.decode_time(chunk))
+            yield chunk
+        yield self._finish(message, text, finish_reason)
+
+    def append(self, message: str, text: str):
+        self.history.append({"role": "user", "parts": [message]})
+        self.history.append({"role": "model", "parts": [text]})
+
+    def _finish(self, message: str, text: str, finish_reason: str) -> Reply:
+        input_tokens = (count_tokens(self.system_prompt) + count_tokens(message)
+                        + sum(count_tokens(p) for msg in self.history for p in msg["parts"]))
+        self.append(message, text)
+        return Reply(text, finish_reason, input_tokens, count_tokens(text))
+
+
+class Recorder:
+    """Appends every model reply to a JSONL file the fake backend can replay."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self, system_prompt: str, message: str, reply: Reply):
+        line = json.dumps({
+            "key": recording_key(system_prompt, message),
+            "message": message[:200],
+            "text": reply.text,
+            "finish_reason": reply.finish_reason,
+        })
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def recording_key(system_prompt: str, message: str) -> str:
+    """Replay key: a request is matched by its system prompt and message."""
+    return ResponseCache.key(system=system_prompt, message=message)
+
+
+def load_recordings(path: str) -> dict[str, dict]:
+    """Recorded replies by key; later lines win."""
+    replies = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn final line
+            replies[record["key"]] = record
+    return replies
+
+
+# ── Canned replies ─────────────────────────────────────────────────────────
+
+CANNED_QUESTIONS = """\
+A few quick questions:
+1. Should the player have limited lives, or end on the first hit?
+2. Keyboard or mouse controls?
+3. Any preferred visual style?
+"""
+
+CANNED_REQUIREMENTS = """\
+REQUIREMENTS_CLEAR
+- Single-screen arcade game on a canvas
+- Arrow keys move the player; collect stars, avoid falling rocks
+- Three lives; game over when all are lost
+- Score rises per star; rocks fall faster over time
+- Neon shapes on a dark background, start and game-over screens
+"""
+
+CANNED_PLAN = {
+    "title": "Star Catcher",
+    "framework": "vanilla",
+    "description": "Catch falling stars and dodge rocks.",
+    "mechanics": ["move left and right", "collect stars", "avoid rocks"],
+    "controls": {"ArrowLeft": "move left", "ArrowRight": "move right",
+                 "Space": "start / restart"},
+    "entities": [
+        {"name": "player", "role": "the catcher", "behavior": "moves along the bottom"},
+        {"name": "star", "role": "pickup", "behavior": "falls, +10 score when caught"},
+        {"name": "rock", "role": "hazard", "behavior": "falls, costs a life on hit"},
+    ],
+    "game_states": ["menu", "playing", "game_over"],
+    "game_loop": "Spawn, move and collide falling objects each frame.",
+    "visual_style": "Neon shapes on a dark background",
+    "scoring": "+10 per star",
+    "difficulty": "Fall speed grows with the score",
+}
+
+CANNED_HTML = """\
+<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <title>Star Catcher</title>
+  <link rel="stylesheet" href="style.css">
+</head>
+<body>
+  <canvas id="game" width="480" height="640"></canvas>
+  <script src="game.js"></script>
+</body>
+</html>
+"""
+
+CANNED_CSS = """\
+body {
+  margin: 0;
+  min-height: 100vh;
+  display: flex;
+  align-items: center;
+  justify-content: center;
+  background: #0b0b1a;
+}
+
+canvas {
+  border: 2px solid #3ff;
+  background: #111;
+}
+"""
+
+CANNED_CLASSES = {
+    "Player": """\
+class Player {
+  constructor(game) { this.game = game; this.x = W / 2; this.w = 60; }
+  update(dt) {
+    if (keys.ArrowLeft) this.x -= 320 * dt;
+    if (keys.ArrowRight) this.x += 320 * dt;
+    this.x = Math.max(this.w / 2, Math.min(W - this.w / 2, this.x));
+  }
+  draw(ctx) { ctx.fillStyle = '#3ff'; ctx.fillRect(this.x - this.w / 2, H - 30, this.w, 12); }
+}
+""",
+    "Star": """\
+class Star {
+  constructor(game) { this.game = game; this.x = Math.random() * W; this.y = -10; this.hazard = false; }
+  update(dt) { this.y += this.game.speed * dt; }
+  draw(ctx) { ctx.fillStyle = '#ff3'; ctx.beginPath(); ctx.arc(this.x, this.y, 8, 0, Math.PI * 2); ctx.fill(); }
+}
+""",
+    "Rock": """\
+class Rock {
+  constructor(game) { this.game = game; this.x = Math.random() * W; this.y = -10; this.hazard = true; }
+  update(dt) { this.y += this.game.speed * 1.2 * dt; }
+  draw(ctx) { ctx.fillStyle = '#f55'; ctx.fillRect(this.x - 10, this.y - 10, 20, 20); }
+}
+""",
+}
+
+# The fan-out parts of the game: the shared interface, then each subsystem
+CANNED_INTERFACE_JS = """\
+const canvas = document.getElementById('game');
+const ctx = canvas.getContext('2d');
+const W = canvas.width, H = canvas.height;
+// Keys held down, by KeyboardEvent.key
+const keys = {};
+// state: 'menu' | 'playing' | 'game_over'; items: falling Stars and Rocks
+// (x, y, hazard, dead); player: the Player (x, w); spawn: seconds to the next item
+const game = { state: 'menu', score: 0, lives: 3, speed: 160, items: [], player: null, spawn: 0 };
+"""
+
+CANNED_SUBSYSTEMS = {
+    "input": """\
+addEventListener('keydown', e => {
+  keys[e.key] = true;
+  if (e.key === ' ' && game.state !== 'playing') startGame();
+});
+addEventListener('keyup', e => { keys[e.key] = false; });
+
+function startGame() {
+  Object.assign(game, { state: 'playing', score: 0, lives: 3, speed: 160, items: [], spawn: 0 });
+  game.player = new Player(game);
+}
+""",
+    "hud": """\
+function drawHud(ctx) {
+  ctx.fillStyle = '#fff';
+  ctx.font = '20px monospace';
+  ctx.textAlign = 'center';
+  if (game.state === 'menu') {
+    ctx.fillText('STAR CATCHER — press Space', W / 2, H / 2);
+    return;
+  }
+  ctx.fillText(`Score ${game.score}   Lives ${game.lives}`, W / 2, 30);
+  if (game.state === 'game_over') ctx.fillText('GAME OVER — Space to retry', W / 2, H / 2);
+}
+""",
+    "loop": """\
+function updateGame(dt) {
+  if (game.state !== 'playing') return;
+  game.player.update(dt);
+  game.spawn -= dt;
+  if (game.spawn <= 0) {
+    game.items.push(Math.random() < 0.3 ? new Rock(game) : new Star(game));
+    game.spawn = 0.6;
+  }
+  for (const item of game.items) {
+    item.update(dt);
+    if (item.y > H - 30 && Math.abs(item.x - game.player.x) < game.player.w / 2) {
+      item.dead = true;
+      if (item.hazard) game.lives -= 1; else game.score += 10;
+    } else if (item.y > H) {
+      item.dead = true;
+    }
+  }
+  game.items = game.items.filter(item => !item.dead);
+  game.speed = 160 + game.score;
+  if (game.lives <= 0) game.state = 'game_over';
+}
+
+function drawGame(ctx) {
+  ctx.clearRect(0, 0, W, H);
+  if (game.state !== 'menu') {
+    game.items.forEach(item => item.draw(ctx));
+    game.player.draw(ctx);
+  }
+  drawHud(ctx);
+}
+
+let last = performance.now();
+function loop(now) {
+  updateGame(Math.min(0.05, (now - last) / 1000));
+  last = now;
+  drawGame(ctx);
+  requestAnimationFrame(loop);
+}
+requestAnimationFrame(loop);
+""",
+}
+
+# What follows the entity classes in a single-response game.js
+CANNED_CORE_JS = "\n".join([CANNED_INTERFACE_JS, *CANNED_SUBSYSTEMS.values()])
+
+# The same game written as hooks for the vanilla-arcade skeleton
+CANNED_SKELETON_HOOKS = "\n".join(CANNED_CLASSES.values()) + """
+function setupGame(game) {
+  Object.assign(game, { speed: 160, items: [], spawn: 0 });
+  game.player = new Player(game);
+}
+
+function updateGame(game, dt) {
+  game.player.update(dt);
+  game.spawn -= dt;
+  if (game.spawn <= 0) {
+    game.items.push(Math.random() < 0.3 ? new Rock(game) : new Star(game));
+    game.spawn = 0.6;
+  }
+  for (const item of game.items) {
+    item.update(dt);
+    if (item.y > H - 30 && Math.abs(item.x - game.player.x) < game.player.w / 2) {
+      item.dead = true;
+      if (item.hazard) game.lives -= 1; else game.score += 10;
+    } else if (item.y > H) {
+      item.dead = true;
+    }
+  }
+  game.items = game.items.filter(item => !item.dead);
+  game.speed = 160 + game.score;
+}
+
+function drawGame(ctx, game) {
+  game.items.forEach(item => item.draw(ctx));
+  game.player.draw(ctx);
+}
+"""
+
+# Spawns items faster; the line numbers are off, as they often are
+CANNED_EDIT_DIFF = """\
+--- a/game.js
++++ b/game.js
+@@ -24,4 +24,4 @@
+   if (game.spawn <= 0) {
+     game.items.push(Math.random() < 0.3 ? new Rock(game) : new Star(game));
+-    game.spawn = 0.6;
++    game.spawn = 0.4;
+   }
+"""
+
+
+def _canned(system_prompt: str, message: str, history: list[dict]) -> str:
+    """A plausible reply for each phase's prompts."""
+    if system_prompt == CLARIFY_SYSTEM_PROMPT:
+        asked = any(msg["role"] == "model" for msg in history)
+        return CANNED_REQUIREMENTS if asked else CANNED_QUESTIONS
+    if system_prompt == PLAN_SYSTEM_PROMPT:
+        fields = re.search(r"exactly these fields: ([\w, ]+)\.", message)
+        plan = ({name: CANNED_PLAN[name] for name in fields.group(1).split(", ")}
+                if fields else CANNED_PLAN)
+        return f"```json\n{json.dumps(plan, indent=2)}\n```"
+    if system_prompt == FANOUT_SYSTEM_PROMPT:
+        repair = re.search(r"^Repair (\S+)\.", message, re.M)
+        if repair:
+            return _canned_file(repair.group(1))
+        if "prewritten skeleton" in message:
+            return f"```js\n{CANNED_SKELETON_HOOKS}```"
+        if "Write index.html and style.css" in message:
+            return f"```html\n{CANNED_HTML}```\n\n```css\n{CANNED_CSS}```"
+        if "Write the SHARED INTERFACE" in message:
+            return f"```js\n{CANNED_INTERFACE_JS}```"
+        part = re.search(r"Write ONLY the `(\w+)` part", message)
+        if part and part.group(1) in CANNED_SUBSYSTEMS:
+            return f"```js\n{CANNED_SUBSYSTEMS[part.group(1)]}```"
+        match = re.search(r"Write ONLY `class (\w+)`", message)
+        name = match.group(1) if match else "Entity"
+        body = CANNED_CLASSES.get(name) or (
+            f"class {name} {{\n  constructor(game) {{ this.game = game; }}\n"
+            "  update(dt) {}\n  draw(ctx) {}\n}\n")
+        return f"```js\n{body}```"
+    if system_prompt == EXECUTE_SYSTEM_PROMPT:
+        if message == RETRY_PROMPT:
+            return _canned_file("game.js")
+        return "\n\n".join(_canned_file(name) for name in ("index.html", "style.css", "game.js"))
+    if system_prompt == EDIT_SYSTEM_PROMPT:
+        if message.startswith("Your diff could not be applied"):
+            return _canned_file("game.js").replace("game.spawn = 0.6;", "game.spawn = 0.4;")
+        return f"```diff\n{CANNED_EDIT_DIFF}```"
+    return "OK"
+
+
+def _canned_file(name: str) -> str:
+    """One canned game file as a fenced block."""
+    if name == "index.html":
+        return f"```html\n{CANNED_HTML}```"
+    if name == "style.css":
+        return f"```css\n{CANNED_CSS}```"
+    game_js = "\n".join(CANNED_CLASSES.values()) + "\n" + CANNED_CORE_JS
+    return f"```js\n{game_js}```"
@@ -0,0 +1,280 @@
+"""Near-duplicate game idea index — serve a game already built for the same request.
+
+Every finished build is indexed by its game idea and clarified
+requirements, and keeps its plan and game files (pinned in the artifact
+store) for reuse. Before planning, a new request's idea and requirements
+are scored against the index with TF-IDF cosine similarity over word
+unigrams and bigrams — the same terms the entries were indexed by, so an
+identical request scores 1.0; a match at or above
+``IDEA_MATCH_THRESHOLD`` can be offered to the user or reused outright
+(``IDEA_REUSE``), hardlinking the earlier build's files into the new
+session in milliseconds instead of running a full generation.
+
+Entries live in SQLite (shared by worker processes, reloaded when another
+process changes it) and are mirrored in memory with an inverted index, so
+a lookup only scores entries sharing a term with the request. The least
+recently used entries are evicted past ``IDEA_INDEX_MAX_ENTRIES``.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import metrics
+from artifacts import store
+from config import (
+    IDEA_INDEX_ENABLED, IDEA_INDEX_PATH, IDEA_INDEX_MAX_ENTRIES, IDEA_MATCH_THRESHOLD,
+)
+
+# Words that say nothing about which game is meant
+STOPWORDS = frozenset("""
+a an and any are as at be but by can could do for from game games have i if in into
+is it its just like make me my of on or please simple so some that the then this to
+too up want we with would you your build create clone version style basic classic
+should will where when which who player players use using
+""".split())
+# Term weight of the game idea relative to the requirements text
+IDEA_WEIGHT = 2
+
+
+@dataclass
+class Entry:
+    """One indexed build."""
+
+    id: str
+    idea: str
+    requirements: str
+    plan: dict
+    # Game file name -> artifact store digest
+    files: dict[str, str]
+    used_at: float
+    # Idea and requirements terms only — what a request is compared on
+    terms: dict[str, float]
+
+    @property
+    def title(self) -> str:
+        return self.plan.get("title", "Untitled")
+
+
+class IdeaIndex:
+    """Indexed builds, with a TF-IDF lookup of the closest one to a request."""
+
+    def __init__(self, path: str, max_entries: int, threshold: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: dict[str, Entry] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._conn: sqlite3.Connection | None = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def add(self, idea: str, requirements: str, plan: dict, manifest: dict) -> str:
+        """Index a finished build; its files stay in the store while it is indexed.
+
+        Returns:
+            The entry id. The same idea and requirements replace the earlier entry.
+        """
+        files = {name: entry["objects"]["identity"]
+                 for name, entry in manifest["files"].items()}
+        entry_id = hashlib.sha256(
+            f"{_normalize(idea)}\0{_normalize(requirements)}".encode()).hexdigest()[:16]
+        now = time.time()
+        with self._lock:
+            db = self._sync()
+            db.execute(
+                "INSERT OR REPLACE INTO ideas (id, idea, requirements, plan, files, "
+                "created_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, idea, requirements, json.dumps(plan), json.dumps(files), now, now))
+            self._put(Entry(entry_id, idea, requirements, plan, files, now,
+                            features(idea, requirements)))
+            self._evict(db)
+            db.commit()
+        metrics.IDEA_INDEX_ENTRIES.set(len(self._entries))
+        return entry_id
+
+    def lookup(self, idea: str, requirements: str) -> dict | None:
+        """The closest indexed build at or above the threshold.
+
+        Returns:
+            ``{"id", "title", "idea", "score"}``, or None.
+        """
+        query = features(idea, requirements)
+        with self._lock:
+            self._sync()
+            best, score = self._best(query)
+        metrics.IDEA_LOOKUPS.inc(outcome="match" if best else "miss")
+        if not best:
+            return None
+        return {"id": best.id, "title": best.title, "idea": best.idea, "score": round(score, 3)}
+
+    def reuse(self, entry_id: str, output_path: str) -> Entry | None:
+        """Link an indexed build's files into ``output_path``.
+
+        Returns:
+            The entry, or None if it is unknown or its files are gone from
+            the store (it is then dropped from the index).
+        """
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        os.makedirs(output_path, exist_ok=True)
+        try:
+            for name, digest in entry.files.items():
+                store.link(digest, os.path.join(output_path, name))
+        except OSError as e:
+            print(f"[ideas] '{entry.title}' can no longer be reused ({e}) — dropping it")
+            self.remove(entry_id)
+            metrics.IDEA_REUSES.inc(outcome="gone")
+            return None
+        entry.used_at = time.time()
+        with self._lock:
+            db = self._sync()
+            db.execute("UPDATE ideas SET used_at = ? WHERE id = ?", (entry.used_at, entry_id))
+            db.commit()
+        metrics.IDEA_REUSES.inc(outcome="reused")
+        return entry
+
+    def remove(self, entry_id: str):
+        with self._lock:
+            db = self._sync()
+            db.execute("DELETE FROM ideas WHERE id = ?", (entry_id,))
+            db.commit()
+            self._drop(entry_id)
+        metrics.IDEA_INDEX_ENTRIES.set(len(self._entries))
+
+    def objects(self) -> set[str]:
+        """Store digests of every indexed build's files, for ``artifacts.collect``."""
+        with self._lock:
+            self._sync()
+            return {digest for entry in self._entries.values()
+                    for digest in entry.files.values()}
+
+    def _best(self, query: dict[str, float]) -> tuple[Entry | None, float]:
+        """Highest cosine similarity among entries sharing a term with ``query``."""
+        total = len(self._entries)
+        idf = {term: _idf(total, len(self._postings.get(term, ()))) for term in query}
+        query_norm = math.sqrt(sum((w * idf[t]) ** 2 for t, w in query.items()))
+        candidates = set().union(*(self._postings.get(term, ()) for term in query))
+        best, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            dot = sum(w * idf[t] * entry.terms[t] * idf[t]
+                      for t, w in query.items() if t in entry.terms)
+            norm = math.sqrt(sum((w * _idf(total, len(self._postings[t]))) ** 2
+                                 for t, w in entry.terms.items()))
+            score = dot / (query_norm * norm) if query_norm and norm else 0.0
+            if score > best_score:
+                best, best_score = entry, score
+        if best_score < self.threshold:
+            return None, best_score
+        return best, best_score
+
+    def _put(self, entry: Entry):
+        self._drop(entry.id)
+        self._entries[entry.id] = entry
+        for term in entry.terms:
+            self._postings.setdefault(term, set()).add(entry.id)
+
+    def _drop(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for term in entry.terms:
+            ids = self._postings.get(term)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._postings[term]
+
+    def _evict(self, db: sqlite3.Connection):
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        doomed = sorted(self._entries.values(), key=lambda e: e.used_at)[:excess]
+        db.executemany("DELETE FROM ideas WHERE id = ?", [(e.id,) for e in doomed])
+        for entry in doomed:
+            self._drop(entry.id)
+
+    def _sync(self) -> sqlite3.Connection:
+        """The database, with the in-memory mirror reloaded if another
+        connection (another process) has committed since; SQLite's
+        ``data_version`` ignores this connection's own commits."""
+        db = self._db()
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._entries, self._postings = {}, {}
+            for row in db.execute("SELECT id, idea, requirements, plan, files, used_at "
+                                  "FROM ideas"):
+                entry_id, idea, requirements, plan, files, used_at = row
+                plan = json.loads(plan)
+                self._put(Entry(entry_id, idea, requirements, plan, json.loads(files),
+                                used_at, features(idea, requirements)))
+            self._version = version
+            metrics.IDEA_INDEX_ENTRIES.set(len(self._entries))
+        return db
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ideas ("
+                "id TEXT PRIMARY KEY, idea TEXT NOT NULL, requirements TEXT NOT NULL, "
+                "plan TEXT NOT NULL, files TEXT NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+
+def features(idea: str, requirements: str) -> dict[str, float]:
+    """Sublinear term weights of a request.
+
+    Entries are indexed by these too, never by their plan: a request has no
+    plan yet, and plan terms would only pull an identical request's score
+    below the threshold.
+    """
+    counts = Counter()
+    for term in _terms(idea):
+        counts[term] += IDEA_WEIGHT
+    counts.update(_terms(requirements))
+    return {term: 1 + math.log(count) for term, count in counts.items()}
+
+
+def _terms(text: str) -> list[str]:
+    """Content words (lightly stemmed) and their bigrams."""
+    words = [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())
+             if word not in STOPWORDS and len(word) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _idf(total: int, df: int) -> float:
+    return math.log((total + 1) / (df + 1)) + 1
+
+
+# Shared by every session in the process; None when the index is disabled
+index = (IdeaIndex(IDEA_INDEX_PATH, IDEA_INDEX_MAX_ENTRIES, IDEA_MATCH_THRESHOLD)
+         if IDEA_INDEX_ENABLED else None)
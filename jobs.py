@@ -0,0 +1,319 @@
+"""Background build jobs — run plan + execute on a bounded worker pool.
+
+``JobQueue`` runs each job on a worker thread; ``AsyncJobQueue`` (for the
+ASGI app) runs it as a task on the event loop.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from config import BUILD_WORKERS, BUILD_QUEUE_DEPTH, BUILD_JOB_HISTORY, ASYNC_BUILD_WORKERS
+
+
+class QueueFull(Exception):
+    """Raised when the build queue is at its depth limit."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class BuildJob:
+    """One queued or running build, with its event log for status/streaming."""
+
+    def __init__(self, session_id: str):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.status = "queued"  # queued | running | done | failed | cancelled
+        self.error: str | None = None
+        self.events: list[dict] = []
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+        # (loop, future) of coroutines in follow_async waiting for an event
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def publish(self, event: dict):
+        """Append an event to the job log and wake any followers."""
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+            self._wake()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def follow(self, start: int = 0, timeout: float = 15.0):
+        """Yield ``(index, event)`` pairs from ``start`` until the job finishes.
+
+        Yields ``(None, None)`` whenever ``timeout`` seconds pass without a new
+        event, so streaming callers can send keep-alives.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self.events) and not self.finished:
+                    self._cond.wait(timeout)
+                pending = self.events[index:]
+                finished = self.finished
+            for event in pending:
+                yield index, event
+                index += 1
+            if finished and index >= len(self.events):
+                return
+            if not pending:
+                yield None, None
+
+    async def follow_async(self, start: int = 0, timeout: float = 15.0):
+        """``follow`` for coroutines: waits on the event loop instead of a thread."""
+        loop = asyncio.get_running_loop()
+        index = start
+        while True:
+            waiter = None
+            with self._cond:
+                pending = self.events[index:]
+                finished = self.finished
+                if not pending and not finished:
+                    waiter = (loop, loop.create_future())
+                    self._waiters.append(waiter)
+            if waiter:
+                try:
+                    await asyncio.wait_for(waiter[1], timeout)
+                except asyncio.TimeoutError:
+                    with self._cond:
+                        if waiter in self._waiters:
+                            self._waiters.remove(waiter)
+                    yield None, None
+                continue
+            for event in pending:
+                yield index, event
+                index += 1
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self) -> dict:
+        """Serializable status summary for the polling endpoint."""
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "error": self.error,
+            "events": len(self.events),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def _start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        wait = self.started_at - self.created_at
+        metrics.BUILD_QUEUE_WAIT.observe(wait)
+        metrics.traces.add(self.session_id, {"name": "queue_wait", "start": self.created_at,
+                                             "duration": wait, "job_id": self.id})
+
+    def _fail(self, error: Exception):
+        event = {"type": "error", "error": str(error)}
+        # Errors mapped to an HTTP status (e.g. model quota → 429) keep it
+        if getattr(error, "status", None):
+            event.update(status=error.status, retry_after=getattr(error, "retry_after", None))
+        self.publish(event)
+        self._finish("failed", str(error))
+
+    def _finish(self, status: str, error: str | None = None):
+        with self._cond:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+            self._wake()
+        metrics.BUILD_JOBS.inc(status=status)
+
+    def _wake(self):
+        """Resolve the futures of waiting ``follow_async`` calls (holding ``_cond``)."""
+        waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+class JobQueue:
+    """Bounded pool of build workers with a queue-depth limit.
+
+    ``submit`` takes a callable ``fn(job)`` returning an iterable of events;
+    each event is published to the job log as it is produced, and
+    cancellation is checked between events.
+    """
+
+    def __init__(self, workers: int = BUILD_WORKERS, max_queued: int = BUILD_QUEUE_DEPTH,
+                 history: int = BUILD_JOB_HISTORY):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.history = history
+        self._executor = None
+        self._jobs: OrderedDict[str, BuildJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, session_id: str, fn) -> BuildJob:
+        """Queue a build for ``session_id``.
+
+        An unfinished job for the same session is returned instead of
+        starting a second one.
+
+        Raises:
+            QueueFull: if ``max_queued`` jobs are already waiting for a worker.
+        """
+        with self._lock:
+            existing = self.active_job(session_id)
+            if existing:
+                return existing
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self.max_queued:
+                raise QueueFull(f"Build queue is full ({queued} waiting)")
+
+            job = BuildJob(session_id)
+            self._jobs[job.id] = job
+            self._prune()
+            job.future = self._launch(job, fn)
+            return job
+
+    def get(self, job_id: str) -> BuildJob | None:
+        return self._jobs.get(job_id)
+
+    def active_job(self, session_id: str) -> BuildJob | None:
+        """The unfinished job for a session, if any."""
+        for job in self._jobs.values():
+            if job.session_id == session_id and not job.finished:
+                return job
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation. Returns False if the job is unknown or finished.
+
+        Queued jobs never start; running jobs stop at their next event, since
+        an in-flight model call cannot be interrupted.
+        """
+        job = self._jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job._cancel.set()
+        if job.future and job.future.cancel():
+            job.publish({"type": "cancelled"})
+            job._finish("cancelled")
+        return True
+
+    def stats(self) -> dict:
+        """Counts of jobs by status."""
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+        for job in list(self._jobs.values()):
+            counts[job.status] += 1
+        return counts
+
+    def shutdown(self, wait: bool = True):
+        if self._executor:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _launch(self, job: BuildJob, fn):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="build")
+        return self._executor.submit(self._run, job, fn)
+
+    def _run(self, job: BuildJob, fn):
+        if job.cancelled:
+            job.publish({"type": "cancelled"})
+            job._finish("cancelled")
+            return
+        job._start()
+        try:
+            for event in fn(job):
+                job.check_cancelled()
+                job.publish(event)
+            job._finish("done")
+        except JobCancelled:
+            job.publish({"type": "cancelled"})
+            job._finish("cancelled")
+        except Exception as e:
+            job._fail(e)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit."""
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+
+class AsyncJobQueue(JobQueue):
+    """``JobQueue`` for an event loop: each job is a task, at most ``workers``
+    running at once.
+
+    ``fn(job)`` returns an async iterable of events. Call ``submit`` and
+    ``cancel`` from the event loop. A cancelled job stops at once, even in
+    the middle of a model call.
+    """
+
+    def __init__(self, workers: int = ASYNC_BUILD_WORKERS, max_queued: int = BUILD_QUEUE_DEPTH,
+                 history: int = BUILD_JOB_HISTORY):
+        super().__init__(workers, max_queued, history)
+        self._slots = asyncio.Semaphore(workers)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job._cancel.set()
+        job.future.cancel()
+        return True
+
+    def shutdown(self, wait: bool = True):
+        for job in list(self._jobs.values()):
+            if job.future:
+                job.future.cancel()
+
+    def _launch(self, job: BuildJob, fn):
+        task = asyncio.ensure_future(self._run_async(job, fn))
+        task.add_done_callback(lambda _: self._settle(job))
+        return task
+
+    def _settle(self, job: BuildJob):
+        """Finish a job whose task was cancelled before it ever ran."""
+        if not job.finished:
+            job.publish({"type": "cancelled"})
+            job._finish("cancelled")
+
+    async def _run_async(self, job: BuildJob, fn):
+        try:
+            async with self._slots:
+                job.check_cancelled()
+                job._start()
+                async for event in fn(job):
+                    job.check_cancelled()
+                    job.publish(event)
+            job._finish("done")
+        except (JobCancelled, asyncio.CancelledError):
+            job.publish({"type": "cancelled"})
+            job._finish("cancelled")
+        except Exception as e:
+            job._fail(e)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,619 @@
+"""Model calls — the single place where the phases talk to the model.
+
+Requests go through a pluggable backend: ``GeminiBackend`` calls the API,
+and ``fake_model.FakeBackend`` answers offline for benchmarks and tests.
+"""
+
+import asyncio
+import contextlib
+import functools
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    GOOGLE_API_KEY, LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MAX_MB, LLM_CACHE_TTL,
+    CHAT_POOL_MAX_SESSIONS, CHAT_POOL_MAX_MB, CHAT_POOL_IDLE_TTL,
+    MODEL_BACKEND, LLM_RECORD_PATH, LLM_RPM, LLM_TPM, LLM_RATE_LIMIT_DB,
+    LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY, LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_RETRY_DEADLINE,
+)
+import metrics
+from llm_cache import ResponseCache
+from phases.compact import count_tokens
+from phases.context import BuildContext
+from ratelimit import RateLimiter, AdaptiveConcurrency
+
+# Shared across every phase and session; None when caching is disabled
+response_cache = (
+    ResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_MB * 1024 * 1024, LLM_CACHE_TTL)
+    if LLM_CACHE_ENABLED else None
+)
+
+
+def _create_rate_limiter(per_minute: float, tokens_per_minute: float) -> RateLimiter | None:
+    if per_minute <= 0 and tokens_per_minute <= 0:
+        return None
+    return RateLimiter(per_minute, tokens_per_minute=tokens_per_minute,
+                       path=LLM_RATE_LIMIT_DB or None)
+
+
+# Paces every uncached request in the process (or across processes sharing
+# LLM_RATE_LIMIT_DB); None when unlimited
+rate_limiter = _create_rate_limiter(LLM_RPM, LLM_TPM)
+
+# Caps in-flight requests, backing off on quota errors; None when uncapped
+concurrency = (AdaptiveConcurrency(LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY)
+               if LLM_MAX_CONCURRENCY > 0 else None)
+
+
+def set_rate_limit(per_minute: float, tokens_per_minute: float | None = None):
+    """Replace the process-wide rate limits (0 disables one).
+
+    ``tokens_per_minute`` defaults to ``LLM_TPM``.
+    """
+    global rate_limiter
+    rate_limiter = _create_rate_limiter(
+        per_minute, LLM_TPM if tokens_per_minute is None else tokens_per_minute)
+
+
+class ModelUnavailable(Exception):
+    """The model kept failing with quota (429) or server (5xx) errors.
+
+    ``status`` is the HTTP status to report: 429 for quota errors, else 503.
+    """
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def set_backend(new_backend):
+    """Replace the process-wide model backend; chats already open keep theirs."""
+    global backend
+    backend = new_backend
+
+
+class Reply:
+    """Text and metadata of one model response."""
+
+    def __init__(self, text: str, finish_reason: str = "STOP",
+                 input_tokens: int = 0, output_tokens: int = 0, cached: bool = False):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cached = cached
+
+    def to_dict(self) -> dict:
+        return {
+            "text": self.text,
+            "finish_reason": self.finish_reason,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+class Chat:
+    """A model chat session for one phase of a build.
+
+    Besides wrapping the backend's chat, it knows every input that determines a
+    response (model, system prompt, generation config, history, message), so
+    identical requests are answered from ``response_cache``. Pass
+    ``fresh=True`` (or set ``ctx.fresh``) to always ask the model.
+    """
+
+    def __init__(self, ctx: BuildContext, phase: str, system_prompt: str,
+                 generation_config: dict | None = None, history: list[dict] | None = None):
+        self.ctx = ctx
+        self.phase = phase
+        self.system_prompt = system_prompt
+        self.generation_config = generation_config or {}
+        self.last: Reply | None = None
+        # Kept in step with the session so history is never re-serialized
+        self._history = list(history or [])
+        self.size = sum(len(p) for msg in self._history for p in msg["parts"])
+
+        self.backend = backend
+        self.session = self.backend.start_chat(
+            ctx.model_name, system_prompt, self.generation_config, self._history)
+
+    @property
+    def history(self) -> list[dict]:
+        """Serializable conversation history."""
+        return list(self._history)
+
+    def send(self, message: str, fresh: bool = False) -> Reply:
+        """Send a message and return the complete reply."""
+        key = self._cache_key(message, fresh)
+        reply = self._replay(key, message)
+        if reply:
+            return reply
+
+        start = time.perf_counter()
+        with self.ctx.timed(self.phase):
+            calls = self._call(message, lambda m: _unstreamed(self.session.send, m), {})
+            reply = _drain(calls)
+        self._observe(reply, time.perf_counter() - start)
+        return self._store(key, message, reply)
+
+    def stream(self, message: str, fresh: bool = False):
+        """Send a message and yield the reply text as it is generated.
+
+        Once the iterator is exhausted, ``self.last`` holds the full Reply.
+        """
+        key = self._cache_key(message, fresh)
+        reply = self._replay(key, message)
+        if reply:
+            yield reply.text
+            return
+
+        start = time.perf_counter()
+        call = {}
+        with self.ctx.timed(self.phase):
+            reply = yield from self._call(message, self.session.stream, call)
+        self._observe(reply, time.perf_counter() - start, call["ttft"])
+        self._store(key, message, reply)
+
+    async def send_async(self, message: str, fresh: bool = False) -> Reply:
+        """``send`` for coroutines, on the backend's async API."""
+        async for _ in self._exchange_async(message, fresh, _unstreamed_async(self.session)):
+            pass
+        return self.last
+
+    async def stream_async(self, message: str, fresh: bool = False):
+        """``stream`` for coroutines: an async iterator over the reply text.
+
+        Once it is exhausted, ``self.last`` holds the full Reply.
+        """
+        async for text in self._exchange_async(message, fresh, self.session.stream_async):
+            yield text
+
+    async def _exchange_async(self, message: str, fresh: bool, request):
+        """Cache lookup, request and bookkeeping of ``stream``, without blocking
+        the event loop: the cache and the recorder are used from a worker thread."""
+        key = self._cache_key(message, fresh)
+        reply = await asyncio.to_thread(self._replay, key, message) if key else None
+        if reply:
+            yield reply.text
+            return
+
+        start = time.perf_counter()
+        call = {}
+        with self.ctx.timed(self.phase):
+            async for text in self._call_async(message, request, call):
+                yield text
+        reply = call["reply"]
+        self._observe(reply, time.perf_counter() - start, call["ttft"])
+        await asyncio.to_thread(self._store, key, message, reply)
+
+    def _call(self, message: str, request, call: dict):
+        """Make one request under the rate limits, retrying quota and server errors.
+
+        ``request(message)`` returns a generator of text chunks that returns
+        the Reply. Failures are retried with jittered exponential backoff
+        until ``LLM_MAX_RETRIES`` or ``LLM_RETRY_DEADLINE`` runs out — but
+        only before the first chunk, since streamed text cannot be taken
+        back. ``call["ttft"]`` is set to the last attempt's time to first chunk.
+
+        Raises:
+            ModelUnavailable: if the errors outlast the retries.
+        """
+        deadline = time.monotonic() + LLM_RETRY_DEADLINE
+        estimate = self._estimate(message)
+        priority = self.ctx.priority
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            limiter = rate_limiter
+            if limiter:
+                waited = limiter.acquire(estimate, priority)
+                metrics.LLM_RATE_WAIT.observe(waited, priority=priority)
+            with _slot(priority) as outcome:
+                call.update(start=time.perf_counter(), ttft=None)
+                try:
+                    reply = yield from _mark_first_chunk(request(message), call)
+                except Exception as e:
+                    status = _failure_status(e, call, outcome)
+                    error = e
+                else:
+                    if limiter:
+                        limiter.charge(reply.output_tokens)
+                    return reply
+            time.sleep(self._backoff(attempt, status, deadline, error))
+
+    async def _call_async(self, message: str, request, call: dict):
+        """``_call`` for coroutines.
+
+        ``request(message)`` is an async iterator of text chunks ending with
+        the Reply; the Reply is left in ``call["reply"]``, since an async
+        generator cannot return it.
+        """
+        deadline = time.monotonic() + LLM_RETRY_DEADLINE
+        estimate = self._estimate(message)
+        priority = self.ctx.priority
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            limiter = rate_limiter
+            if limiter:
+                waited = await limiter.acquire_async(estimate, priority)
+                metrics.LLM_RATE_WAIT.observe(waited, priority=priority)
+            async with _slot_async(priority) as outcome:
+                call.update(start=time.perf_counter(), ttft=None)
+                try:
+                    async for item in request(message):
+                        if isinstance(item, Reply):
+                            call["reply"] = item
+                            continue
+                        if call["ttft"] is None:
+                            call["ttft"] = time.perf_counter() - call["start"]
+                        yield item
+                except Exception as e:
+                    status = _failure_status(e, call, outcome)
+                    error = e
+                else:
+                    if limiter:
+                        limiter.charge(call["reply"].output_tokens)
+                    return
+            await asyncio.sleep(self._backoff(attempt, status, deadline, error))
+
+    def _estimate(self, message: str) -> int:
+        """Tokens a request is expected to use, for the rate limiter."""
+        return count_tokens(message) + count_tokens(self.system_prompt) + self.size // 4
+
+    def _backoff(self, attempt: int, status: int, deadline: float, error: Exception) -> float:
+        """Seconds to wait before retrying a failed attempt.
+
+        Raises:
+            ModelUnavailable: if the retries or the deadline are used up.
+        """
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY,
+                                      LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        if attempt == LLM_MAX_RETRIES or time.monotonic() + delay > deadline:
+            raise ModelUnavailable(
+                "Model quota exceeded — try again shortly" if status == 429
+                else f"Model unavailable ({status}) — try again shortly",
+                status if status == 429 else 503, max(1.0, delay)) from error
+        metrics.LLM_RETRIES.inc(phase=self.phase, status=status)
+        print(f"[llm] {self.phase}: {status} from the model, retrying in {delay:.1f}s "
+              f"({attempt + 1}/{LLM_MAX_RETRIES})")
+        return delay
+
+    def _cache_key(self, message: str, fresh: bool) -> str | None:
+        """Cache key for sending ``message`` now, or None if the cache is bypassed."""
+        if response_cache is None or fresh or self.ctx.fresh:
+            return None
+        return ResponseCache.key(
+            backend=self.backend.name,
+            model=self.ctx.model_name,
+            system=self.system_prompt,
+            generation=self.generation_config,
+            history=self.history,
+            message=message,
+        )
+
+    def _replay(self, key: str | None, message: str) -> Reply | None:
+        """Serve a cached reply, appending the exchange to the chat history."""
+        hit = response_cache.get(key) if key else None
+        if hit is None:
+            return None
+
+        reply = Reply(**hit, cached=True)
+        self.session.append(message, reply.text)
+        self._observe(reply, 0.0)
+        self._append(message, reply)
+        return reply
+
+    def _store(self, key: str | None, message: str, reply: Reply) -> Reply:
+        if key and reply.finish_reason in ("STOP", "MAX_TOKENS"):
+            response_cache.put(key, reply.to_dict())
+        if recorder:
+            recorder.record(self.system_prompt, message, reply)
+        self.ctx.record_tokens(self.phase, reply.input_tokens, reply.output_tokens)
+        self._append(message, reply)
+        return reply
+
+    def _observe(self, reply: Reply, seconds: float, ttft: float | None = None):
+        """Record a call in the metrics and the session trace (before history grows)."""
+        metrics.LLM_REQUESTS.inc(phase=self.phase, finish_reason=reply.finish_reason,
+                                 cached=str(reply.cached).lower())
+        span = {
+            "name": "llm", "phase": self.phase,
+            "start": time.time() - seconds, "duration": seconds, "ttft": ttft,
+            "cached": reply.cached, "finish_reason": reply.finish_reason,
+            "input_tokens": reply.input_tokens, "output_tokens": reply.output_tokens,
+            "history_messages": len(self._history), "history_chars": self.size,
+        }
+        if not reply.cached:
+            metrics.LLM_SECONDS.observe(seconds, phase=self.phase)
+            metrics.LLM_HISTORY.observe(len(self._history), phase=self.phase)
+            metrics.LLM_TOKENS.inc(reply.input_tokens, phase=self.phase, direction="input")
+            metrics.LLM_TOKENS.inc(reply.output_tokens, phase=self.phase, direction="output")
+            if ttft is not None:
+                metrics.LLM_TTFT.observe(ttft, phase=self.phase)
+                metrics.recent_ttft.observe(ttft, phase=self.phase)
+        self.ctx.add_span(span)
+
+    def _append(self, message: str, reply: Reply):
+        self._history.append({"role": "user", "parts": [message]})
+        self._history.append({"role": "model", "parts": [reply.text]})
+        self.size += len(message) + len(reply.text)
+        self.last = reply
+
+
+class ChatPool:
+    """Live chat sessions kept between web requests, keyed by session id.
+
+    Reusing a chat skips rebuilding its backend history on every turn. Chats
+    are checked out with ``take`` and returned with ``put``, so concurrent
+    requests for one session never share a chat. Idle chats expire after
+    ``idle_ttl`` seconds; the least recently used go first once
+    ``max_sessions`` or ``max_bytes`` of history is exceeded.
+    """
+
+    def __init__(self, max_sessions: int, max_bytes: int, idle_ttl: float):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+        self._chats: OrderedDict[str, tuple[Chat, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, session_id: str, history: list[dict], ctx: BuildContext) -> Chat | None:
+        """Check out the session's chat if it matches ``history``, else None."""
+        with self._lock:
+            chat, last_used = self._chats.pop(session_id, (None, 0.0))
+            fresh = chat and time.time() - last_used <= self.idle_ttl
+            if not fresh or len(chat._history) != len(history) \
+                    or chat._history[-1:] != history[-1:]:
+                self.misses += 1
+                return None
+            self.hits += 1
+        chat.ctx = ctx
+        return chat
+
+    def put(self, session_id: str, chat: Chat):
+        """Return a chat to the pool after a turn."""
+        now = time.time()
+        with self._lock:
+            self._chats[session_id] = (chat, now)
+            self._chats.move_to_end(session_id)
+            self._evict(now)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._chats.pop(session_id, None)
+
+    def _evict(self, now: float):
+        for session_id, (_, last_used) in list(self._chats.items()):
+            if now - last_used > self.idle_ttl:
+                del self._chats[session_id]
+        total = sum(chat.size for chat, _ in self._chats.values())
+        while self._chats and (len(self._chats) > self.max_sessions
+                               or total > self.max_bytes):
+            _, (chat, _) = self._chats.popitem(last=False)
+            total -= chat.size
+
+
+chat_pool = ChatPool(CHAT_POOL_MAX_SESSIONS, CHAT_POOL_MAX_MB * 1024 * 1024,
+                     CHAT_POOL_IDLE_TTL)
+
+
+class GeminiBackend:
+    """Backend calling the Gemini API through ``google.generativeai``.
+
+    Backends provide ``start_chat``, returning a session with ``send(message)
+    -> Reply``, a ``stream(message)`` generator that yields text and returns
+    the Reply, and ``append(message, text)`` to record an exchange served
+    from elsewhere (the response cache). For coroutines, a session also has
+    ``async send_async(message) -> Reply`` and ``stream_async(message)``, an
+    async generator yielding the text and then the Reply.
+    """
+
+    name = "gemini"
+
+    def start_chat(self, model_name: str, system_prompt: str,
+                   generation_config: dict, history: list[dict]) -> "GeminiSession":
+        model = _model(model_name, system_prompt,
+                       json.dumps(generation_config, sort_keys=True))
+        return GeminiSession(model.start_chat(history=_rebuild_history(history)))
+
+
+class GeminiSession:
+    """A ``genai.ChatSession`` adapted to the backend session interface."""
+
+    def __init__(self, session):
+        self._session = session
+
+    def send(self, message: str) -> Reply:
+        return _to_reply(self._session.send_message(message))
+
+    def stream(self, message: str):
+        parts = []
+        response = self._session.send_message(message, stream=True)
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+        return _to_reply(response, "".join(parts))
+
+    async def send_async(self, message: str) -> Reply:
+        return _to_reply(await self._session.send_message_async(message))
+
+    async def stream_async(self, message: str):
+        parts = []
+        response = await self._session.send_message_async(message, stream=True)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+        yield _to_reply(response, "".join(parts))
+
+    def append(self, message: str, text: str):
+        from google.generativeai.types import content_types
+        self._session.history = self._session.history + [
+            content_types.to_content({"role": "user", "parts": [message]}),
+            content_types.to_content({"role": "model", "parts": [text]}),
+        ]
+
+
+def _create_backend():
+    """Build the backend selected by ``MODEL_BACKEND``."""
+    if MODEL_BACKEND == "gemini":
+        return GeminiBackend()
+    if MODEL_BACKEND == "fake":
+        from fake_model import FakeBackend
+        return FakeBackend.from_config()
+    raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND!r} (use gemini or fake)")
+
+
+def _create_recorder():
+    if not LLM_RECORD_PATH:
+        return None
+    from fake_model import Recorder
+    return Recorder(LLM_RECORD_PATH)
+
+
+# Process-wide backend, and an optional recorder writing every model reply
+# to JSONL for the fake backend to replay
+backend = _create_backend()
+recorder = _create_recorder()
+
+
+@functools.lru_cache(maxsize=1)
+def _genai():
+    """Import and configure the Gemini SDK on first use.
+
+    The SDK pulls in protobuf, gRPC and more, roughly a second of imports,
+    so it is loaded by the first real request rather than at startup.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai
+
+
+@functools.lru_cache(maxsize=32)
+def _model(model_name: str, system_prompt: str, generation_json: str):
+    """Shared GenerativeModel per (model, system prompt, generation config)."""
+    genai = _genai()
+    generation_config = json.loads(generation_json)
+    return genai.GenerativeModel(
+        model_name,
+        system_instruction=system_prompt,
+        generation_config=(genai.GenerationConfig(**generation_config)
+                           if generation_config else None),
+    )
+
+
+def _mark_first_chunk(chunks, call: dict):
+    """Pass streamed chunks through, noting the time to the first in ``call``."""
+    try:
+        first = next(chunks)
+    except StopIteration as stop:
+        return stop.value
+    call["ttft"] = time.perf_counter() - call["start"]
+    yield first
+    return (yield from chunks)
+
+
+def _unstreamed(send, message: str):
+    """A non-streaming send as a chunk generator that yields nothing."""
+    return send(message)
+    yield
+
+
+def _unstreamed_async(session):
+    """A non-streaming async send as a request yielding only the Reply."""
+    async def request(message: str):
+        yield await session.send_async(message)
+    return request
+
+
+def _drain(chunks):
+    """Exhaust a chunk generator and return its Reply."""
+    while True:
+        try:
+            next(chunks)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _slot(priority: str):
+    """A concurrency slot, or a no-op when concurrency is uncapped."""
+    limiter = concurrency
+    if limiter:
+        return limiter.slot(priority)
+    return contextlib.nullcontext({"overloaded": False})
+
+
+def _slot_async(priority: str):
+    """``_slot`` for coroutines."""
+    limiter = concurrency
+    if limiter:
+        return limiter.slot_async(priority)
+    return contextlib.nullcontext({"overloaded": False})
+
+
+def _failure_status(error: Exception, call: dict, outcome: dict) -> int:
+    """Status of a failed attempt that may be retried.
+
+    Raises:
+        The error itself if it is not retryable, or ModelUnavailable if the
+        reply had already started streaming.
+    """
+    status = _error_status(error)
+    if status is None:
+        raise error
+    outcome["overloaded"] = status in (429, 503)
+    if call["ttft"] is not None:
+        raise ModelUnavailable(f"Model stream failed ({status}): {error}",
+                               status if status == 429 else 503,
+                               LLM_RETRY_BASE_DELAY) from error
+    return status
+
+
+def _error_status(error: Exception) -> int | None:
+    """HTTP status of a retryable error (429 or 5xx), or None."""
+    # google.api_core exceptions (and the fake backend's) carry the status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and (code == 429 or 500 <= code < 600):
+        return code
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return 503
+    return None
+
+
+def _to_reply(response, text: str | None = None) -> Reply:
+    """Convert a (fully consumed) Gemini response into a Reply."""
+    candidate = response.candidates[0] if response.candidates else None
+    usage = getattr(response, "usage_metadata", None)
+    if text is None:
+        text = "".join(p.text for p in candidate.content.parts) if candidate else ""
+    return Reply(
+        text=text,
+        finish_reason=candidate.finish_reason.name if candidate else "OTHER",
+        input_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+        output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+def _chunk_text(chunk) -> str:
+    """Text of a streamed chunk; chunks carrying only metadata have none."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _rebuild_history(history: list[dict]) -> list:
+    """Rebuild history dicts into Gemini Content format."""
+    from google.generativeai.types import content_types
+    contents = []
+    for msg in history:
+        contents.append(content_types.to_content(
+            {"role": msg["role"], "parts": msg["parts"]}
+        ))
+    return contents
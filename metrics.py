@@ -0,0 +1,273 @@
+"""Process metrics and per-session traces.
+
+Counters, gauges and histograms render in the Prometheus text format for the
+``/metrics`` endpoint. ``traces`` keeps the spans (phases, model calls, queue
+waits) of recent sessions for ``/api/sessions/<id>/trace``, and
+``recent_ttft`` the latest times to first token, for hedging. All live in
+this process only; with several workers, scrape each one.
+"""
+
+import bisect
+import threading
+from collections import OrderedDict, deque
+
+from config import TRACE_MAX_SESSIONS, TRACE_MAX_SPANS, HEDGE_WINDOW
+
+# Seconds, from a cached reply to a long generation
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Metric:
+    """Base for metrics: a name, help text and a value per label combination."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self._label_text(key)} {value}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """A value that is set to the current reading."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative ``le`` buckets, plus sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            labels = self._label_text(key, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {total}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class TraceStore:
+    """Recent spans per session, oldest sessions dropped first.
+
+    A span is a dict with at least ``name``, ``start`` (epoch seconds) and
+    ``duration`` (seconds). Each session keeps its last ``max_spans``.
+    """
+
+    def __init__(self, max_sessions: int, max_spans: int):
+        self.max_sessions = max_sessions
+        self.max_spans = max_spans
+        self._spans: OrderedDict[str, list[dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, span: dict):
+        with self._lock:
+            spans = self._spans.setdefault(session_id, [])
+            self._spans.move_to_end(session_id)
+            spans.append(span)
+            del spans[:-self.max_spans]
+            while len(self._spans) > self.max_sessions:
+                self._spans.popitem(last=False)
+
+    def get(self, session_id: str) -> list[dict] | None:
+        """The session's spans in start order, or None if none were recorded."""
+        with self._lock:
+            spans = self._spans.get(session_id)
+            return sorted(spans, key=lambda s: s["start"]) if spans else None
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._spans.pop(session_id, None)
+
+
+class RecentLatencies:
+    """The last ``window`` observations per phase, for percentiles of recent
+    behaviour rather than of the whole process lifetime."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, phase: str):
+        with self._lock:
+            self._values.setdefault(phase, deque(maxlen=self.window)).append(value)
+
+    def percentile(self, phase: str, pct: float, min_samples: int = 1) -> float | None:
+        """Nearest-rank percentile, or None with fewer than ``min_samples``."""
+        with self._lock:
+            values = sorted(self._values.get(phase, ()))
+        if not values or len(values) < min_samples:
+            return None
+        rank = max(1, -(-len(values) * pct // 100))
+        return values[int(rank) - 1]
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry: list[_Metric] = []
+traces = TraceStore(TRACE_MAX_SESSIONS, TRACE_MAX_SPANS)
+recent_ttft = RecentLatencies(HEDGE_WINDOW)
+
+# ── Metrics ────────────────────────────────────────────────────────────────
+
+LLM_REQUESTS = Counter(
+    "gamebuilder_llm_requests_total", "Model requests, including cache hits.",
+    ("phase", "finish_reason", "cached"))
+LLM_SECONDS = Histogram(
+    "gamebuilder_llm_request_seconds", "Wall time of uncached model requests.",
+    ("phase",))
+LLM_TTFT = Histogram(
+    "gamebuilder_llm_ttft_seconds", "Time to the first streamed chunk.",
+    ("phase",))
+LLM_TOKENS = Counter(
+    "gamebuilder_llm_tokens_total", "Tokens sent to and generated by the model.",
+    ("phase", "direction"))
+LLM_HISTORY = Histogram(
+    "gamebuilder_llm_history_messages", "History messages sent with each model request.",
+    ("phase",), buckets=(0, 2, 4, 8, 16, 32, 64))
+LLM_RETRIES = Counter(
+    "gamebuilder_llm_retries_total", "Model requests retried after a 429 or 5xx.",
+    ("phase", "status"))
+LLM_RATE_WAIT = Histogram(
+    "gamebuilder_llm_rate_limit_wait_seconds", "Time requests waited for the rate limiter.",
+    ("priority",))
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "gamebuilder_llm_concurrency_limit", "Current adaptive cap on in-flight model requests.")
+LLM_IN_FLIGHT = Gauge(
+    "gamebuilder_llm_in_flight", "Model requests currently in flight.")
+PHASE_SECONDS = Histogram(
+    "gamebuilder_phase_seconds", "Wall time of each pipeline phase.", ("phase",))
+EXECUTE_RECOVERIES = Counter(
+    "gamebuilder_execute_recoveries_total",
+    "Code generations by outcome: complete, continued or regenerated.", ("recovery",))
+EXECUTE_CONTINUATIONS = Counter(
+    "gamebuilder_execute_continuations_total",
+    "Continuation requests after truncated responses.")
+EXECUTE_HEDGES = Counter(
+    "gamebuilder_execute_hedges_total",
+    "Hedged and best-of-N generations by mode and outcome.", ("mode", "outcome"))
+EXECUTE_EXTRA_TOKENS = Counter(
+    "gamebuilder_execute_extra_tokens_total",
+    "Tokens spent on duplicate requests that were not used.", ("mode",))
+SKELETON_BUILDS = Counter(
+    "gamebuilder_skeleton_builds_total",
+    "Builds that matched a skeleton, by outcome: used or fallback.", ("skeleton", "outcome"))
+VALIDATION_PROBLEMS = Counter(
+    "gamebuilder_validation_problems_total",
+    "Problems found by the static checks of generated files.", ("file",))
+REPAIRS = Counter(
+    "gamebuilder_repairs_total",
+    "Single-file repair requests by outcome: fixed, improved or failed.",
+    ("file", "outcome"))
+EDITS = Counter(
+    "gamebuilder_edits_total",
+    "Edits of built games by how they were applied: patch, full or failed.", ("mode",))
+BYTES_WRITTEN = Counter(
+    "gamebuilder_bytes_written_total", "Bytes of generated files written to disk.")
+BUNDLE_SAVED_BYTES = Counter(
+    "gamebuilder_bundle_saved_bytes_total",
+    "Bytes saved by single-file bundles over their separate game files.")
+ARTIFACT_STORE_PUTS = Counter(
+    "gamebuilder_artifact_store_puts_total",
+    "Artifacts stored: new object, deduplicated against an existing one, "
+    "or copied where a hardlink failed.", ("outcome",))
+ARTIFACT_STORE_OBJECTS = Gauge(
+    "gamebuilder_artifact_store_objects", "Objects in the artifact store at the last collection.")
+ARTIFACT_STORE_BYTES = Gauge(
+    "gamebuilder_artifact_store_bytes",
+    "Artifact store size at the last collection: stored on disk, or logical "
+    "(as if every build kept its own copies).", ("kind",))
+ARTIFACT_GC_REMOVED = Counter(
+    "gamebuilder_artifact_gc_removed_total",
+    "Removed by artifact collection: object, orphan_output or quota_output.", ("kind",))
+ARTIFACT_GC_FREED = Counter(
+    "gamebuilder_artifact_gc_freed_bytes_total", "Bytes of store objects deleted.")
+PLAN_OUTCOMES = Counter(
+    "gamebuilder_plan_outcomes_total",
+    "Plans by how they became valid: valid, json_repaired (locally), "
+    "fields_fixed (re-asked) or failed.", ("outcome",))
+PLAN_PREFETCH = Counter(
+    "gamebuilder_plan_prefetch_total",
+    "Speculative plans by outcome: started, skipped (workers busy), used, stale, "
+    "queued (not started when taken) or cancelled.", ("outcome",))
+IDEA_LOOKUPS = Counter(
+    "gamebuilder_idea_lookups_total",
+    "Near-duplicate idea lookups before planning: match or miss.", ("outcome",))
+IDEA_REUSES = Counter(
+    "gamebuilder_idea_reuses_total",
+    "Earlier builds served for a matching request: reused, or gone from the store.",
+    ("outcome",))
+IDEA_INDEX_ENTRIES = Gauge(
+    "gamebuilder_idea_index_entries", "Builds in the near-duplicate idea index.")
+BUILD_QUEUE_WAIT = Histogram(
+    "gamebuilder_build_queue_wait_seconds", "Time builds wait for a worker.")
+BUILD_JOBS = Counter(
+    "gamebuilder_build_jobs_total", "Finished build jobs by final status.", ("status",))
+BUILD_JOBS_CURRENT = Gauge(
+    "gamebuilder_build_jobs", "Build jobs currently known, by status.", ("status",))
@@ -0,0 +1,254 @@
+"""Single-file bundle — the game as one self-contained ``game.html``.
+
+After validation, style.css and game.js are inlined into a copy of
+index.html, so the game loads with a single request (and plays from a
+single downloaded file). With ``BUNDLE_MINIFY`` the inlined CSS and JS are
+minified first, in pure Python:
+
+- CSS — comments and whitespace go, strings are kept as they are.
+- JS — comments and whitespace go, using the tokenizer rules ``validate``
+  uses too (``phases/lexer.py``: strings, template literals, regex
+  literals). Line breaks are kept wherever automatic semicolon insertion
+  could depend on them, and names are never renamed. Minified code that no longer passes
+  ``validate.check_js`` is dropped in favour of the original.
+
+The readable index.html, style.css and game.js stay next to the bundle.
+"""
+
+import gzip
+import re
+
+import metrics
+from config import BUNDLE_ENABLED, BUNDLE_MINIFY
+from phases.lexer import REGEX_AFTER, REGEX_KEYWORDS, regex_end, string_end, template_end
+from phases.validate import check_js
+
+BUNDLE_FILE = "game.html"
+
+_STYLESHEET = re.compile(
+    r"""<link\b[^>]*?\bhref\s*=\s*["']?(?:\./)?style\.css["']?[^>]*>""", re.I)
+_SCRIPT = re.compile(
+    r"""<script\b([^>]*?)\s*\bsrc\s*=\s*["']?(?:\./)?game\.js["']?([^>]*)>\s*</script\s*>""",
+    re.I)
+_WORD = re.compile(r"[\w$.]+")
+_NEWLINES = "\n\r\u2028\u2029"
+# A line break next to these never ends a statement, so it can go
+_JS_JOIN_AFTER = set(";{,([")
+_JS_JOIN_BEFORE = set(")]};,")
+# Adjacent punctuators that would read as one token without the space
+_JS_KEEP_PAIRS = {"++", "--", "+-", "-+", "//", "/*", "<!"}
+
+
+def run(files: dict[str, str], write, minify: bool = BUNDLE_MINIFY) -> dict | None:
+    """Bundle the files and pass the result to ``write(filename, content)``.
+
+    Returns:
+        The size report (see ``build``), or None if bundling is disabled or
+        there is no index.html.
+    """
+    if not BUNDLE_ENABLED or "index.html" not in files:
+        return None
+    html, report = build(files, minify)
+    write(BUNDLE_FILE, html)
+    saved = report["original_bytes"] - report["bundle_bytes"]
+    metrics.BUNDLE_SAVED_BYTES.inc(max(saved, 0))
+    print(f"Bundled {BUNDLE_FILE}: {report['original_bytes']:,} → "
+          f"{report['bundle_bytes']:,} bytes, gzip {report['original_gzip']:,} → "
+          f"{report['bundle_gzip']:,} ({', '.join(report['inlined']) or 'nothing'} inlined"
+          f"{', minified' if report['minified'] else ''})")
+    return report
+
+
+def build(files: dict[str, str], minify: bool = BUNDLE_MINIFY) -> tuple[str, dict]:
+    """The bundled page and its size report.
+
+    The report compares the separate files (bytes, and gzip bytes summed
+    per file as they would be served) with the bundle, and lists the files
+    ``inlined`` and ``minified``.
+    """
+    html = files["index.html"]
+    inlined, minified = [], []
+
+    css = files.get("style.css")
+    if css is not None and _STYLESHEET.search(html):
+        if minify:
+            css = minify_css(css)
+            minified.append("style.css")
+        css = re.sub(r"</(style)", r"<\\/\1", css, flags=re.I)
+        html = _STYLESHEET.sub(lambda m: f"<style>\n{css}\n</style>", html, count=1)
+        inlined.append("style.css")
+
+    js = files.get("game.js")
+    match = _SCRIPT.search(html) if js is not None else None
+    if match:
+        if minify:
+            small = minify_js(js)
+            if small != js and not check_js(small):
+                js = small
+                minified.append("game.js")
+        js = re.sub(r"</(script)", r"<\\/\1", js, flags=re.I).replace("<!--", "<\\!--")
+        html = _inline_script(html, match, js)
+        inlined.append("game.js")
+
+    originals = [files[name] for name in ("index.html", "style.css", "game.js")
+                 if name in files]
+    report = {
+        "file": BUNDLE_FILE,
+        "inlined": inlined,
+        "minified": minified,
+        "original_bytes": sum(len(text.encode("utf-8")) for text in originals),
+        "original_gzip": sum(_gzip_size(text) for text in originals),
+        "bundle_bytes": len(html.encode("utf-8")),
+        "bundle_gzip": _gzip_size(html),
+    }
+    return html, report
+
+
+def minify_css(css: str) -> str:
+    """CSS without comments or needless whitespace; unterminated input is returned as is."""
+    out: list[str] = []
+    space = False
+    i, n = 0, len(css)
+    while i < n:
+        c = css[i]
+        if c.isspace():
+            space, i = True, i + 1
+            continue
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            if end < 0:
+                return css
+            space, i = True, end + 2
+            continue
+        if c in "\"'":
+            end = string_end(css, i)
+            if end is None:
+                return css
+            token, i = css[i:end], end
+        else:
+            token, i = c, i + 1
+        if c == "}" and out and out[-1] == ";":
+            out.pop()
+        elif space and out and out[-1][-1] not in "{};,>(:" and c not in "{};,>)!":
+            out.append(" ")
+        space = False
+        out.append(token)
+    return "".join(out).strip()
+
+
+def minify_js(code: str) -> str:
+    """JavaScript without comments or needless whitespace; names are kept.
+
+    Input the tokenizer cannot follow (an unterminated string, comment,
+    template or regex) is returned unchanged.
+    """
+    out: list[str] = []
+    stack: list[str] = []  # open brackets and "${"
+    prev: str | None = None  # last significant punctuator or word
+    gap = ""  # whitespace skipped since the last token: "", " " or "\n"
+    i, n = 0, len(code)
+
+    def emit(token: str):
+        nonlocal gap
+        if gap and out:
+            out.append(_js_gap(out[-1][-1], token[0], gap))
+        out.append(token)
+        gap = ""
+
+    while i < n:
+        c = code[i]
+        if c in _NEWLINES:
+            gap, i = "\n", i + 1
+        elif c.isspace():
+            gap, i = gap or " ", i + 1
+        elif code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end < 0:
+                return code
+            gap = "\n" if gap == "\n" or "\n" in code[i:end] else " "
+            i = end + 2
+        elif c in "\"'":
+            end = string_end(code, i)
+            if end is None:
+                return code
+            emit(code[i:end])
+            i, prev = end, "string"
+        elif c == "`" or (c == "}" and stack and stack[-1] == "${"):
+            if c == "}":
+                stack.pop()
+            end, _, opened = template_end(code, i + 1, 0)
+            if end is None:
+                return code
+            if opened:
+                stack.append("${")
+            emit(code[i:end])
+            i, prev = end, "string"
+        elif c == "/" and (prev in REGEX_AFTER or prev in REGEX_KEYWORDS):
+            end = regex_end(code, i)
+            if end is None:
+                return code
+            emit(code[i:end])
+            i, prev = end, "regex"
+        elif code.startswith(("++", "--"), i):
+            emit(code[i:i + 2])
+            i, prev = i + 2, code[i:i + 2]
+        elif c in "([{":
+            stack.append(c)
+            emit(c)
+            i, prev = i + 1, c
+        elif c in ")]}":
+            if stack:
+                stack.pop()
+            emit(c)
+            i, prev = i + 1, c
+        elif c.isalnum() or c in "_$":
+            word = _WORD.match(code, i).group()
+            emit(word)
+            i, prev = i + len(word), word
+        else:
+            emit(c)
+            i, prev = i + 1, c
+    if "${" in stack:  # the file ends inside a template literal
+        return code
+    return "".join(out)
+
+
+def _js_gap(left: str, right: str, gap: str) -> str:
+    """What whitespace ``gap`` between two tokens minifies to."""
+    if gap == "\n":
+        return "" if left in _JS_JOIN_AFTER or right in _JS_JOIN_BEFORE else "\n"
+    if _is_word(left) and (_is_word(right) or right == "."):
+        return " "
+    return " " if left + right in _JS_KEEP_PAIRS else ""
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c in "_$\\" or ord(c) > 127
+
+
+def _inline_script(html: str, match: re.Match, js: str) -> str:
+    """Replace the game.js ``<script src>`` tag with the code itself.
+
+    A deferred (or async) script runs after the page has been parsed; inline
+    scripts cannot be deferred, so that one moves to the end of the body.
+    """
+    attrs = f"{match.group(1)} {match.group(2)}"
+    deferred = re.search(r"\b(defer|async)\b", attrs, re.I)
+    attrs = re.sub(r"\s*\b(defer|async)\b(\s*=\s*(\"[^\"]*\"|'[^']*'|\S+))?", "", attrs,
+                   flags=re.I).strip()
+    module = re.search(r"\btype\s*=\s*[\"']?module", attrs, re.I)
+    tag = f"<script{' ' + attrs if attrs else ''}>\n{js}\n</script>"
+    if not deferred or module:
+        return html[:match.start()] + tag + html[match.end():]
+    html = html[:match.start()] + html[match.end():]
+    body_end = html.lower().rfind("</body")
+    if body_end < 0:
+        return html + "\n" + tag
+    return html[:body_end] + tag + "\n" + html[body_end:]
+
+
+def _gzip_size(text: str) -> int:
+    return len(gzip.compress(text.encode("utf-8"), compresslevel=9, mtime=0))
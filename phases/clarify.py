@@ -1,31 +1,34 @@
 """Phase 1: Requirements Clarification — interactive Q&A with the user."""
 
-import google.generativeai as genai
-from config import MODEL_NAME, CLARIFY_SYSTEM_PROMPT
+import llm
+from config import CLARIFY_SYSTEM_PROMPT
+from phases import steps
+from phases.context import BuildContext
 
 MAX_ROUNDS = 5
 CLEAR_TOKEN = "REQUIREMENTS_CLEAR"
+DEFAULT_REPLY = "Looks good, proceed with your best judgment."
+SUMMARY_PROMPT = (
+    "Please summarize the final requirements now. Output REQUIREMENTS_CLEAR "
+    "followed by the summary."
+)
 
 
-def run(game_idea: str) -> tuple[str, list[dict]]:
+def run(game_idea: str, ctx: BuildContext | None = None) -> tuple[str, list[dict]]:
     """Run the clarification phase.
 
     Returns:
         (requirements_summary, conversation_history)
     """
-    model = genai.GenerativeModel(
-        MODEL_NAME,
-        system_instruction=CLARIFY_SYSTEM_PROMPT,
-    )
-    chat = model.start_chat()
+    ctx = ctx or BuildContext()
+    chat = _new_chat(ctx)
 
     print("\n" + "=" * 60)
     print("PHASE 1: Requirements Clarification")
     print("=" * 60)
 
     # Send the initial game idea
-    response = chat.send_message(f"Game idea: {game_idea}")
-    assistant_text = response.text
+    assistant_text = chat.send(f"Game idea: {game_idea}").text
 
     for round_num in range(1, MAX_ROUNDS + 1):
         # Check if the agent is satisfied
@@ -33,37 +36,34 @@ def run(game_idea: str) -> tuple[str, list[dict]]:
             summary = _extract_summary(assistant_text)
             print(f"\n[Requirements clarified after {round_num} round(s)]\n")
             print(summary)
-            return summary, _history_to_dicts(chat.history)
+            return summary, chat.history
 
         # Show the agent's questions and get user input
         print(f"\n--- Round {round_num} ---")
         print(f"Agent: {assistant_text}\n")
         user_input = input("You: ").strip()
         if not user_input:
-            user_input = "Looks good, proceed with your best judgment."
+            user_input = DEFAULT_REPLY
 
-        response = chat.send_message(user_input)
-        assistant_text = response.text
+        assistant_text = chat.send(user_input).text
 
     # Hard cap reached — force extraction
     print(f"\n[Max rounds ({MAX_ROUNDS}) reached, proceeding with current info]\n")
     # Ask for a final summary
-    response = chat.send_message(
-        "Please summarize the final requirements now. Output REQUIREMENTS_CLEAR "
-        "followed by the summary."
-    )
-    summary = _extract_summary(response.text)
+    summary = _extract_summary(chat.send(SUMMARY_PROMPT).text)
     print(summary)
-    return summary, _history_to_dicts(chat.history)
+    return summary, chat.history
 
 
-def run_web(game_idea: str, history=None, user_reply=None):
+def run_web(game_idea: str, history=None, user_reply=None,
+            ctx: BuildContext | None = None):
     """Run clarification for the web UI (non-interactive).
 
     Args:
         game_idea: The original game idea text.
         history: Existing Gemini chat history dicts, or None for first call.
         user_reply: The user's reply to continue the conversation, or None.
+        ctx: Build context supplying model settings; a default one if None.
 
     Returns:
         (response_text, is_clear, requirements_summary, history_dicts)
@@ -72,51 +72,56 @@ def run_web(game_idea: str, history=None, user_reply=None):
         - requirements_summary: The extracted summary (only when is_clear)
         - history_dicts: Serializable conversation history for next call
     """
-    model = genai.GenerativeModel(
-        MODEL_NAME,
-        system_instruction=CLARIFY_SYSTEM_PROMPT,
-    )
-
-    if history:
-        chat = model.start_chat(history=_rebuild_history(history))
-    else:
-        chat = model.start_chat()
-
-    if user_reply:
-        response = chat.send_message(user_reply)
-    else:
-        response = chat.send_message(f"Game idea: {game_idea}")
-
-    assistant_text = response.text
-    history_dicts = _history_to_dicts(chat.history)
-
-    if CLEAR_TOKEN in assistant_text:
-        summary = _extract_summary(assistant_text)
-        return summary, True, summary, history_dicts
-
-    # Check if we've hit the max rounds
-    round_count = sum(1 for m in history_dicts if m["role"] == "model")
-    if round_count >= MAX_ROUNDS:
-        response = chat.send_message(
-            "Please summarize the final requirements now. Output REQUIREMENTS_CLEAR "
-            "followed by the summary."
-        )
-        summary = _extract_summary(response.text)
-        history_dicts = _history_to_dicts(chat.history)
-        return summary, True, summary, history_dicts
-
-    return assistant_text, False, None, history_dicts
-
-
-def _rebuild_history(history: list[dict]) -> list:
-    """Rebuild history dicts into Gemini Content format."""
-    from google.generativeai.types import content_types
-    contents = []
-    for msg in history:
-        contents.append(content_types.to_content(
-            {"role": msg["role"], "parts": msg["parts"]}
-        ))
-    return contents
+    return steps.call(_web(game_idea, history, user_reply, ctx or BuildContext()))
+
+
+async def run_web_async(game_idea: str, history=None, user_reply=None,
+                        ctx: BuildContext | None = None):
+    """``run_web`` for coroutines; same arguments and result."""
+    return await steps.call_async(_web(game_idea, history, user_reply, ctx or BuildContext()))
+
+
+def _web(game_idea: str, history: list[dict] | None, user_reply: str | None,
+         ctx: BuildContext):
+    """One web clarification turn as a step (``phases.steps``)."""
+    with ctx.span("clarify", round=_round(history)):
+        chat = _chat_for(history, ctx)
+        assistant_text = (yield steps.Send(chat, user_reply or f"Game idea: {game_idea}")).text
+
+        history_dicts = chat.history
+
+        if CLEAR_TOKEN in assistant_text:
+            summary = _extract_summary(assistant_text)
+            return summary, True, summary, history_dicts
+
+        # Check if we've hit the max rounds
+        round_count = sum(1 for m in history_dicts if m["role"] == "model")
+        if round_count >= MAX_ROUNDS:
+            summary = _extract_summary((yield steps.Send(chat, SUMMARY_PROMPT)).text)
+            history_dicts = chat.history
+            return summary, True, summary, history_dicts
+
+        if ctx.session_id:
+            llm.chat_pool.put(ctx.session_id, chat)
+        return assistant_text, False, None, history_dicts
+
+
+def _round(history: list[dict] | None) -> int:
+    return sum(1 for m in history or [] if m["role"] == "model") + 1
+
+
+def _chat_for(history: list[dict] | None, ctx: BuildContext) -> llm.Chat:
+    """Reuse the live chat from the previous turn; rebuild from dicts on a miss."""
+    chat = None
+    if ctx.session_id and history:
+        chat = llm.chat_pool.take(ctx.session_id, history, ctx)
+    return chat or _new_chat(ctx, history)
+
+
+def _new_chat(ctx: BuildContext, history: list[dict] | None = None) -> llm.Chat:
+    """Clarification chat configured from the build context."""
+    return llm.Chat(ctx, "clarify", CLARIFY_SYSTEM_PROMPT,
+                    ctx.generation_config("clarify"), history)
 
 
 def _extract_summary(text: str) -> str:
@@ -125,14 +130,3 @@ def _extract_summary(text: str) -> str:
         parts = text.split(CLEAR_TOKEN, 1)
         return parts[1].strip() if len(parts) > 1 else text
     return text
-
-
-def _history_to_dicts(history) -> list[dict]:
-    """Convert Gemini chat history to serializable dicts."""
-    result = []
-    for msg in history:
-        result.append({
-            "role": msg.role,
-            "parts": [p.text for p in msg.parts],
-        })
-    return result
@@ -0,0 +1,100 @@
+"""Context compaction — trim the history one phase hands to the next.
+
+Clarification Q&A is already captured by the requirements summary, and the
+plan turn is re-sent verbatim in the execute prompt, so carrying them in
+full makes every later call pay for the same tokens twice. Compaction
+replaces model turns that the next prompt repeats with a short stub, then
+drops the oldest middle exchanges until the history fits the token budget.
+"""
+
+import json
+import re
+
+from config import COMPACT_ENABLED, COMPACT_TOKEN_BUDGET
+
+# Rough Gemini tokenizer ratio for English prose and code; exact counts
+# would cost an API round-trip per phase.
+CHARS_PER_TOKEN = 4
+STUB = "(Omitted here — repeated in full in the next message.)"
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the token count of ``text``."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def history_tokens(history: list[dict]) -> int:
+    """Estimate the token count of a history."""
+    return sum(count_tokens(p) for msg in history for p in msg["parts"])
+
+
+def for_plan(history: list[dict], requirements: str, prompt: str,
+             budget: int = COMPACT_TOKEN_BUDGET) -> tuple[list[dict], dict]:
+    """Compact the clarification history before the planning call."""
+    summary = (requirements or "").strip()
+    return _compact("plan", history, prompt, budget,
+                    lambda text: bool(summary) and summary in text)
+
+
+def for_execute(history: list[dict], plan: dict, prompt: str,
+                budget: int = COMPACT_TOKEN_BUDGET) -> tuple[list[dict], dict]:
+    """Compact the clarify + plan history before the code generation call."""
+    return _compact("execute", history, prompt, budget,
+                    lambda text: _embedded_json(text) == plan)
+
+
+def _compact(phase: str, history: list[dict], prompt: str, budget: int,
+             repeated) -> tuple[list[dict], dict]:
+    """Stub repeated model turns, then drop middle exchanges to fit ``budget``.
+
+    Returns:
+        (compacted_history, report) — the report gives the estimated input
+        tokens (history + prompt) before and after.
+    """
+    before = history_tokens(history) + count_tokens(prompt)
+    report = {"phase": phase, "tokens_before": before, "tokens_after": before,
+              "saved": 0, "stubbed": 0, "dropped": 0}
+    if not COMPACT_ENABLED or not history:
+        return history, report
+
+    compacted = []
+    for msg in history:
+        if msg["role"] == "model" and repeated("\n".join(msg["parts"])):
+            msg = {"role": "model", "parts": [STUB]}
+            report["stubbed"] += 1
+        compacted.append(msg)
+
+    # Exchanges are (user, model) pairs; keep the first (the game idea) and
+    # the last, and drop from the oldest end of the middle.
+    pairs = [compacted[i:i + 2] for i in range(0, len(compacted), 2)]
+    total = history_tokens(compacted) + count_tokens(prompt)
+    while total > budget and len(pairs) > 2:
+        dropped = pairs.pop(1)
+        total -= history_tokens(dropped)
+        report["dropped"] += 1
+
+    compacted = [msg for pair in pairs for msg in pair]
+    if report["dropped"] and len(compacted) > 2:
+        note = (f"[{report['dropped']} earlier clarification exchange(s) omitted — "
+                "the requirements summary covers them.]\n\n")
+        first_user = compacted[2]
+        compacted[2] = {"role": first_user["role"],
+                        "parts": [note + first_user["parts"][0], *first_user["parts"][1:]]}
+
+    after = history_tokens(compacted) + count_tokens(prompt)
+    report.update(tokens_after=after, saved=before - after)
+    print(f"[compact] {phase} input: ~{before:,} → ~{after:,} tokens "
+          f"(saved ~{before - after:,})")
+    return compacted, report
+
+
+def _embedded_json(text: str):
+    """The JSON object in a ```json fence (or bare in the text), or None."""
+    match = (re.search(r"```(?:json)?\s*\n(.*?)```", text, re.DOTALL)
+             or re.search(r"(\{.*\})", text, re.DOTALL))
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
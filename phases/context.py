@@ -0,0 +1,103 @@
+"""Per-build pipeline context — the state a phase needs, without shared globals."""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import config
+import metrics
+from ratelimit import INTERACTIVE
+
+
+@dataclass
+class BuildContext:
+    """Settings and bookkeeping for one build, threaded through every phase.
+
+    Each build gets its own instance, so concurrent builds never share an
+    output directory or mutate module globals.
+    """
+
+    session_id: str | None = None
+    output_dir: str = field(default_factory=lambda: config.OUTPUT_DIR)
+    model_name: str = field(default_factory=lambda: config.MODEL_NAME)
+    # Per-phase GenerationConfig overrides, e.g. {"execute": {"temperature": 0.2}}
+    generation: dict[str, dict] = field(default_factory=dict)
+    # Skip the response cache and always ask the model for new output
+    fresh: bool = False
+    # Phase 3 strategy: "single" response or concurrent "fanout" modules
+    execute_mode: str = field(default_factory=lambda: config.EXECUTE_MODE)
+    # Single-response tail latency: "off", "hedge" or "best_of" (phases/hedge.py)
+    execute_hedge: str = field(default_factory=lambda: config.EXECUTE_HEDGE)
+    # Rate-limiter priority: "interactive" requests go ahead of "bulk" ones
+    priority: str = INTERACTIVE
+    timings: dict[str, float] = field(default_factory=dict)
+    # Per-phase context compaction reports (see phases/compact.py)
+    compaction: dict[str, dict] = field(default_factory=dict)
+    # Model token usage per phase: {"plan": {"input": n, "output": n}}
+    tokens: dict[str, dict] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False,
+                                  compare=False)
+
+    @classmethod
+    def for_session(cls, session_id: str, **kwargs) -> "BuildContext":
+        """Context for a web session, writing into ``OUTPUT_DIR/<session_id>``."""
+        output_dir = os.path.join(config.OUTPUT_DIR, session_id)
+        return cls(session_id=session_id, output_dir=output_dir, **kwargs)
+
+    @property
+    def output_path(self) -> str:
+        return os.path.abspath(self.output_dir)
+
+    def generation_config(self, phase: str, **defaults) -> dict:
+        """The phase's generation settings with this build's overrides applied."""
+        return {**defaults, **self.generation.get(phase, {})}
+
+    def record_tokens(self, phase: str, input_tokens: int, output_tokens: int):
+        """Add one model call's token usage to the phase's totals."""
+        with self._lock:
+            usage = self.tokens.setdefault(phase, {"input": 0, "output": 0})
+            usage["input"] += input_tokens
+            usage["output"] += output_tokens
+
+    def merge(self, other: "BuildContext"):
+        """Take over the timings, compaction reports and token usage of a
+        phase that ran under another context (e.g. a prefetched plan)."""
+        with self._lock:
+            for name, seconds in other.timings.items():
+                self.timings[name] = self.timings.get(name, 0.0) + seconds
+            self.compaction.update(other.compaction)
+        for phase, usage in other.tokens.items():
+            self.record_tokens(phase, usage["input"], usage["output"])
+
+    @contextmanager
+    def timed(self, name: str):
+        """Accumulate the wall time of a block under ``timings[name]``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Trace a pipeline phase; the yielded dict collects extra attributes."""
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.PHASE_SECONDS.observe(duration, phase=name)
+            self.add_span({"name": name, "start": start, "duration": duration, **attrs})
+
+    def add_span(self, span: dict):
+        """Record a finished span in the session's trace (sessions only)."""
+        if self.session_id:
+            metrics.traces.add(self.session_id, span)
@@ -0,0 +1,252 @@
+"""Phase 4 (optional): Edit — change a built game without rebuilding it.
+
+The model gets the plan, the current files and the change request, and
+answers with a unified diff. The diff is applied locally and the result
+checked with ``phases.validate``; only if the patch does not apply, or
+breaks a file that was fine, is the model asked for the complete changed
+files instead. Output tokens, and so latency, follow the size of the
+change rather than the size of the game. The single-file bundle is then
+rebuilt from the result.
+"""
+
+import json
+import os
+import re
+
+import llm
+import metrics
+from config import EDIT_SYSTEM_PROMPT, EDIT_PROMPT, EDIT_FALLBACK_PROMPT
+from phases import bundle, steps, validate
+from phases.context import BuildContext
+from phases.execute import write_file
+from phases.fences import extract_files
+
+
+class PatchError(Exception):
+    """Raised when a diff cannot be parsed or does not match the files."""
+
+
+def run(plan: dict, instruction: str, ctx: BuildContext) -> dict:
+    """Edit the game in ``ctx.output_path``.
+
+    Returns:
+        The final ``done`` event: changed ``files``, ``mode`` ("patch" or
+        "full") and the number of unresolved ``problems``.
+    """
+    result = None
+    for event in run_stream(plan, instruction, ctx):
+        if event["type"] == "done":
+            result = event
+    return result
+
+
+def run_stream(plan: dict, instruction: str, ctx: BuildContext):
+    """Apply one change request to the generated files, streaming progress.
+
+    Yields:
+        ``phase``, ``patch``, ``fallback``, ``validate``/``repair`` and
+        ``file_done`` events, and a final ``done`` event.
+    """
+    return steps.run(_edit(plan, instruction, ctx))
+
+
+def run_stream_async(plan: dict, instruction: str, ctx: BuildContext):
+    """``run_stream`` for coroutines: the same steps and events."""
+    return steps.run_async(_edit(plan, instruction, ctx))
+
+
+def _edit(plan: dict, instruction: str, ctx: BuildContext):
+    """The edit as a step (``phases.steps``)."""
+    output_path = ctx.output_path
+    files = yield steps.Call(read_files, output_path)
+    if not files:
+        raise FileNotFoundError(f"No generated game files in {output_path}")
+
+    with ctx.span("edit") as span:
+        print("\n" + "=" * 60)
+        print("EDIT: " + instruction)
+        print("=" * 60)
+        yield {"type": "phase", "phase": "edit", "status": "started"}
+
+        listing = "\n\n".join(
+            f"{name}:\n```{validate.FILE_LANGS[name]}\n{content}\n```"
+            for name, content in files.items()
+        )
+        chat = llm.Chat(
+            ctx, "edit", EDIT_SYSTEM_PROMPT,
+            ctx.generation_config("edit", temperature=0.2, max_output_tokens=16384),
+        )
+        reply = (yield steps.Send(chat, EDIT_PROMPT.format(
+            plan=json.dumps(plan), files=listing, instruction=instruction))).text
+
+        mode, changed = "patch", {}
+        try:
+            changed = apply_reply(reply, files)
+            yield {"type": "patch", "files": sorted(changed)}
+            _check_patched(files, changed)
+        except PatchError as e:
+            mode = "full"
+            # The model may have answered with whole files instead of a diff
+            changed = extract_files(reply)
+            if not changed:
+                print(f"Patch rejected ({e}) — asking for the complete changed files...")
+                yield {"type": "fallback", "reason": str(e)}
+                fallback = yield steps.Send(chat, EDIT_FALLBACK_PROMPT.format(reason=e))
+                changed = extract_files(fallback.text)
+            if not changed:
+                metrics.EDITS.inc(mode="failed")
+                raise PatchError("the model returned neither a usable diff nor complete files")
+
+        for name, content in changed.items():
+            files[name] = content
+            yield steps.Call(write_file, output_path, name, content)
+            yield {"type": "file_done", "file": name, "content": content}
+
+        def write_repair(name: str, content: str):
+            changed[name] = content
+            write_file(output_path, name, content)
+
+        problems, _ = yield from validate.run(plan, files, ctx, write_repair)
+        report = yield steps.Call(
+            bundle.run, files, lambda name, content: write_file(output_path, name, content))
+
+        metrics.EDITS.inc(mode=mode)
+        span.update(mode=mode, files=sorted(changed), problems=len(problems),
+                    reply_chars=len(reply))
+        yield {"type": "done", "output_path": output_path, "files": sorted(changed),
+               "mode": mode, "problems": len(problems),
+               **({"bundle": report} if report else {})}
+
+
+def read_files(output_path: str) -> dict[str, str]:
+    """The generated game files in an output directory."""
+    files = {}
+    for name in validate.FILE_LANGS:
+        path = os.path.join(output_path, name)
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                files[name] = f.read()
+    return files
+
+
+def apply_reply(reply: str, files: dict[str, str]) -> dict[str, str]:
+    """Apply the diff in a model reply; returns the changed files' new content."""
+    blocks = re.findall(r"```(?:diff|patch)[ \t]*\n(.*?)```", reply, re.S)
+    if not blocks:
+        raise PatchError("the reply has no ```diff block")
+    patches = parse_diff("\n".join(blocks))
+    changed = {}
+    for name, hunks in patches.items():
+        if name not in validate.FILE_LANGS:
+            raise PatchError(f"the diff changes '{name}', which is not a game file")
+        changed[name] = apply_hunks(changed.get(name, files.get(name, "")), hunks, name)
+    if not changed:
+        raise PatchError("the diff is empty")
+    return changed
+
+
+def parse_diff(text: str) -> dict[str, list[dict]]:
+    """Parse a unified diff into ``{file: [hunk]}``.
+
+    A hunk is ``{"line": start line of the old text, "old": [...], "new": [...]}``.
+    Line numbers are only a hint (see ``apply_hunks``), and a blank line
+    inside a hunk counts as blank context, as models often drop the space.
+    """
+    patches: dict[str, list[dict]] = {}
+    current, hunk = None, None
+    for line in text.split("\n"):
+        if line.startswith("--- "):
+            hunk = None
+            continue
+        if line.startswith("+++ "):
+            current = _diff_path(line[4:])
+            patches.setdefault(current, [])
+            hunk = None
+            continue
+        header = re.match(r"@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@", line)
+        if header:
+            if current is None:
+                raise PatchError("hunk before a +++ file header")
+            hunk = {"line": int(header.group(1)), "old": [], "new": []}
+            patches[current].append(hunk)
+            continue
+        if hunk is None or line.startswith("\\"):
+            continue  # preamble, or "\ No newline at end of file"
+        tag, body = line[:1], line[1:]
+        if tag in (" ", ""):
+            hunk["old"].append(body)
+            hunk["new"].append(body)
+        elif tag == "-":
+            hunk["old"].append(body)
+        elif tag == "+":
+            hunk["new"].append(body)
+        else:
+            raise PatchError(f"unexpected diff line: {line[:60]!r}")
+    for hunks in patches.values():
+        for hunk in hunks:
+            _trim_blank_edges(hunk)
+    return {name: hunks for name, hunks in patches.items() if hunks}
+
+
+def apply_hunks(content: str, hunks: list[dict], name: str) -> str:
+    """Apply hunks, locating each by its old text rather than its line number.
+
+    Models often miscount lines, so each hunk's old text is searched for
+    (exactly, then ignoring whitespace) and the match nearest the stated
+    line wins.
+    """
+    lines = content.split("\n")
+    offset = 0
+    for hunk in hunks:
+        hint = max(0, hunk["line"] - 1 + offset)
+        pos = _locate(lines, hunk["old"], hint)
+        if pos is None:
+            first = next((line for line in hunk["old"] if line.strip()), "")
+            raise PatchError(f"a hunk near {name} line {hunk['line']} does not match "
+                             f"the file (looking for {first.strip()[:60]!r})")
+        lines[pos:pos + len(hunk["old"])] = hunk["new"]
+        offset += len(hunk["new"]) - len(hunk["old"])
+    return "\n".join(lines)
+
+
+def _check_patched(files: dict[str, str], changed: dict[str, str]):
+    """Reject a patch that leaves a changed file with more problems than before."""
+    before = validate.by_file(validate.check(files))
+    after = validate.by_file(validate.check({**files, **changed}))
+    for name in changed:
+        if len(after.get(name, [])) > len(before.get(name, [])):
+            problem = after[name][0]
+            where = f" line {problem['line']}" if problem["line"] else ""
+            raise PatchError(f"the patched {name} fails a static check:{where} "
+                             f"{problem['message']}")
+
+
+def _locate(lines: list[str], old: list[str], hint: int) -> int | None:
+    if not old:
+        return min(hint, len(lines))
+    for normalize in (lambda s: s, lambda s: "".join(s.split())):
+        target = [normalize(line) for line in old]
+        first = target[0]
+        matches = [i for i in range(len(lines) - len(old) + 1)
+                   if normalize(lines[i]) == first
+                   and [normalize(line) for line in lines[i:i + len(old)]] == target]
+        if matches:
+            return min(matches, key=lambda i: abs(i - hint))
+    return None
+
+
+def _trim_blank_edges(hunk: dict):
+    """Drop blank context at a hunk's ends, which a model may add or omit."""
+    old, new = hunk["old"], hunk["new"]
+    while old and new and old[0] == new[0] == "":
+        old.pop(0)
+        new.pop(0)
+        hunk["line"] += 1
+    while old and new and old[-1] == new[-1] == "":
+        old.pop()
+        new.pop()
+
+
+def _diff_path(path: str) -> str:
+    path = path.split("\t")[0].strip()
+    return re.sub(r"^[ab]/", "", path)
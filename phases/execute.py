@@ -2,94 +2,364 @@
 
 import json
 import os
-import re
+import threading
 
-import google.generativeai as genai
-from config import MODEL_NAME, EXECUTE_SYSTEM_PROMPT, RETRY_PROMPT, OUTPUT_DIR
+import llm
+import metrics
+from config import (
+    EXECUTE_SYSTEM_PROMPT, FANOUT_SYSTEM_PROMPT, SKELETON_PROMPT, RETRY_PROMPT,
+    CONTINUE_PROMPT, MAX_CONTINUATIONS, SKELETONS_ENABLED,
+)
+from phases import bundle, compact, fanout, hedge, skeletons, steps, validate
+from phases.context import BuildContext
+from phases.fences import CONTINUE_TAIL_CHARS, FenceParser, extract_files, strip_overlap
 
+# A game.js shorter than this is treated as missing
+MIN_GAME_JS_CHARS = 200
+# How much of a continuation to buffer before trimming a repeated overlap
+CONTINUE_HEAD_CHARS = 800
 
-def run(plan: dict, history: list[dict]) -> str:
+# How often each recovery path is taken, across all builds in this process
+recovery_stats = {"complete": 0, "continued": 0, "continuations": 0, "regenerated": 0}
+_stats_lock = threading.Lock()
+
+
+def run(plan: dict, history: list[dict], ctx: BuildContext | None = None) -> str:
     """Run the execution phase.
 
     Returns:
         Path to the output directory containing generated files.
     """
-    model = genai.GenerativeModel(
-        MODEL_NAME,
-        system_instruction=EXECUTE_SYSTEM_PROMPT,
-        generation_config=genai.GenerationConfig(
-            temperature=0.7,
-            max_output_tokens=16384,
-        ),
-    )
-    chat = model.start_chat(history=_rebuild_history(history))
+    output_path = None
+    for event in run_stream(plan, history, ctx):
+        if event["type"] == "done":
+            output_path = event["output_path"]
+    return output_path
+
+
+def run_stream(plan: dict, history: list[dict], ctx: BuildContext | None = None):
+    """Run the execution phase, streaming the model response.
+
+    Each file is written as soon as its fenced block closes, so callers see
+    progress after the first tokens instead of after the whole generation.
+
+    If a skeleton (``phases.skeletons``) fits the plan, its boilerplate is
+    used as is and the model writes only the game-specific hooks. A single
+    response may be hedged or generated best-of-N (``phases.hedge``).
+
+    Once generated, the files are checked offline (``phases.validate``) and
+    each failing file is repaired on its own.
+
+    Yields:
+        Event dicts: ``phase``, the ``FenceParser`` file events, ``validate``
+        and ``repair`` events, and a final ``done`` event carrying
+        ``output_path``, ``files`` and the number of unresolved ``problems``.
+    """
+    return steps.run(_execute(plan, history, ctx or BuildContext()))
+
+
+async def run_async(plan: dict, history: list[dict], ctx: BuildContext | None = None) -> str:
+    """``run`` for coroutines; returns the output directory."""
+    output_path = None
+    async for event in run_stream_async(plan, history, ctx):
+        if event["type"] == "done":
+            output_path = event["output_path"]
+    return output_path
+
+
+def run_stream_async(plan: dict, history: list[dict], ctx: BuildContext | None = None):
+    """``run_stream`` for coroutines: the same steps and events.
+
+    Model calls use the backend's async API and files are written from a
+    worker thread, so the event loop is never blocked for long.
+    """
+    return steps.run_async(_execute(plan, history, ctx or BuildContext()))
+
 
+def _execute(plan: dict, history: list[dict], ctx: BuildContext):
+    """The execution phase as a step (``phases.steps``)."""
+    with ctx.span("execute", mode=ctx.execute_mode) as span:
+        output_path = ctx.output_path
+        yield steps.Call(os.makedirs, output_path, exist_ok=True)
+        yield {"type": "phase", "phase": 3, "status": "started"}
+        prompt, context, skeleton = _begin(plan, history, ctx, span)
+
+        if skeleton:
+            files = yield from _from_skeleton(plan, skeleton, context, ctx)
+            if _skeleton_used(skeleton, files, ctx, span):
+                yield from _finish(plan, files, ctx, span, skeleton=skeleton.name)
+                return
+
+        if ctx.execute_mode == "fanout" and plan.get("entities"):
+            print("\nGenerating game modules concurrently...")
+            files = {}
+
+            def write(name: str, content: str):
+                files[name] = content
+                write_file(output_path, name, content)
+
+            yield from fanout.generate(plan, context, ctx, write)
+            if len(files.get("game.js", "")) >= MIN_GAME_JS_CHARS:
+                yield from _finish(plan, files, ctx, span)
+                return
+            print("Fan-out produced no usable game.js — falling back to a single response...")
+            span["mode"] = "single"
+
+        parser = FenceParser()
+        if ctx.execute_hedge == "best_of":
+            span["hedge"] = "best_of"
+            chat = yield from hedge.best_of(_chats(context, ctx), prompt, _judge)
+            yield from _written(parser.feed(chat.last.text), output_path)
+        else:
+            chat = _chat(context, ctx, span)
+            yield from _stream_files(chat, prompt, parser, output_path)
+
+        # Output limit hit mid-file: ask the model to pick up where it stopped
+        continuations = 0
+        while chat.last.finish_reason == "MAX_TOKENS" and continuations < MAX_CONTINUATIONS:
+            continuations += 1
+            print(f"Response hit the output limit — continuing "
+                  f"({continuations}/{MAX_CONTINUATIONS})...")
+            yield {"type": "continue", "attempt": continuations, "file": parser.open_file}
+            yield from _continue(chat, parser, output_path)
+        yield from _written(parser.close(), output_path)
+        files = parser.files
+
+        # Regenerate only if game.js is still missing or too short
+        recovery = "continued" if continuations else "complete"
+        if len(files.get("game.js", "")) < MIN_GAME_JS_CHARS:
+            recovery = "regenerated"
+            print("game.js too short or missing — requesting regeneration...")
+            yield {"type": "retry", "file": "game.js"}
+            retry_parser = FenceParser()
+            yield from _stream_files(chat, RETRY_PROMPT, retry_parser, keep=_game_js)
+            yield from _written(retry_parser.close(), keep=_game_js)
+            if retry_parser.files.get("game.js"):
+                files["game.js"] = retry_parser.files["game.js"]
+                yield steps.Call(write_file, output_path, "game.js", files["game.js"])
+
+        _record_recovery(recovery, continuations, span)
+        yield from _finish(plan, files, ctx, span, recovery=recovery)
+
+
+def _begin(plan: dict, history: list[dict], ctx: BuildContext, span: dict):
+    """The generation prompt, the history compacted for it, and the matching
+    skeleton (or None)."""
     print("\n" + "=" * 60)
     print("PHASE 3: Code Generation")
     print("=" * 60)
 
     prompt = (
-        f"Here is the game plan:\n\n```json\n{json.dumps(plan, indent=2)}\n```\n\n"
+        f"Here is the game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n"
         "Generate the complete game now as index.html, style.css, and game.js."
     )
+    context, ctx.compaction["execute"] = compact.for_execute(history, plan, prompt)
+
+    skeleton = skeletons.match(plan) if SKELETONS_ENABLED else None
+    if skeleton:
+        print(f"\nBuilding on the '{skeleton.name}' skeleton — generating the game code...")
+        span.update(mode="skeleton", skeleton=skeleton.name)
+    return prompt, context, skeleton
+
+
+def _skeleton_used(skeleton: skeletons.Skeleton, files: dict[str, str], ctx: BuildContext,
+                   span: dict) -> bool:
+    """Whether the skeleton build produced a game.js; if not, fall back."""
+    if "game.js" in files:
+        metrics.SKELETON_BUILDS.inc(skeleton=skeleton.name, outcome="used")
+        return True
+    metrics.SKELETON_BUILDS.inc(skeleton=skeleton.name, outcome="fallback")
+    span["mode"] = ctx.execute_mode
+    return False
+
+
+def _chat(context: list[dict], ctx: BuildContext, span: dict) -> llm.Chat | hedge.HedgedChat:
     print("\nGenerating game code (this may take a moment)...")
-    response = chat.send_message(prompt)
-    code_text = response.text
-
-    # Extract the three files
-    files = _extract_files(code_text)
-
-    # Retry if game.js is missing or too short
-    if not files.get("game.js") or len(files["game.js"]) < 200:
-        print("game.js too short or missing — requesting regeneration...")
-        response = chat.send_message(RETRY_PROMPT)
-        js_match = re.search(
-            r"```(?:js|javascript)\s*\n(.*?)```", response.text, re.DOTALL
+    if ctx.execute_hedge == "hedge":
+        span["hedge"] = "hedge"
+        return hedge.HedgedChat(_chats(context, ctx))
+    return _chats(context, ctx)()
+
+
+def _chats(context: list[dict], ctx: BuildContext):
+    """A factory of generation chats over ``context``, by phase name."""
+    def make(phase: str = "execute") -> llm.Chat:
+        return llm.Chat(
+            ctx, phase, EXECUTE_SYSTEM_PROMPT,
+            ctx.generation_config("execute", temperature=0.7, max_output_tokens=16384),
+            context,
         )
-        if js_match:
-            files["game.js"] = js_match.group(1).strip()
+    return make
 
-    # Write files to output directory
-    output_path = os.path.abspath(OUTPUT_DIR)
-    os.makedirs(output_path, exist_ok=True)
 
-    for filename, content in files.items():
-        filepath = os.path.join(output_path, filename)
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
-        print(f"  Written: {filepath} ({len(content)} chars)")
+def _judge(reply: llm.Reply) -> tuple[bool, tuple]:
+    """Whether a best-of-N reply can be used as it is, and its rank otherwise
+    (lower is better): complete, then with a usable game.js, then fewest problems."""
+    files = extract_files(reply.text)
+    truncated = reply.finish_reason == "MAX_TOKENS"
+    short = len(files.get("game.js", "")) < MIN_GAME_JS_CHARS
+    problems = validate.check(files)
+    passed = not (truncated or short or problems) and set(files) >= set(skeletons.FILES)
+    return passed, (truncated, short, len(problems), -len(files))
 
-    return output_path
+
+def _record_recovery(recovery: str, continuations: int, span: dict):
+    with _stats_lock:
+        recovery_stats[recovery] += 1
+        recovery_stats["continuations"] += continuations
+    metrics.EXECUTE_RECOVERIES.inc(recovery=recovery)
+    if continuations:
+        metrics.EXECUTE_CONTINUATIONS.inc(continuations)
+    span.update(recovery=recovery, continuations=continuations)
+
+
+def _finish(plan: dict, files: dict[str, str], ctx: BuildContext, span: dict, **done):
+    """Validate and repair the generated files, bundle them, then yield the
+    ``done`` event."""
+    output_path = ctx.output_path
+
+    def write(name: str, content: str):
+        write_file(output_path, name, content)
+
+    problems, repairs = yield from validate.run(plan, files, ctx, write)
+    report = yield steps.Call(bundle.run, files, write)
+    yield _done(files, problems, repairs, ctx, span, report, **done)
+
+
+def _done(files: dict[str, str], problems: list[dict], repairs: int, ctx: BuildContext,
+          span: dict, report: dict | None, **done) -> dict:
+    span.update(repairs=repairs, problems=len(problems),
+                files_chars=sum(len(c) for c in files.values()))
+    if report:
+        span.update(bundle_bytes=report["bundle_bytes"])
+        done["bundle"] = report
+    return {"type": "done", "output_path": ctx.output_path, "files": sorted(files),
+            "problems": len(problems), **done}
+
+
+def _from_skeleton(plan: dict, skeleton: skeletons.Skeleton, history: list[dict],
+                   ctx: BuildContext):
+    """Write the skeleton's page files, then stream the model's hooks into game.js.
+
+    Returns:
+        The files written. No game.js is written if the reply was cut off
+        or lacks a required hook, so that the caller falls back to full
+        generation.
+    """
+    shown = skeletons.render(skeleton, plan)
+    events = [{"type": "file_done", "file": name, "content": shown[name]}
+              for name in ("index.html", "style.css")]
+    yield from _written(events, ctx.output_path)
+
+    chat, prompt = _hooks_chat(plan, skeleton, shown, history, ctx)
+    parser = FenceParser()
+    yield from _stream_files(chat, prompt, parser, keep=_hooks_progress)
+    yield from _written(parser.close(), keep=_hooks_progress)
+    events.append(_hooked(plan, skeleton, chat, parser.files.get("game.js", "")))
+    yield from _written(events[-1:], ctx.output_path)
+    return {event["file"]: event["content"] for event in events
+            if event["type"] == "file_done"}
+
+
+def _hooks_chat(plan: dict, skeleton: skeletons.Skeleton, shown: dict[str, str],
+                history: list[dict], ctx: BuildContext) -> tuple[llm.Chat, str]:
+    chat = llm.Chat(
+        ctx, "execute.hooks", FANOUT_SYSTEM_PROMPT,
+        ctx.generation_config("execute", temperature=0.7, max_output_tokens=8192),
+        history,
+    )
+    prompt = SKELETON_PROMPT.format(
+        plan=json.dumps(plan), description=skeleton.description,
+        marker=skeletons.HOOKS_MARKER, skeleton=shown["game.js"],
+        hooks="\n".join(f"- {hook}" for hook in skeleton.hooks),
+    )
+    return chat, prompt
+
+
+def _hooked(plan: dict, skeleton: skeletons.Skeleton, chat: llm.Chat, code: str) -> dict:
+    """The assembled game.js as a ``file_done`` event, or a ``retry`` event if
+    the hooks were cut off or incomplete."""
+    missing = skeletons.missing_hooks(skeleton, code)
+    if chat.last.finish_reason == "MAX_TOKENS" or missing:
+        reason = "was cut off" if chat.last.finish_reason == "MAX_TOKENS" \
+            else f"lacks {', '.join(missing)}"
+        print(f"Skeleton game code {reason} — falling back to full generation...")
+        return {"type": "retry", "file": "game.js"}
+    return {"type": "file_done", "file": "game.js",
+            "content": skeletons.render(skeleton, plan, hooks=code)["game.js"]}
+
+
+def _stream_files(chat: llm.Chat, prompt: str, parser: FenceParser,
+                  output_path: str | None = None, keep=None):
+    """Send ``prompt`` with streaming on and pass the parser's events on (see
+    ``_written``).
+
+    The parser is not closed: a trailing partial line stays buffered, so
+    that a continuation can finish it.
+    """
+    stream = steps.Stream(chat, prompt)
+    while (text := (yield stream)) is not None:
+        yield from _written(parser.feed(text), output_path, keep)
+
+
+def _continue(chat: llm.Chat, parser: FenceParser, output_path: str):
+    """Stream a continuation of a cut-off response into the same parser.
+
+    The start of the reply is buffered so that a reopened fence or a repeat
+    of the quoted tail can be trimmed before it reaches the parser.
+    """
+    tail = chat.last.text[-CONTINUE_TAIL_CHARS:]
+    in_block = parser.open_file is not None
+    head = ""
+    stream = steps.Stream(chat, CONTINUE_PROMPT.format(tail=tail))
+    while (text := (yield stream)) is not None:
+        if head is None:
+            yield from _written(parser.feed(text), output_path)
+            continue
+        head += text
+        if len(head) >= CONTINUE_HEAD_CHARS:
+            yield from _written(parser.feed(strip_overlap(head, tail, in_block)), output_path)
+            head = None
+    if head:
+        yield from _written(parser.feed(strip_overlap(head, tail, in_block)), output_path)
+
+
+def _written(events, output_path: str | None = None, keep=None):
+    """Pass on the events ``keep(event)`` accepts (all by default), writing
+    each file into ``output_path``, if given, as its block closes."""
+    for event in events:
+        if keep and not keep(event):
+            continue
+        if output_path and event["type"] == "file_done":
+            yield steps.Call(write_file, output_path, event["file"], event["content"])
+        yield event
+
+
+def _game_js(event: dict) -> bool:
+    return event.get("file") == "game.js"
+
+
+def _hooks_progress(event: dict) -> bool:
+    """The hooks stream as game.js progress; the file itself is assembled after."""
+    return event.get("file") == "game.js" and event["type"] != "file_done"
+
+
+def write_file(output_path: str, filename: str, content: str):
+    """Write one generated file into the output directory.
+
+    The file is replaced rather than written in place: once packaged it is
+    a hardlink into the artifact store, shared with other builds.
+    """
+    filepath = os.path.join(output_path, filename)
+    data = content.encode("utf-8")
+    tmp = f"{filepath}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, filepath)
+    metrics.BYTES_WRITTEN.inc(len(data))
+    print(f"  Written: {filepath} ({len(content)} chars)")
 
 
 def _extract_files(text: str) -> dict[str, str]:
     """Extract index.html, style.css, and game.js from fenced code blocks."""
-    files = {}
-
-    # index.html
-    html_match = re.search(r"```html\s*\n(.*?)```", text, re.DOTALL)
-    if html_match:
-        files["index.html"] = html_match.group(1).strip()
-
-    # style.css
-    css_match = re.search(r"```css\s*\n(.*?)```", text, re.DOTALL)
-    if css_match:
-        files["style.css"] = css_match.group(1).strip()
-
-    # game.js
-    js_match = re.search(r"```(?:js|javascript)\s*\n(.*?)```", text, re.DOTALL)
-    if js_match:
-        files["game.js"] = js_match.group(1).strip()
-
-    return files
-
-
-def _rebuild_history(history: list[dict]) -> list:
-    """Rebuild history into Gemini Content format."""
-    from google.generativeai.types import content_types
-    contents = []
-    for msg in history:
-        contents.append(content_types.to_content(
-            {"role": msg["role"], "parts": msg["parts"]}
-        ))
-    return contents
+    return extract_files(text)
@@ -0,0 +1,248 @@
+"""Fan-out code generation — build game.js from concurrently generated modules.
+
+One response for all three files decodes ~16k tokens serially. Here a short
+interface comes first: canvas setup, constants, the input state and the
+shared ``game`` object, declarations only. Every other part of game.js is
+then generated in parallel against it — one class per plan entity plus the
+input, HUD and main-loop subsystems — while the page (index.html +
+style.css) is written alongside from the start. Build time follows the
+interface plus the slowest module rather than the sum of all of them.
+
+A part cut off by the output limit is continued, up to
+``MAX_CONTINUATIONS`` times. If a part is still incomplete or empty, no
+game.js is produced, and the build falls back to a single response instead
+of assembling truncated code.
+"""
+
+import json
+import re
+
+import llm
+import metrics
+from config import CONTINUE_PROMPT, FANOUT_SYSTEM_PROMPT, FANOUT_WORKERS, MAX_CONTINUATIONS
+from phases import steps
+from phases.context import BuildContext
+from phases.fences import CONTINUE_TAIL_CHARS, extract_files, strip_overlap
+
+ENTITY_INTERFACE = "constructor(game), update(dt) with dt in seconds, and draw(ctx)"
+# The parts of game.js besides the entity classes, in assembly order. Function
+# declarations are hoisted, so the parts may call each other in any order;
+# "loop" comes last because it starts the game at top level.
+SUBSYSTEMS = {
+    "input": ("listeners for the plan's controls that keep `keys` current and drive "
+              "the state machine, and `startGame()`, which resets `game` for a new "
+              "round and creates its entities"),
+    "hud": ("`drawHud(ctx)`, drawing the score display while playing and the "
+            "menu / start and game-over screens"),
+    "loop": ("`updateGame(dt)` (spawning, each entity's update, collisions, scoring, "
+             "difficulty and state changes) and `drawGame(ctx)` (clear the canvas, "
+             "draw every entity, then call `drawHud(ctx)`), followed by the "
+             "requestAnimationFrame main loop calling both, started at the end"),
+}
+
+
+def modules_for(plan: dict) -> list[dict]:
+    """One module per plan entity, named by a unique JS class name."""
+    modules, seen = [], set()
+    for entity in plan.get("entities", []):
+        name = _class_name(entity.get("name", "")) or "Entity"
+        while name in seen:
+            name += "_"
+        seen.add(name)
+        modules.append({"name": name, "entity": entity})
+    return modules
+
+
+def generate(plan: dict, history: list[dict], ctx: BuildContext, write):
+    """Generate the game's files concurrently, as a step (``phases.steps``).
+
+    Each file is passed to ``write(filename, content)`` before its
+    ``file_done`` event.
+
+    Yields:
+        ``fanout`` / ``module_done`` progress events, ``module_failed`` for a
+        part that could not be completed, and a ``file_done`` event per file,
+        in the same shape as ``FenceParser`` events.
+    """
+    modules = modules_for(plan)
+    yield {"type": "fanout", "modules": ["interface"] + _parts(modules)}
+
+    code: dict[str, str] = {}
+    parts = steps.Group(FANOUT_WORKERS)
+    parts.add("page", _generate(ctx, "execute.page", history, _page_prompt(plan)))
+    parts.add("interface", _generate(ctx, "execute.interface", history,
+                                     _interface_prompt(plan, modules)))
+    try:
+        while parts:
+            part, text = yield parts
+            event, files = _received(part, text)
+            yield event
+            if files is None:
+                return
+            if part == "page":
+                for filename in ("index.html", "style.css"):
+                    yield steps.Call(write, filename, files[filename])
+                    yield {"type": "file_done", "file": filename, "content": files[filename]}
+                continue
+
+            code[part] = files["game.js"]
+            if part == "interface":
+                for name, prompt in _module_prompts(plan, modules, code[part]):
+                    parts.add(name, _generate(ctx, "execute.module", history, prompt))
+    finally:
+        parts.cancel()
+
+    game = assemble(plan, modules, code)
+    yield steps.Call(write, "game.js", game)
+    yield {"type": "file_done", "file": "game.js", "content": game}
+
+
+def assemble(plan: dict, modules: list[dict], code: dict[str, str]) -> str:
+    """Stitch the interface, entity classes and subsystems into game.js in a
+    fixed order; the main loop comes last, once every class is declared."""
+    title = plan.get("title", "Game")
+    sections = [f"// {title} — game.js (assembled from generated modules)",
+                f"// ── Interface: setup, constants and shared state ──\n"
+                f"{code['interface'].strip()}"]
+    for module in modules:
+        sections.append(f"// ── Entity: {module['name']} ──\n{code[module['name']].strip()}")
+    for name in SUBSYSTEMS:
+        sections.append(f"// ── Subsystem: {name} ──\n{code[name].strip()}")
+    return "\n\n".join(sections) + "\n"
+
+
+def _parts(modules: list[dict]) -> list[str]:
+    """Names of the parts generated against the interface."""
+    return [m["name"] for m in modules] + list(SUBSYSTEMS)
+
+
+def _received(part: str, text: str | None) -> tuple[dict, dict[str, str] | None]:
+    """The progress event for a finished part, and its files — None if the
+    reply was cut off or lacks the files the part must produce."""
+    needed = ("index.html", "style.css") if part == "page" else ("game.js",)
+    files = extract_files(text) if text is not None else {}
+    if text is None or not all(files.get(name) for name in needed):
+        reason = "was cut off" if text is None else "came back empty"
+        print(f"Fan-out part '{part}' {reason} — abandoning fan-out...")
+        return {"type": "module_failed", "module": part}, None
+    if part == "page":
+        return {"type": "module_done", "module": part,
+                "chars": sum(len(files[name]) for name in needed)}, files
+    return {"type": "module_done", "module": part, "chars": len(files["game.js"])}, files
+
+
+def _module_prompts(plan: dict, modules: list[dict], interface: str):
+    """``(part, prompt)`` for every part written against the interface."""
+    for module in modules:
+        yield module["name"], _module_prompt(plan, module, modules, interface)
+    for name in SUBSYSTEMS:
+        yield name, _subsystem_prompt(plan, name, modules, interface)
+
+
+def _page_prompt(plan: dict) -> str:
+    return (
+        f"Game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n"
+        "Write index.html and style.css for this game, as ```html and ```css "
+        "blocks. index.html must contain a <canvas id=\"game\"> and link "
+        "style.css and game.js via relative paths"
+        + (" and include the Phaser CDN script tag before game.js"
+           if plan.get("framework") == "phaser" else "")
+        + ". Style the page with a dark background and a centered canvas. "
+        "Do not write any game logic."
+    )
+
+
+def _interface_prompt(plan: dict, modules: list[dict]) -> str:
+    states = " / ".join(plan.get("game_states", ["menu", "playing", "game_over"]))
+    return (
+        f"Game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n"
+        "Write the SHARED INTERFACE of game.js as one short ```js block: "
+        "declarations only, with no functions and no game logic. Declare the "
+        "canvas setup (the canvas has id \"game\") as `canvas`, `ctx`, `W` and "
+        "`H`, the game's constants, a `keys` object holding the input state, "
+        f"and the shared `game` object with its `state` ({states}) and every "
+        "other field the parts below share (score, lives, entity collections, "
+        "timers). Comment each field, and list in comments the members each "
+        "entity class exposes besides its constructor, update and draw (e.g. "
+        "position and size for collisions).\n\n"
+        "The other parts of game.js are written in parallel against exactly "
+        f"these names:\n{_parts_list(modules)}"
+    )
+
+
+def _module_prompt(plan: dict, module: dict, modules: list[dict], interface: str) -> str:
+    return (
+        f"Game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n"
+        f"{_interface_section(modules, interface)}"
+        f"Write ONLY `class {module['name']}` as one ```js block, implementing "
+        f"this entity: {json.dumps(module['entity'])}. It must provide "
+        f"{ENTITY_INTERFACE}, plus the members the interface lists for it. "
+        "Use the interface's constants and `game` state; do not redeclare them."
+    )
+
+
+def _subsystem_prompt(plan: dict, name: str, modules: list[dict], interface: str) -> str:
+    return (
+        f"Game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n"
+        f"{_interface_section(modules, interface)}"
+        f"Write ONLY the `{name}` part of game.js as one ```js block: "
+        f"{SUBSYSTEMS[name]}. Use the interface's constants and `game` state, "
+        "and the other parts' classes and functions as listed; do not "
+        "redeclare or reimplement them."
+    )
+
+
+def _interface_section(modules: list[dict], interface: str) -> str:
+    return (
+        f"Here is the shared interface of game.js:\n\n```js\n{interface}\n```\n\n"
+        f"The parts of game.js, written in parallel against it:\n{_parts_list(modules)}\n\n"
+    )
+
+
+def _parts_list(modules: list[dict]) -> str:
+    entities = [
+        f"- class {m['name']} — {m['entity'].get('role', '')}: "
+        f"{m['entity'].get('behavior', '')} ({ENTITY_INTERFACE})"
+        for m in modules
+    ]
+    subsystems = [f"- {name}: {contract}" for name, contract in SUBSYSTEMS.items()]
+    return "\n".join(entities + subsystems)
+
+
+def _generate(ctx: BuildContext, phase: str, history: list[dict], prompt: str):
+    """One independent request as a step, continued while the output limit
+    cuts it off; returns None if it is still cut off after
+    ``MAX_CONTINUATIONS``. Each part gets its own chat."""
+    chat = _chat(ctx, phase, history)
+    text = (yield steps.Send(chat, prompt)).text
+    for _ in range(MAX_CONTINUATIONS):
+        if chat.last.finish_reason != "MAX_TOKENS":
+            return text
+        metrics.EXECUTE_CONTINUATIONS.inc()
+        text += _continued(text, (yield steps.Send(chat, _continue_prompt(text))).text)
+    return text if chat.last.finish_reason != "MAX_TOKENS" else None
+
+
+def _continue_prompt(text: str) -> str:
+    return CONTINUE_PROMPT.format(tail=text[-CONTINUE_TAIL_CHARS:])
+
+
+def _continued(text: str, more: str) -> str:
+    """A continuation of ``text``, without a reopened fence or repeated overlap."""
+    in_block = text.count("```") % 2 == 1
+    return strip_overlap(more, text[-CONTINUE_TAIL_CHARS:], in_block)
+
+
+def _chat(ctx: BuildContext, phase: str, history: list[dict]) -> llm.Chat:
+    return llm.Chat(
+        ctx, phase, FANOUT_SYSTEM_PROMPT,
+        ctx.generation_config("execute", temperature=0.7, max_output_tokens=8192),
+        history,
+    )
+
+
+def _class_name(name: str) -> str:
+    """'power-up gem' → 'PowerUpGem'."""
+    words = re.findall(r"[A-Za-z0-9]+", name)
+    result = "".join(w[:1].upper() + w[1:] for w in words)
+    return "_" + result if result[:1].isdigit() else result
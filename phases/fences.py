@@ -0,0 +1,125 @@
+"""Incremental parsing of the fenced code blocks in model responses."""
+
+import re
+
+# Continuations of a cut-off response: how much of it to quote back, and the
+# shortest overlap trusted as a repeat rather than coincidence
+CONTINUE_TAIL_CHARS = 600
+MIN_OVERLAP_CHARS = 12
+
+# Fence language tag → output filename
+FENCE_FILES = {
+    "html": "index.html",
+    "css": "style.css",
+    "js": "game.js",
+    "javascript": "game.js",
+}
+
+
+class FenceParser:
+    """Incremental parser for the ```lang fenced blocks in a (streamed) response.
+
+    Feed it text as it arrives; it returns progress events and records each
+    file in ``files`` as soon as its closing fence is seen:
+
+        {"type": "file_start", "file": "game.js"}
+        {"type": "file_chunk", "file": "game.js", "text": "..."}
+        {"type": "file_done",  "file": "game.js", "content": "..."}
+    """
+
+    def __init__(self):
+        self.files: dict[str, str] = {}
+        self.open_file: str | None = None  # "" while inside an unrecognised block
+        self._lines: list[str] = []
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[dict]:
+        """Consume a piece of the response and return the resulting events."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        events = []
+        for line in lines:
+            self._line(line, events)
+        return _merge_chunks(events)
+
+    def close(self) -> list[dict]:
+        """Flush a trailing line that was not newline-terminated."""
+        events = []
+        if self._buffer:
+            line, self._buffer = self._buffer, ""
+            self._line(line, events)
+        return _merge_chunks(events)
+
+    @property
+    def partial(self) -> str:
+        """Content received so far for the block that is still open."""
+        return "\n".join(self._lines + [self._buffer])
+
+    def _line(self, line: str, events: list[dict]):
+        stripped = line.strip()
+
+        if self.open_file is None:
+            if stripped.startswith("```"):
+                self.open_file = FENCE_FILES.get(stripped[3:].strip().lower(), "")
+                self._lines = []
+                if self.open_file:
+                    events.append({"type": "file_start", "file": self.open_file})
+            return
+
+        # A closing fence may sit on its own line or trail the last line of code
+        if stripped.startswith("```"):
+            self._finish(events)
+            return
+        if stripped.endswith("```"):
+            self._append(line[:line.rindex("```")], events)
+            self._finish(events)
+            return
+        self._append(line, events)
+
+    def _append(self, line: str, events: list[dict]):
+        self._lines.append(line)
+        if self.open_file:
+            events.append({"type": "file_chunk", "file": self.open_file,
+                           "text": line + "\n"})
+
+    def _finish(self, events: list[dict]):
+        filename, self.open_file = self.open_file, None
+        if filename and filename not in self.files:
+            self.files[filename] = "\n".join(self._lines).strip()
+            events.append({"type": "file_done", "file": filename,
+                           "content": self.files[filename]})
+        self._lines = []
+
+
+def _merge_chunks(events: list[dict]) -> list[dict]:
+    """Collapse consecutive ``file_chunk`` events for the same file."""
+    merged = []
+    for event in events:
+        last = merged[-1] if merged else None
+        if (event["type"] == "file_chunk" and last and last["type"] == "file_chunk"
+                and last["file"] == event["file"]):
+            last["text"] += event["text"]
+        else:
+            merged.append(event)
+    return merged
+
+
+def extract_files(text: str) -> dict[str, str]:
+    """Parse a complete response and return the files it contains."""
+    parser = FenceParser()
+    parser.feed(text)
+    parser.close()
+    return parser.files
+
+
+def strip_overlap(head: str, tail: str, in_block: bool) -> str:
+    """The start of a continuation without a reopened fence (if the cut-off
+    response stopped inside a block) or any text repeated from the end of ``tail``."""
+    if in_block:
+        fence = re.match(r"\s*```[\w-]*[ \t]*\n", head)
+        if fence:
+            head = head[fence.end():]
+    for size in range(min(len(head), len(tail)), MIN_OVERLAP_CHARS - 1, -1):
+        if tail.endswith(head[:size]):
+            return head[size:]
+    return head
@@ -0,0 +1,364 @@
+"""Hedged and best-of-N code generation — bounded extra tokens for a shorter tail.
+
+Both apply to Phase 3's single-response request (``execute.run_stream``),
+selected per build by ``BuildContext.execute_hedge``:
+
+``hedge``: the request is sent as usual. If no token has arrived by the
+``HEDGE_PERCENTILE`` of recent execute times to first token, an identical
+request is sent as well; whichever starts streaming first is kept and the
+other cancelled. Continuations and the retry then go to the chat that won.
+
+``best_of``: ``BEST_OF_N`` requests run at once. The first reply whose files
+are complete and pass the static checks wins and the rest are cancelled; if
+none passes, the best one goes through the usual continuation, retry and
+repair steps.
+
+Each mode takes its duplicate requests from its own ``SpendBudget``, which
+keeps their tokens within a fixed fraction of the tokens of the requests
+they duplicate. Duplicates skip the response cache.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+
+import metrics
+from config import (
+    HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY, BEST_OF_N,
+    HEDGE_BUDGET_RATIO, BEST_OF_BUDGET_RATIO, EXTRA_BUDGET_BURST_TOKENS,
+)
+from phases import steps
+from phases.compact import count_tokens
+from ratelimit import SpendBudget
+
+# Extra-token budgets per mode, shared by every build in the process
+budgets = {
+    "hedge": SpendBudget(HEDGE_BUDGET_RATIO, EXTRA_BUDGET_BURST_TOKENS),
+    "best_of": SpendBudget(BEST_OF_BUDGET_RATIO, EXTRA_BUDGET_BURST_TOKENS),
+}
+# Ends a racer's stream of text chunks
+_END = object()
+
+
+def hedge_delay(phase: str = "execute") -> float:
+    """Seconds to wait for a first token before hedging."""
+    learned = metrics.recent_ttft.percentile(phase, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    return HEDGE_DEFAULT_DELAY if learned is None else learned
+
+
+class HedgedChat:
+    """An execute chat whose first request is hedged; it then stands for the
+    chat that won.
+
+    ``make_chat(phase)`` returns a new ``llm.Chat`` for the prompt's
+    context; the duplicate request is made under the phase ``execute.hedge``.
+    """
+
+    def __init__(self, make_chat):
+        self._make_chat = make_chat
+        self.chat = None
+
+    @property
+    def last(self):
+        return self.chat.last if self.chat else None
+
+    def stream(self, message: str):
+        """``llm.Chat.stream``, hedged if it is the first request."""
+        if self.chat is not None:
+            yield from self.chat.stream(message)
+            return
+
+        race = _Race("hedge")
+        out = queue.Queue()
+        race.add(self._make_chat("execute"), message).start(out)
+        delay = hedge_delay()
+        try:
+            while True:
+                try:
+                    racer, item = out.get(timeout=delay)
+                except queue.Empty:
+                    delay = None
+                    hedge = self._hedge(race, message, race.racers[0].waited())
+                    if hedge:
+                        hedge.start(out)
+                    continue
+                delay = None
+                text = race.take(racer, item)
+                if text is _END:
+                    break
+                if text is not None:
+                    yield text
+        finally:
+            race.finish()
+        self.chat = race.winner.chat
+
+    async def stream_async(self, message: str):
+        """``stream`` for coroutines."""
+        if self.chat is not None:
+            async for text in self.chat.stream_async(message):
+                yield text
+            return
+
+        race = _Race("hedge")
+        out = asyncio.Queue()
+        race.add(self._make_chat("execute"), message).start_async(out)
+        delay = hedge_delay()
+        try:
+            while True:
+                try:
+                    racer, item = await asyncio.wait_for(out.get(), delay)
+                except asyncio.TimeoutError:
+                    delay = None
+                    hedge = self._hedge(race, message, race.racers[0].waited())
+                    if hedge:
+                        hedge.start_async(out)
+                    continue
+                delay = None
+                text = race.take(racer, item)
+                if text is _END:
+                    break
+                if text is not None:
+                    yield text
+        finally:
+            race.finish()
+        self.chat = race.winner.chat
+
+    def _hedge(self, race: "_Race", message: str, waited: float) -> "_Racer | None":
+        """Add the duplicate request to the race, if the budget allows it."""
+        reserved = budgets["hedge"].reserve()
+        if reserved is None:
+            metrics.EXECUTE_HEDGES.inc(mode="hedge", outcome="over_budget")
+            return None
+        print(f"No first token after {waited:.1f}s — sending a hedged request...")
+        metrics.EXECUTE_HEDGES.inc(mode="hedge", outcome="fired")
+        return race.add(self._make_chat("execute.hedge"), message, reserved)
+
+
+def best_of(make_chat, message: str, judge, n: int = BEST_OF_N):
+    """Send ``message`` in up to ``n`` chats at once, as a step
+    (``phases.steps``) returning the chat whose reply wins.
+
+    ``judge(reply)`` returns ``(passed, rank)``. The first reply that passes
+    wins at once; if none does, the lowest ``rank`` is taken once all have
+    finished. Requests beyond the first need room in the ``best_of`` budget.
+
+    Yields:
+        A ``best_of`` event with the number of candidates, then a
+        ``candidate`` event as each one finishes.
+    """
+    race = _best_of_race(make_chat, message, n)
+    finished = _Finished(race)
+    try:
+        yield {"type": "best_of", "candidates": len(race.racers)}
+        while race.running():
+            event = race.judge(*(yield finished), judge)
+            if event:
+                yield event
+            if race.winner:
+                break
+    finally:
+        race.finish()
+    return race.winner.chat
+
+
+def _best_of_race(make_chat, message: str, n: int) -> "_Race":
+    race = _Race("best_of")
+    race.add(make_chat("execute"), message)
+    for _ in range(n - 1):
+        reserved = budgets["best_of"].reserve()
+        if reserved is None:
+            metrics.EXECUTE_HEDGES.inc(mode="best_of", outcome="over_budget")
+            break
+        race.add(make_chat("execute.best_of"), message, reserved)
+    if len(race.racers) > 1:
+        print(f"Generating {len(race.racers)} candidates at once...")
+    elif n > 1:
+        print("Best-of-N budget used up — generating a single candidate...")
+    return race
+
+
+class _Finished(steps.Request):
+    """The next ``(racer, item)`` of a race — a text chunk, ``_END`` or an
+    error; the racers start, on threads or as tasks, at the first request."""
+
+    def __init__(self, race: "_Race"):
+        self.race = race
+        self._out = None
+
+    def run(self):
+        if self._out is None:
+            self._out = queue.Queue()
+            for racer in self.race.racers:
+                racer.start(self._out)
+        return self._out.get()
+
+    async def run_async(self):
+        if self._out is None:
+            self._out = asyncio.Queue()
+            for racer in self.race.racers:
+                racer.start_async(self._out)
+        return await self._out.get()
+
+
+class _Racer:
+    """One of several identical requests, streamed on a thread or a task."""
+
+    def __init__(self, index: int, chat, message: str, reserved: float | None):
+        self.index = index
+        self.chat = chat
+        self.message = message
+        # Budget reservation of a duplicate; None for the original request
+        self.reserved = reserved
+        self.chars = 0
+        self.done = False
+        self.rank = None
+        self._started = 0.0
+        self._stop = threading.Event()
+        self._task = None
+
+    def start(self, out: queue.Queue):
+        self._started = time.monotonic()
+        threading.Thread(target=self._pump, args=(out,), daemon=True).start()
+
+    def start_async(self, out: asyncio.Queue):
+        self._started = time.monotonic()
+        self._task = asyncio.ensure_future(self._pump_async(out))
+
+    def cancel(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    def waited(self) -> float:
+        return time.monotonic() - self._started
+
+    def tokens(self) -> int:
+        """Tokens used: the reply's counts once it has finished, else an estimate."""
+        reply = self.chat.last
+        if reply is not None:
+            return 0 if reply.cached else reply.input_tokens + reply.output_tokens
+        return count_tokens(self.message) + self.chat.size // 4 + self.chars // 4
+
+    def _pump(self, out: queue.Queue):
+        chunks = self.chat.stream(self.message, fresh=self.reserved is not None)
+        try:
+            for text in chunks:
+                if self._stop.is_set():
+                    return
+                self.chars += len(text)
+                out.put((self, text))
+            out.put((self, _END))
+        except Exception as e:
+            out.put((self, e))
+        finally:
+            chunks.close()
+
+    async def _pump_async(self, out: asyncio.Queue):
+        try:
+            async for text in self.chat.stream_async(self.message,
+                                                     fresh=self.reserved is not None):
+                self.chars += len(text)
+                out.put_nowait((self, text))
+            out.put_nowait((self, _END))
+        except Exception as e:
+            out.put_nowait((self, e))
+
+
+class _Race:
+    """Identical requests of one mode, of which one ``winner`` is kept."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.racers: list[_Racer] = []
+        self.winner: _Racer | None = None
+        self._errors: list[Exception] = []
+
+    def add(self, chat, message: str, reserved: float | None = None) -> _Racer:
+        racer = _Racer(len(self.racers), chat, message, reserved)
+        self.racers.append(racer)
+        return racer
+
+    def running(self) -> bool:
+        return any(not racer.done for racer in self.racers)
+
+    def take(self, racer: _Racer, item):
+        """Hedging: the first racer with any output wins.
+
+        Returns the winner's text, ``_END`` once it has finished, or None for
+        output of the others.
+
+        Raises:
+            The winner's error, or the last error once every racer has failed.
+        """
+        if self.winner is None:
+            if isinstance(item, Exception):
+                racer.done = True
+                self._errors.append(item)
+                if not self.running():
+                    raise item
+                return None
+            self._win(racer)
+        if racer is not self.winner:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def judge(self, racer: _Racer, item, judge) -> dict | None:
+        """Best-of-N: rate each finished reply, and crown the first that passes.
+
+        Returns a ``candidate`` event once a racer has finished.
+
+        Raises:
+            The last error once every racer has failed.
+        """
+        if item is not _END and not isinstance(item, Exception):
+            return None
+        racer.done = True
+        if isinstance(item, Exception):
+            self._errors.append(item)
+            print(f"Candidate {racer.index + 1} failed: {item}")
+            if not self.running() and len(self._errors) == len(self.racers):
+                raise item
+            passed = False
+        else:
+            passed, racer.rank = judge(racer.chat.last)
+            print(f"Candidate {racer.index + 1} finished — "
+                  f"{'passes' if passed else 'does not pass'} the checks")
+        if passed:
+            self._win(racer)
+            metrics.EXECUTE_HEDGES.inc(mode=self.mode, outcome="passed")
+        elif not self.running():
+            ranked = [r for r in self.racers if r.rank is not None]
+            self._win(min(ranked, key=lambda r: r.rank))
+            metrics.EXECUTE_HEDGES.inc(mode=self.mode, outcome="none_passed")
+        return {"type": "candidate", "index": racer.index, "passed": passed}
+
+    def finish(self):
+        """Cancel the requests still running and settle the budget."""
+        budget = budgets[self.mode]
+        for racer in self.racers:
+            racer.cancel()
+            tokens = racer.tokens()
+            if racer is self.winner:
+                if racer.reserved is not None:
+                    budget.charge(racer.reserved, 0)
+                if tokens:
+                    budget.earn(tokens)
+                continue
+            budget.charge(racer.reserved or 0.0, tokens)
+            metrics.EXECUTE_EXTRA_TOKENS.inc(tokens, mode=self.mode)
+            if self.mode == "hedge" and racer.reserved is None and not racer.chars:
+                # An original that lost without a token is a slow sample the
+                # percentile would otherwise never see
+                metrics.recent_ttft.observe(racer.waited(), phase="execute")
+        if self.mode == "hedge" and self.winner and len(self.racers) > 1:
+            outcome = "hedge_won" if self.winner.index else "original_won"
+            metrics.EXECUTE_HEDGES.inc(mode="hedge", outcome=outcome)
+
+    def _win(self, racer: _Racer):
+        self.winner = racer
+        for other in self.racers:
+            if other is not racer:
+                other.cancel()
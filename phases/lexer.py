@@ -0,0 +1,70 @@
+"""Shared JavaScript and CSS tokenizer rules.
+
+``validate`` scans generated code with these to find unterminated literals
+and ``bundle`` to minify it, so both read strings, template literals and
+regex literals the same way.
+"""
+
+# After these, a "/" starts a regex literal rather than a division
+REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^") | {None}
+REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete",
+                  "void", "throw", "case", "do", "else", "yield", "await"}
+
+
+def string_end(text: str, i: int) -> int | None:
+    """Index after the quoted string starting at ``i``; None if unterminated."""
+    quote, j = text[i], i + 1
+    while j < len(text):
+        if text[j] == "\\":
+            j += 2
+        elif text[j] == quote:
+            return j + 1
+        elif text[j] == "\n":
+            return None
+        else:
+            j += 1
+    return None
+
+
+def template_end(code: str, i: int, line: int) -> tuple[int | None, int, bool]:
+    """Scan template literal text from ``i`` to its closing backtick or next ``${``.
+
+    Returns the index after it, the updated line number, and whether a
+    ``${`` expression was opened (the scan resumes at its closing brace).
+    """
+    while i < len(code):
+        c = code[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "\n":
+            line += 1
+        if c == "`":
+            return i + 1, line, False
+        if code.startswith("${", i):
+            return i + 2, line, True
+        i += 1
+    return None, line, False
+
+
+def regex_end(code: str, i: int) -> int | None:
+    """Index after the regex literal (and flags) starting at ``i``."""
+    j, in_class = i + 1, False
+    while j < len(code):
+        c = code[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "\n":
+            return None
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            j += 1
+            while j < len(code) and (code[j].isalnum() or code[j] == "_"):
+                j += 1
+            return j
+        j += 1
+    return None
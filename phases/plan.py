@@ -1,84 +1,135 @@
-"""Phase 2: Game Planning — produce a structured JSON game plan."""
+"""Phase 2: Game Planning — produce a structured JSON game plan.
+
+The reply is checked against ``plan_schema``: malformed JSON is repaired
+locally, and only the required fields still missing or invalid after that
+are asked for again, in a short follow-up request per round.
+"""
 
 import json
-import re
 
-import google.generativeai as genai
-from config import MODEL_NAME, PLAN_SYSTEM_PROMPT
+import llm
+import metrics
+from config import PLAN_SYSTEM_PROMPT, PLAN_FIX_PROMPT, PLAN_STRUCTURED_OUTPUT, PLAN_FIX_ROUNDS
+from phases import compact, plan_schema, steps
+from phases.context import BuildContext
+
 
+class PlanError(ValueError):
+    """Raised when the plan still lacks required fields after every fix round."""
 
-def run(requirements: str, history: list[dict]) -> tuple[dict, list[dict]]:
+
+def run(requirements: str, history: list[dict],
+        ctx: BuildContext | None = None) -> tuple[dict, list[dict]]:
     """Run the planning phase.
 
     Returns:
         (plan_dict, updated_history)
     """
-    model = genai.GenerativeModel(
-        MODEL_NAME,
-        system_instruction=PLAN_SYSTEM_PROMPT,
-        generation_config=genai.GenerationConfig(temperature=0.4),
-    )
-    chat = model.start_chat(history=_rebuild_history(history))
+    return steps.call(_plan(requirements, history, ctx or BuildContext()))
+
+
+async def run_async(requirements: str, history: list[dict],
+                    ctx: BuildContext | None = None) -> tuple[dict, list[dict]]:
+    """``run`` for coroutines; same arguments and result."""
+    return await steps.call_async(_plan(requirements, history, ctx or BuildContext()))
+
+
+def _plan(requirements: str, history: list[dict], ctx: BuildContext):
+    """The planning phase as a step (``phases.steps``)."""
+    _banner()
+    prompt = _prompt(requirements)
+    with ctx.span("plan") as span:
+        chat = _chat(requirements, history, prompt, ctx)
+        plan, problems, repaired = _parse({}, (yield steps.Send(chat, prompt)).text)
+        rounds = 0
+        while problems and rounds < PLAN_FIX_ROUNDS:
+            rounds += 1
+            fix, fix_prompt = _fix_chat(chat, problems, ctx)
+            plan, problems, _ = _parse(plan, (yield steps.Send(fix, fix_prompt)).text)
+        _settle(problems, repaired, rounds, span)
 
+    _report(plan)
+    # The full history (not the compacted one) carries on to later phases
+    return plan, history + _exchange(chat, plan)
+
+
+def _banner():
     print("\n" + "=" * 60)
     print("PHASE 2: Game Planning")
     print("=" * 60)
 
-    prompt = (
+
+def _prompt(requirements: str) -> str:
+    return (
         f"Here are the clarified requirements:\n\n{requirements}\n\n"
         "Generate the JSON game plan now."
     )
-    response = chat.send_message(prompt)
-    plan_text = response.text
 
-    # Extract JSON from markdown fences or raw text
-    plan = _extract_json(plan_text)
 
+def _chat(requirements: str, history: list[dict], prompt: str, ctx: BuildContext) -> llm.Chat:
+    """Planning chat on the history compacted for this prompt."""
+    context, ctx.compaction["plan"] = compact.for_plan(history, requirements, prompt)
+    return llm.Chat(ctx, "plan", PLAN_SYSTEM_PROMPT,
+                    ctx.generation_config("plan", temperature=0.4, **_structured()), context)
+
+
+def _fix_chat(chat: llm.Chat, problems: dict[str, str],
+              ctx: BuildContext) -> tuple[llm.Chat, str]:
+    """A follow-up to the planning chat asking for just the failed fields."""
+    fields = list(problems)
+    print(f"Plan fields missing or invalid ({', '.join(fields)}) — asking for them again...")
+    listed = "\n".join(f"- {name}: {message}" for name, message in problems.items())
+    fix = llm.Chat(ctx, "plan.fix", PLAN_SYSTEM_PROMPT,
+                   ctx.generation_config("plan", temperature=0.2, **_structured(fields)),
+                   chat.history)
+    return fix, PLAN_FIX_PROMPT.format(problems=listed, fields=", ".join(fields))
+
+
+def _structured(fields=None) -> dict:
+    """Generation settings for the structured-output mode, if it is on."""
+    if not PLAN_STRUCTURED_OUTPUT:
+        return {}
+    return {"response_mime_type": "application/json",
+            "response_schema": plan_schema.response_schema(fields)}
+
+
+def _parse(plan: dict, text: str) -> tuple[dict, dict[str, str], bool]:
+    """Merge the JSON object in a reply into ``plan`` and validate the result.
+
+    Returns:
+        ``(plan, problems, repaired)`` as ``plan_schema.validate`` gives
+        them, and whether the reply's JSON needed repair.
+    """
+    try:
+        raw, repaired = plan_schema.parse_json(text)
+    except ValueError as e:
+        print(f"Plan reply unusable: {e}")
+        raw, repaired = {}, True
+    return (*plan_schema.validate({**plan, **raw}), repaired)
+
+
+def _settle(problems: dict[str, str], repaired: bool, rounds: int, span: dict):
+    span.update(json_repaired=repaired, fix_rounds=rounds)
+    if problems:
+        metrics.PLAN_OUTCOMES.inc(outcome="failed")
+        raise PlanError("The game plan is still missing or has invalid fields: " + "; ".join(
+            f"{name} {message}" for name, message in problems.items()))
+    metrics.PLAN_OUTCOMES.inc(outcome="fields_fixed" if rounds else
+                              "json_repaired" if repaired else "valid")
+
+
+def _exchange(chat: llm.Chat, plan: dict) -> list[dict]:
+    """The planning exchange, with the validated plan as the model's turn.
+
+    Later phases then see (and ``compact`` recognises) the plan they are
+    given, however the reply was repaired or completed.
+    """
+    request = chat.history[-2]
+    return [request, {"role": "model", "parts": [f"```json\n{json.dumps(plan, indent=2)}\n```"]}]
+
+
+def _report(plan: dict):
     print(f"\nGame Plan: {plan.get('title', 'Untitled')}")
     print(f"Framework: {plan.get('framework', 'vanilla')}")
     print(f"Mechanics: {', '.join(plan.get('mechanics', []))}")
     print(f"Controls: {json.dumps(plan.get('controls', {}))}")
-
-    return plan, _history_to_dicts(chat.history)
-
-
-def _extract_json(text: str) -> dict:
-    """Extract JSON from markdown code fences or raw text."""
-    # Try ```json ... ``` first
-    match = re.search(r"```json\s*\n(.*?)```", text, re.DOTALL)
-    if match:
-        return json.loads(match.group(1))
-
-    # Try bare ``` ... ```
-    match = re.search(r"```\s*\n(.*?)```", text, re.DOTALL)
-    if match:
-        return json.loads(match.group(1))
-
-    # Try raw JSON
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if match:
-        return json.loads(match.group(0))
-
-    raise ValueError(f"Could not extract JSON from plan response:\n{text[:500]}")
-
-
-def _rebuild_history(history: list[dict]) -> list:
-    """Rebuild history into Gemini Content format."""
-    from google.generativeai.types import content_types
-    contents = []
-    for msg in history:
-        contents.append(content_types.to_content(
-            {"role": msg["role"], "parts": msg["parts"]}
-        ))
-    return contents
-
-
-def _history_to_dicts(history) -> list[dict]:
-    """Convert Gemini chat history to serializable dicts."""
-    result = []
-    for msg in history:
-        result.append({
-            "role": msg.role,
-            "parts": [p.text for p in msg.parts],
-        })
-    return result
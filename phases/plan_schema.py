@@ -0,0 +1,334 @@
+"""The game plan schema — typed fields, validation and lenient JSON parsing.
+
+``GamePlan`` is the shape ``PLAN_SYSTEM_PROMPT`` asks for; ``validate``
+coerces a parsed reply into it and names each field that is missing or
+unusable, so only those have to be asked for again. ``response_schema``
+is the same shape for the model's structured-output mode, and
+``parse_json`` reads the JSON object in a reply, repairing the usual
+damage locally: comments, trailing or missing commas, single quotes,
+unquoted keys, Python literals, raw newlines in strings, and output cut off
+mid-object.
+"""
+
+import json
+import math
+import re
+from typing import TypedDict
+
+FRAMEWORKS = ("vanilla", "phaser")
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null"}
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_JSON_ESCAPES = set('"\\/bfnrtu')
+# Tokens after which a value has not ended yet
+_EXPECTING_VALUE = {"{", "[", ",", ":"}
+
+
+class Entity(TypedDict):
+    name: str
+    role: str
+    behavior: str
+
+
+class GamePlan(TypedDict):
+    title: str
+    framework: str  # one of FRAMEWORKS
+    description: str
+    mechanics: list[str]
+    controls: dict[str, str]  # key/input -> action
+    entities: list[Entity]
+    game_states: list[str]
+    game_loop: str
+    visual_style: str
+    scoring: str
+    difficulty: str
+
+
+def _text(value) -> str:
+    if isinstance(value, list):
+        value = "; ".join(str(item) for item in value if item)
+    elif isinstance(value, dict):
+        value = "; ".join(f"{k}: {v}" for k, v in value.items())
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("must be a non-empty string")
+    return value.strip()
+
+
+def _framework(value) -> str:
+    name = _text(value).lower()
+    for framework in FRAMEWORKS:
+        if framework in name:
+            return framework
+    raise ValueError(f"must be one of {', '.join(FRAMEWORKS)}")
+
+
+def _strings(value) -> list[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError("must be a list of strings")
+    items = [_text(item) for item in value if item not in (None, "")]
+    if not items:
+        raise ValueError("must be a non-empty list of strings")
+    return items
+
+
+def _controls(value) -> dict[str, str]:
+    if isinstance(value, list):  # structured output: [{"input": ..., "action": ...}]
+        pairs = {}
+        for item in value:
+            if isinstance(item, dict):
+                key = item.get("input") or item.get("key")
+                if key and item.get("action"):
+                    pairs[str(key)] = item["action"]
+            elif isinstance(item, str) and ":" in item:
+                key, action = item.split(":", 1)
+                pairs[key.strip()] = action
+        value = pairs
+    if not isinstance(value, dict) or not value:
+        raise ValueError('must be a non-empty object of {"key/input": "action"}')
+    return {str(key).strip(): _text(action) for key, action in value.items()}
+
+
+def _entities(value) -> list[Entity]:
+    if isinstance(value, dict):  # {"name": "behavior"}
+        value = [{"name": name, "behavior": behavior} for name, behavior in value.items()]
+    if not isinstance(value, list) or not value:
+        raise ValueError('must be a non-empty list of {"name", "role", "behavior"} objects')
+    entities = []
+    for item in value:
+        if isinstance(item, str):
+            item = {"name": item}
+        if not isinstance(item, dict) or not item.get("name"):
+            raise ValueError("every entity needs a name")
+        entities.append({"name": _text(item["name"]),
+                         "role": str(item.get("role") or "").strip(),
+                         "behavior": str(item.get("behavior") or "").strip()})
+    return entities
+
+
+# Field -> (coercion, default). Fields without a default are required; an
+# optional field that is missing or unusable silently takes its default.
+FIELDS = {
+    "title": (_text, None),
+    "framework": (_framework, "vanilla"),
+    "description": (_text, ""),
+    "mechanics": (_strings, None),
+    "controls": (_controls, None),
+    "entities": (_entities, None),
+    "game_states": (_strings, ["menu", "playing", "game_over"]),
+    "game_loop": (_text, None),
+    "visual_style": (_text, ""),
+    "scoring": (_text, ""),
+    "difficulty": (_text, ""),
+}
+
+
+def validate(raw: dict) -> tuple[dict, dict[str, str]]:
+    """Coerce a parsed plan into the ``GamePlan`` shape.
+
+    Fields outside the schema are kept as they are.
+
+    Returns:
+        ``(plan, problems)``: the plan with every usable field, and a
+        message per required field that is missing or invalid (those are
+        absent from ``plan``).
+    """
+    plan, problems = dict(raw), {}
+    for name, (coerce, default) in FIELDS.items():
+        try:
+            if raw.get(name) in (None, "", [], {}):
+                raise ValueError("is missing")
+            plan[name] = coerce(raw[name])
+        except ValueError as e:
+            plan.pop(name, None)
+            if default is None:
+                problems[name] = str(e)
+            else:
+                plan[name] = default
+    return plan, problems
+
+
+def response_schema(fields=None) -> dict:
+    """The structured-output schema for ``fields`` (default: all of them).
+
+    The Gemini schema subset has no free-form maps, so ``controls`` is
+    asked for as a list of ``{"input", "action"}`` pairs; ``validate``
+    turns it back into an object.
+    """
+    text = {"type": "STRING"}
+    strings = {"type": "ARRAY", "items": text}
+    pair = {"type": "OBJECT", "properties": {"input": text, "action": text},
+            "required": ["input", "action"]}
+    entity = {"type": "OBJECT", "properties": {"name": text, "role": text, "behavior": text},
+              "required": ["name", "role", "behavior"]}
+    types = {
+        "title": text,
+        "framework": {"type": "STRING", "format": "enum", "enum": list(FRAMEWORKS)},
+        "description": text,
+        "mechanics": strings,
+        "controls": {"type": "ARRAY", "items": pair},
+        "entities": {"type": "ARRAY", "items": entity},
+        "game_states": strings,
+        "game_loop": text,
+        "visual_style": text,
+        "scoring": text,
+        "difficulty": text,
+    }
+    fields = list(fields or FIELDS)
+    return {"type": "OBJECT", "properties": {name: types[name] for name in fields},
+            "required": fields}
+
+
+def parse_json(text: str) -> tuple[dict, bool]:
+    """The JSON object in a model reply (in a ```json fence or bare).
+
+    Returns:
+        ``(object, repaired)``; ``repaired`` is True if it only parsed
+        after ``repair``.
+
+    Raises:
+        ValueError: There is no object, or it is damaged beyond repair.
+    """
+    match = re.search(r"```(?:json)?[ \t]*\n(.*?)(?:```|$)", text, re.S | re.I)
+    body = match.group(1) if match else text
+    start = body.find("{")
+    if start < 0:
+        raise ValueError(f"no JSON object in the reply: {text[:200]!r}")
+    body = body[start:]
+    try:
+        value, repaired = json.JSONDecoder().raw_decode(body)[0], False
+    except ValueError:
+        try:
+            value, repaired = json.loads(repair(body)), True
+        except ValueError as e:
+            raise ValueError(f"JSON object could not be repaired ({e}): {body[:200]!r}")
+    if not isinstance(value, dict):
+        raise ValueError("the reply's JSON is not an object")
+    return value, repaired
+
+
+def repair(text: str) -> str:
+    """Rewrite almost-JSON starting at an opening brace as strict JSON.
+
+    Reads up to the end of the first top-level value; anything after it is
+    ignored, and a value that is cut off is closed where it stops.
+    """
+    tokens: list[str] = []
+    closers: list[str] = []  # expected closing brackets
+    i, n = 0, len(text)
+
+    def value(token: str):
+        # A value directly after another one is missing its comma
+        if tokens and _ends_value(tokens[-1]):
+            tokens.append(",")
+        tokens.append(token)
+
+    while i < n:
+        c = text[i]
+        if c.isspace():
+            i += 1
+        elif text.startswith("//", i) or c == "#":
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif c in "\"'":
+            token, i = _string(text, i)
+            value(token)
+        elif c in "{[":
+            value(c)
+            closers.append("}" if c == "{" else "]")
+            i += 1
+        elif c in "}]":
+            i += 1
+            if c not in closers:
+                continue  # a stray closer
+            while closers:
+                _drop_dangling(tokens, closers[-1])
+                closer = closers.pop()
+                tokens.append(closer)
+                if closer == c:
+                    break
+            if not closers:
+                break  # end of the top-level value
+        elif c in ",:":
+            if tokens and _ends_value(tokens[-1]):
+                tokens.append(c)
+            i += 1
+        elif c in "-0123456789.":
+            match = re.compile(r"[-+\w.]+").match(text, i)
+            number = match.group()
+            # A cut-off or non-JSON number (1., .5, +3) becomes null
+            value(number if _NUMBER.fullmatch(number) else _number(number))
+            i = match.end()
+        else:
+            match = re.compile(r"[\w$]+").match(text, i)
+            if not match:
+                i += 1  # a stray character
+                continue
+            word = match.group()
+            value(_LITERALS.get(word) or json.dumps(word))
+            i = match.end()
+    while closers:
+        _drop_dangling(tokens, closers[-1])
+        tokens.append(closers.pop())
+    return "".join(tokens)
+
+
+def _string(text: str, i: int) -> tuple[str, int]:
+    """A single- or double-quoted string from ``i`` as a JSON string, and the
+    index after it; a string that is cut off ends at the end of the text."""
+    quote, j, chars = text[i], i + 1, []
+    while j < len(text):
+        c = text[j]
+        if c == "\\":
+            if j + 1 < len(text):
+                escaped = text[j + 1]
+                chars.append("'" if escaped == "'" else
+                             c + escaped if escaped in _JSON_ESCAPES else "\\\\" + escaped)
+            j += 2
+            continue
+        if c == quote:
+            return '"' + "".join(chars) + '"', j + 1
+        if c == '"':
+            chars.append('\\"')
+        elif c < " ":
+            chars.append(json.dumps(c)[1:-1])
+        else:
+            chars.append(c)
+        j += 1
+    return '"' + "".join(chars) + '"', j
+
+
+def _number(text: str) -> str:
+    try:
+        number = float(text)
+    except ValueError:
+        return "null"
+    if not math.isfinite(number):
+        return "null"
+    return json.dumps(int(number) if number.is_integer() else number)
+
+
+def _ends_value(token: str) -> bool:
+    return token not in _EXPECTING_VALUE
+
+
+def _drop_dangling(tokens: list[str], closer: str):
+    """Remove what cannot end a container: a trailing comma or colon, and in
+    an object a key without its value."""
+    while tokens:
+        last = tokens[-1]
+        if last in (",", ":"):
+            tokens.pop()
+            if last == ":" and tokens:
+                tokens.pop()  # the key
+        elif closer == "}" and last.startswith('"') and len(tokens) > 1 \
+                and tokens[-2] in ("{", ","):
+            tokens.pop()  # a key with no colon
+        else:
+            return
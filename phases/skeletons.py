@@ -0,0 +1,175 @@
+"""Skeleton library — prewritten boilerplate the model only has to fill in.
+
+Each directory under ``skeletons/`` holds an ``index.html``, ``style.css``
+and ``game.js`` template plus a ``skeleton.json`` describing what it fits:
+``framework``, supported ``controls`` (keyboard / pointer) and game
+``states``, ``keywords`` matched against the plan's mechanics, ``exclude``
+words that rule it out, and the ``hooks`` the model must write. A skeleton
+with a ``base`` inherits any files it does not have from that skeleton.
+
+Templates use ``{{name}}`` placeholders: ``title_html``, ``title_js`` and
+``title_comment``, the ``params`` from skeleton.json (overridden by
+``keyword_params`` when a keyword appears in the plan), and ``hooks`` in
+game.js, where the model's code goes.
+"""
+
+import html
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from config import SKELETON_DIR, SKELETON_MIN_SCORE
+
+FILES = ("index.html", "style.css", "game.js")
+HOOKS_MARKER = "// >>> GAME CODE GOES HERE <<<"
+
+# Plan state names that mean the same as a skeleton's menu / playing / game_over
+_STATE_ALIASES = {
+    "start": "menu", "title": "menu", "start_screen": "menu", "title_screen": "menu",
+    "main_menu": "menu", "menu": "menu",
+    "play": "playing", "game": "playing", "running": "playing", "in_game": "playing",
+    "playing": "playing",
+    "gameover": "game_over", "game_over": "game_over", "lose": "game_over",
+    "lost": "game_over", "end": "game_over", "dead": "game_over", "over": "game_over",
+}
+_POINTER_WORDS = re.compile(r"\b(mouse|click|tap|touch|drag|pointer|swipe)", re.I)
+
+
+@dataclass
+class Skeleton:
+    name: str
+    description: str
+    framework: str
+    controls: list[str]
+    states: list[str]
+    keywords: list[str]
+    exclude: list[str]
+    required: list[str]
+    hooks: list[str]
+    params: dict = field(default_factory=dict)
+    keyword_params: dict[str, dict] = field(default_factory=dict)
+    files: dict[str, str] = field(default_factory=dict, repr=False)
+
+
+@lru_cache(maxsize=4)
+def library(root: str = SKELETON_DIR) -> tuple[Skeleton, ...]:
+    """Every skeleton under ``root``, loaded once per process."""
+    if not os.path.isdir(root):
+        return ()
+    meta = {}
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, "skeleton.json")
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                meta[name] = json.load(f)
+
+    def files_of(name: str) -> dict[str, str]:
+        base = meta[name].get("base")
+        files = dict(files_of(base)) if base else {}
+        for filename in FILES:
+            path = os.path.join(root, name, filename)
+            if os.path.isfile(path):
+                with open(path, encoding="utf-8") as f:
+                    files[filename] = f.read()
+        return files
+
+    skeletons = []
+    for name, data in meta.items():
+        data = {key: value for key, value in data.items() if key != "base"}
+        skeleton = Skeleton(name=name, files=files_of(name), **data)
+        if set(skeleton.files) == set(FILES):
+            skeletons.append(skeleton)
+        else:
+            print(f"[skeletons] {name}: missing {set(FILES) - set(skeleton.files)} — skipped")
+    return tuple(skeletons)
+
+
+def match(plan: dict, skeletons: tuple[Skeleton, ...] | None = None) -> Skeleton | None:
+    """The best skeleton for a plan, or None if none fits well enough.
+
+    A skeleton must have the plan's framework, support all of its states and
+    control schemes, and share none of its ``exclude`` words. Among those,
+    each keyword found in the plan scores a point, and supporting exactly the
+    plan's control schemes one more.
+    """
+    skeletons = library() if skeletons is None else skeletons
+    framework = (plan.get("framework") or "vanilla").lower()
+    states = {_state(s) for s in plan.get("game_states") or ["menu", "playing", "game_over"]}
+    schemes = control_schemes(plan)
+    text = plan_text(plan)
+
+    best, best_score = None, 0
+    for skeleton in skeletons:
+        if (skeleton.framework != framework
+                or not states <= set(skeleton.states)
+                or not schemes <= set(skeleton.controls)
+                or any(_mentions(text, word) for word in skeleton.exclude)):
+            continue
+        score = sum(1 for word in skeleton.keywords if _mentions(text, word))
+        score += set(skeleton.controls) == schemes
+        if score > best_score:
+            best, best_score = skeleton, score
+    return best if best_score >= SKELETON_MIN_SCORE else None
+
+
+def render(skeleton: Skeleton, plan: dict, hooks: str = HOOKS_MARKER) -> dict[str, str]:
+    """The skeleton's files for a plan, with ``hooks`` in place in game.js."""
+    title = plan.get("title") or "Game"
+    text = plan_text(plan)
+    params = dict(skeleton.params)
+    for word, overrides in skeleton.keyword_params.items():
+        if _mentions(text, word):
+            params.update(overrides)
+    values = {
+        **{key: str(value) for key, value in params.items()},
+        "title_html": html.escape(title),
+        "title_js": json.dumps(title),
+        "title_comment": title.replace("\n", " "),
+    }
+
+    def fill(template: str, extra: dict) -> str:
+        return re.sub(r"\{\{(\w+)\}\}",
+                      lambda m: extra.get(m.group(1), values.get(m.group(1), m.group(0))),
+                      template)
+
+    return {
+        name: fill(content, {"hooks": hooks.strip("\n")} if name == "game.js" else {})
+        for name, content in skeleton.files.items()
+    }
+
+
+def missing_hooks(skeleton: Skeleton, code: str) -> list[str]:
+    """Required hook functions that ``code`` does not define."""
+    return [name for name in skeleton.required
+            if not re.search(rf"\bfunction\s+{name}\s*\(|\b(?:const|let|var)\s+{name}\s*=", code)]
+
+
+def control_schemes(plan: dict) -> set[str]:
+    """"keyboard" and/or "pointer", from the plan's controls."""
+    schemes = set()
+    for key, action in (plan.get("controls") or {}).items():
+        schemes.add("pointer" if _POINTER_WORDS.search(str(key)) else "keyboard")
+        if _POINTER_WORDS.search(str(action)):
+            schemes.add("pointer")
+    return schemes or {"keyboard"}
+
+
+def plan_text(plan: dict) -> str:
+    """The plan's descriptive fields, lowercased, for keyword matching."""
+    parts = [plan.get("title", ""), plan.get("description", ""), plan.get("game_loop", ""),
+             " ".join(plan.get("mechanics") or [])]
+    for entity in plan.get("entities") or []:
+        parts += [str(entity.get(key, "")) for key in ("name", "role", "behavior")]
+    return " ".join(str(part) for part in parts).lower()
+
+
+def _mentions(text: str, word: str) -> bool:
+    """Whether ``text`` contains a word starting with ``word`` ("shoot" → "shooting")."""
+    return re.search(r"\b" + re.escape(word.lower()), text) is not None
+
+
+def _state(name: str) -> str:
+    key = re.sub(r"[\s-]+", "_", str(name).strip().lower())
+    return _STATE_ALIASES.get(key, key)
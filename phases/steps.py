@@ -0,0 +1,214 @@
+"""Phase steps — each phase's control flow written once, for threads and coroutines.
+
+A step is a generator. It yields the events its caller should see (dicts)
+and, in between, requests for the I/O it needs, and is sent back each
+request's result:
+
+- ``Send(chat, message)``: a model request; the ``llm.Reply``.
+- ``Stream(chat, message)``: the next text chunk of a streamed reply, or
+  None once it has ended. The same request is yielded again for each chunk.
+- ``Call(fn, *args)``: blocking work such as writing a file; its result.
+- ``Group(limit)``: steps run concurrently; the next one to finish.
+
+A request that fails raises its error inside the step. ``run`` drives a
+step on the calling thread (the Flask server, the CLI); ``run_async``
+drives it from a coroutine (the ASGI server), awaiting the backend's async
+API and running ``Call``s on a worker thread. Steps combine with
+``yield from``, which also passes on the inner step's return value.
+"""
+
+import abc
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Request(abc.ABC):
+    """I/O a step waits for, done by whichever driver runs the step."""
+
+    @abc.abstractmethod
+    def run(self):
+        """Do the I/O on the calling thread and return its result."""
+
+    @abc.abstractmethod
+    async def run_async(self):
+        """Do the I/O without blocking the event loop and return its result."""
+
+
+class Send(Request):
+    """A model request; the result is the ``llm.Reply``."""
+
+    def __init__(self, chat, message: str):
+        self.chat = chat
+        self.message = message
+
+    def run(self):
+        return self.chat.send(self.message)
+
+    async def run_async(self):
+        return await self.chat.send_async(self.message)
+
+
+class Stream(Request):
+    """A streamed model request; each result is the next text chunk, None at the end."""
+
+    def __init__(self, chat, message: str):
+        self.chat = chat
+        self.message = message
+        self._chunks = None
+
+    def run(self):
+        if self._chunks is None:
+            self._chunks = self.chat.stream(self.message)
+        return next(self._chunks, None)
+
+    async def run_async(self):
+        if self._chunks is None:
+            self._chunks = self.chat.stream_async(self.message)
+        return await anext(self._chunks, None)
+
+
+class Call(Request):
+    """``fn(*args, **kwargs)``; on a worker thread under ``run_async``."""
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        return self.fn(*self.args, **self.kwargs)
+
+    async def run_async(self):
+        return await asyncio.to_thread(self.fn, *self.args, **self.kwargs)
+
+
+class Group(Request):
+    """Steps run concurrently, at most ``limit`` at once — on a thread pool
+    under ``run``, as tasks under ``run_async``.
+
+    ``add(key, step)`` queues a step; yielding the group starts the queued
+    ones and waits for the next to finish, with ``(key, return value)`` as
+    the result (or its error raised). The group is true while any step is
+    queued or running; ``cancel()`` abandons those still running.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._queued: list[tuple[str, object]] = []
+        self._running: dict = {}
+        self._pool: ThreadPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    def add(self, key: str, step):
+        self._queued.append((key, step))
+
+    def __bool__(self) -> bool:
+        return bool(self._queued or self._running)
+
+    def run(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix="step")
+        for key, step in self._queued:
+            self._running[self._pool.submit(call, step)] = key
+        self._queued = []
+        done, _ = wait(self._running, return_when=FIRST_COMPLETED)
+        return self._finished(next(iter(done)))
+
+    async def run_async(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        for key, step in self._queued:
+            self._running[asyncio.ensure_future(self._limited(step))] = key
+        self._queued = []
+        done, _ = await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+        return self._finished(next(iter(done)))
+
+    def cancel(self):
+        self._queued = []
+        if self._pool:
+            # A failed step makes the rest useless; do not wait for them
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        for future in self._running:
+            future.cancel()
+
+    async def _limited(self, step):
+        async with self._slots:
+            return await call_async(step)
+
+    def _finished(self, future) -> tuple[str, object]:
+        key = self._running.pop(future)
+        return key, future.result()
+
+
+def run(step):
+    """Drive ``step`` on the calling thread.
+
+    Yields:
+        The step's events.
+
+    Returns:
+        The step's return value.
+    """
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = step.throw(error) if error else step.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            if not isinstance(item, Request):
+                yield item
+                continue
+            try:
+                result = item.run()
+            except Exception as e:
+                error = e
+    finally:
+        step.close()
+
+
+async def run_async(step, outcome: dict | None = None):
+    """``run`` for coroutines, with each request awaited.
+
+    An async generator cannot return a value, so the step's is put into
+    ``outcome["value"]`` instead.
+    """
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = step.throw(error) if error else step.send(result)
+            except StopIteration as stop:
+                if outcome is not None:
+                    outcome["value"] = stop.value
+                return
+            result, error = None, None
+            if not isinstance(item, Request):
+                yield item
+                continue
+            try:
+                result = await item.run_async()
+            except Exception as e:
+                error = e
+    finally:
+        step.close()
+
+
+def call(step):
+    """Run a step to its end on the calling thread and return its value;
+    any events are dropped."""
+    events = run(step)
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+
+async def call_async(step):
+    """``call`` for coroutines."""
+    outcome = {}
+    async for _ in run_async(step, outcome):
+        pass
+    return outcome["value"]
@@ -0,0 +1,376 @@
+"""Offline checks of generated files, and targeted single-file repair.
+
+``check`` runs in milliseconds without a browser or network:
+
+- index.html and game.js were generated at all.
+- index.html — every local ``href``/``src`` resolves to a generated file,
+  and style.css and game.js are actually linked.
+- style.css — comments, strings and braces are balanced and every
+  declaration has a ``property: value`` form.
+- game.js — parsed with ``esprima`` if it is installed; otherwise a
+  tokenizer checks strings, comments, template literals, regex literals and
+  bracket nesting, which catches the usual damage (cut-off output, a lost
+  closing brace).
+
+``repair`` asks the model to fix one failing file, quoting only that file
+and its error locations, instead of regenerating the whole game.
+"""
+
+import json
+import re
+from html.parser import HTMLParser
+
+import llm
+import metrics
+from config import FANOUT_SYSTEM_PROMPT, REPAIR_PROMPT, MISSING_FILE_PROMPT, MAX_REPAIR_ROUNDS
+from phases import steps
+from phases.context import BuildContext
+from phases.fences import extract_files
+from phases.lexer import REGEX_AFTER, REGEX_KEYWORDS, regex_end, string_end, template_end
+
+try:
+    import esprima
+except ImportError:  # optional: fall back to the tokenizer below
+    esprima = None
+
+# Checked in this order, which is also the order repairs are made in
+FILE_LANGS = {"index.html": "html", "style.css": "css", "game.js": "js"}
+# A game cannot run without these; style.css is optional
+REQUIRED_FILES = ("index.html", "game.js")
+# Problems reported per file; the first few locate the damage well enough
+MAX_PROBLEMS = 5
+
+_CLOSERS = {")": "(", "]": "[", "}": "{"}
+
+
+def run(plan: dict, files: dict[str, str], ctx: BuildContext, write):
+    """Check the files and repair each failing one, one request per file, as
+    a step (``phases.steps``).
+
+    A repair is kept only if it leaves that file with fewer problems; kept
+    repairs are passed to ``write(filename, content)`` and yielded as
+    ``file_done`` events, and ``files`` is updated in place. Runs up to
+    ``MAX_REPAIR_ROUNDS`` rounds.
+
+    Yields:
+        ``validate`` and ``repair`` progress events, and ``file_done``.
+
+    Returns:
+        ``(problems left, repair requests made)``.
+    """
+    problems = _count(check(files))
+    repairs = 0
+    for _ in range(MAX_REPAIR_ROUNDS):
+        if not problems:
+            break
+        yield {"type": "validate", "problems": problems}
+        for filename, found in by_file(problems).items():
+            yield _repair_event(filename, found)
+            repairs += 1
+            fixed = yield from repair(plan, files, filename, found, ctx)
+            if _keep(files, filename, found, fixed):
+                yield steps.Call(write, filename, fixed)
+                yield {"type": "file_done", "file": filename, "content": fixed}
+        problems = check(files)
+    _report(problems)
+    return problems, repairs
+
+
+def check(files: dict[str, str]) -> list[dict]:
+    """All problems in the generated files.
+
+    Returns:
+        Problem dicts ``{"file", "line", "message"}``; ``line`` is 1-based,
+        or None for problems with the file as a whole.
+    """
+    problems = []
+    if "index.html" in files:
+        problems += check_html(files["index.html"], files)
+    if "style.css" in files:
+        problems += check_css(files["style.css"])
+    if "game.js" in files:
+        problems += check_js(files["game.js"])
+    reported = {p["file"] for p in problems}
+    problems += [_problem(name, None, "it was not generated, and the game cannot run without it")
+                 for name in REQUIRED_FILES if name not in files and name not in reported]
+    return problems
+
+
+def check_html(html: str, files: dict[str, str]) -> list[dict]:
+    refs = _References()
+    refs.feed(html)
+    refs.close()
+
+    problems, linked = [], set()
+    for line, ref in refs.refs:
+        path = ref.split("#")[0].split("?")[0].removeprefix("./")
+        if not path or re.match(r"^([a-z][a-z0-9+.-]*:|//)", path, re.I):
+            continue  # external (CDN) or data: URL
+        linked.add(path)
+        if path in files:
+            continue
+        if path in FILE_LANGS:
+            problems.append(_problem(path, None, "index.html links it, but it was not generated"))
+        else:
+            problems.append(_problem("index.html", line,
+                                     f"references '{ref}', which is not a generated file "
+                                     f"(the files are {', '.join(sorted(files))})"))
+    for name in ("style.css", "game.js"):
+        if name in files and name not in linked:
+            tag = '<link rel="stylesheet">' if name == "style.css" else "<script>"
+            problems.append(_problem("index.html", None, f"does not load {name} with a {tag} tag"))
+    return problems[:MAX_PROBLEMS]
+
+
+def check_css(css: str) -> list[dict]:
+    problems, blocks, text = [], [], ""
+    line, i, n = 1, 0, len(css)
+    start_line = 1
+    while i < n and len(problems) < MAX_PROBLEMS:
+        c = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            if end < 0:
+                problems.append(_problem("style.css", line, "unterminated /* comment"))
+                break
+            line += css.count("\n", i, end)
+            i = end + 2
+            continue
+        if c in "\"'":
+            end = string_end(css, i)
+            if end is None:
+                problems.append(_problem("style.css", line, "unterminated string"))
+                end = css.find("\n", i)
+                i = n if end < 0 else end
+                continue
+            text += css[i:end]
+            i = end
+            continue
+        if c == "{":
+            blocks.append((text.strip(), line))
+            text = ""
+        elif c == "}":
+            if not blocks:
+                problems.append(_problem("style.css", line, "unexpected '}'"))
+            else:
+                _check_declaration(text, blocks[-1][0], start_line, problems)
+                blocks.pop()
+            text = ""
+        elif c == ";":
+            if blocks:
+                _check_declaration(text, blocks[-1][0], start_line, problems)
+            text = ""  # a top-level at-rule such as @import
+        else:
+            if not text.strip() and not c.isspace():
+                start_line = line
+            text += c
+        if c == "\n":
+            line += 1
+        i += 1
+    for prelude, opened in blocks[len(blocks) - MAX_PROBLEMS:]:
+        problems.append(_problem("style.css", opened, f"'{prelude[:40]} {{' is never closed"))
+    return problems[:MAX_PROBLEMS]
+
+
+def check_js(code: str) -> list[dict]:
+    if esprima:
+        try:
+            esprima.parseScript(code)
+        except esprima.Error as e:
+            return [_problem("game.js", e.lineNumber,
+                             re.sub(r"^Line \d+: ", "", e.message))]
+        return []
+    return _scan_js(code)
+
+
+def repair(plan: dict, files: dict[str, str], filename: str, problems: list[dict],
+           ctx: BuildContext):
+    """Ask the model to fix (or write, if missing) one file, as a step.
+
+    Only the plan, the failing file and its problems are sent; a missing
+    file is written against index.html, or against the other files if
+    index.html itself is missing.
+
+    Returns:
+        The new file content, or "" if the reply had no block for it.
+    """
+    chat, prompt = _repair_chat(plan, files, filename, problems, ctx)
+    return extract_files((yield steps.Send(chat, prompt)).text).get(filename, "")
+
+
+def by_file(problems: list[dict]) -> dict[str, list[dict]]:
+    """Problems grouped per file, in repair order."""
+    grouped = {name: [] for name in FILE_LANGS}
+    for problem in problems:
+        grouped.setdefault(problem["file"], []).append(problem)
+    return {name: found for name, found in grouped.items() if found}
+
+
+def _repair_chat(plan: dict, files: dict[str, str], filename: str, problems: list[dict],
+                 ctx: BuildContext) -> tuple[llm.Chat, str]:
+    lang = FILE_LANGS[filename]
+    listed = "\n".join(
+        f"- line {p['line']}: {p['message']}" if p["line"] else f"- {p['message']}"
+        for p in problems
+    )
+    if filename in files:
+        prompt = REPAIR_PROMPT.format(file=filename, lang=lang, problems=listed,
+                                      content=files[filename])
+    else:
+        others = {"index.html": files["index.html"]} if "index.html" in files else files
+        prompt = MISSING_FILE_PROMPT.format(file=filename, lang=lang, problems=listed,
+                                            others=_quote(others))
+    prompt = f"Game plan:\n\n```json\n{json.dumps(plan)}\n```\n\n" + prompt
+    chat = llm.Chat(
+        ctx, "execute.repair", FANOUT_SYSTEM_PROMPT,
+        ctx.generation_config("execute", temperature=0.2, max_output_tokens=16384),
+    )
+    return chat, prompt
+
+
+def _quote(files: dict[str, str]) -> str:
+    return "\n\n".join(f"{name}:\n```{FILE_LANGS.get(name, '')}\n{content}\n```"
+                       for name, content in files.items())
+
+
+def _count(problems: list[dict]) -> list[dict]:
+    for name, found in by_file(problems).items():
+        metrics.VALIDATION_PROBLEMS.inc(len(found), file=name)
+    return problems
+
+
+def _repair_event(filename: str, found: list[dict]) -> dict:
+    print(f"{filename}: {len(found)} problem(s) — requesting a repair "
+          f"(first: {found[0]['message']})...")
+    return {"type": "repair", "file": filename, "problems": len(found)}
+
+
+def _keep(files: dict[str, str], filename: str, found: list[dict], fixed: str) -> bool:
+    """Take the repair into ``files`` if it leaves fewer problems in the file."""
+    left = [p for p in check({**files, filename: fixed})
+            if p["file"] == filename] if fixed else found
+    metrics.REPAIRS.inc(file=filename, outcome=(
+        "fixed" if not left else "improved" if len(left) < len(found) else "failed"))
+    if len(left) < len(found):
+        files[filename] = fixed
+        return True
+    return False
+
+
+def _report(problems: list[dict]):
+    if problems:
+        print(f"{len(problems)} problem(s) left after repair: "
+              + "; ".join(f"{p['file']}: {p['message']}" for p in problems))
+
+
+# ── Checks ─────────────────────────────────────────────────────────────────
+
+class _References(HTMLParser):
+    """Collects the local resources a page loads, with their line numbers."""
+
+    def __init__(self):
+        super().__init__()
+        self.refs: list[tuple[int, str]] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "link" and "stylesheet" in (attrs.get("rel") or "").lower().split():
+            ref = attrs.get("href")
+        elif tag in ("script", "img", "audio", "source", "video"):
+            ref = attrs.get("src")
+        else:
+            return
+        if ref:
+            self.refs.append((self.getpos()[0], ref.strip()))
+
+
+def _check_declaration(text: str, prelude: str, line: int, problems: list[dict]):
+    """Inside a style rule, a non-empty statement must be ``property: value``."""
+    text = text.strip()
+    if not text or (prelude.startswith("@") and prelude.split()[0] not in (
+            "@font-face", "@page")):
+        return  # nested rules of @media, @keyframes, @supports ...
+    if ":" not in text:
+        problems.append(_problem("style.css", line, f"'{text[:40]}' is not a declaration"))
+
+
+def _scan_js(code: str) -> list[dict]:
+    """Tokenize just enough JavaScript to find unbalanced or unterminated code."""
+    problems = []
+    stack: list[tuple[str, int]] = []  # open bracket (or "${") and its line
+    prev: str | None = None  # last significant punctuator or word
+    line, i, n = 1, 0, len(code)
+
+    def fail(message, at=None):
+        problems.append(_problem("game.js", at or line, message))
+
+    while i < n:
+        c = code[i]
+        if c == "\n":
+            line += 1
+            i += 1
+        elif c.isspace():
+            i += 1
+        elif code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end < 0:
+                fail("unterminated /* comment")
+                break
+            line += code.count("\n", i, end)
+            i = end + 2
+        elif c in "\"'":
+            end = string_end(code, i)
+            if end is None:
+                fail("unterminated string literal")
+                break
+            i, prev = end, "string"
+        elif c == "`" or (c == "}" and stack and stack[-1][0] == "${"):
+            if c == "}":
+                stack.pop()
+            end, line, opened = template_end(code, i + 1, line)
+            if end is None:
+                fail("unterminated template literal")
+                break
+            if opened:
+                stack.append(("${", line))
+            i, prev = end, "string"
+        elif c == "/" and (prev in REGEX_AFTER or prev in REGEX_KEYWORDS):
+            end = regex_end(code, i)
+            if end is None:
+                fail("unterminated regular expression")
+                break
+            i, prev = end, "regex"
+        elif code.startswith(("++", "--"), i):
+            # One token, so that "/" after a postfix i++ reads as division
+            i, prev = i + 2, code[i:i + 2]
+        elif c in "([{":
+            stack.append((c, line))
+            i, prev = i + 1, c
+        elif c in ")]}":
+            if not stack or stack[-1][0] != _CLOSERS[c]:
+                opened = f" (the open '{stack[-1][0]}' is from line {stack[-1][1]})" \
+                    if stack else ""
+                fail(f"unexpected '{c}'{opened}")
+                break
+            stack.pop()
+            i, prev = i + 1, c
+        elif c.isalnum() or c in "_$":
+            match = re.compile(r"[\w$.]+").match(code, i)
+            i, prev = match.end(), match.group()
+        else:
+            i, prev = i + 1, c
+        if len(problems) >= MAX_PROBLEMS:
+            break
+
+    if not problems:
+        for bracket, opened in reversed(stack[-MAX_PROBLEMS:]):
+            what = "template expression '${'" if bracket == "${" else f"'{bracket}'"
+            fail(f"{what} is never closed (file ends at line {line})", opened)
+    return problems
+
+
+def _problem(file: str, line: int | None, message: str) -> dict:
+    return {"file": file, "line": line, "message": message}
@@ -0,0 +1,159 @@
+"""Speculative planning — run Phase 2 while the user reviews the requirements.
+
+As soon as clarification reports the requirements clear, ``start`` runs
+``plan.run`` in the background. ``take`` hands the result to ``/api/build``
+if the requirements and history it was started from are still the
+session's and it has started; otherwise the plan is dropped and the build
+plans as before. Another clarification turn or session expiry cancels it,
+and none is started while ``PLAN_PREFETCH_WORKERS`` plans are in flight.
+
+Prefetched plans live in this process only; a build that lands on another
+worker simply plans again. ``AsyncPlanPrefetcher`` does the same on an
+event loop, for the ASGI app.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from config import PLAN_PREFETCH_ENABLED, PLAN_PREFETCH_WORKERS
+from phases import plan
+from phases.context import BuildContext
+from ratelimit import BULK
+
+
+class PlanPrefetcher:
+    """At most one speculative plan per session, on a small worker pool.
+
+    Speculation is skipped rather than queued once ``workers`` plans are in
+    flight, so a plan handed to a build is never waiting behind others.
+
+    Each future resolves to ``(plan, history, ctx)``, as ``plan.run`` returns
+    plus the context it ran with, whose timings and token usage the build
+    takes over.
+    """
+
+    def __init__(self, workers: int = PLAN_PREFETCH_WORKERS, enabled: bool = PLAN_PREFETCH_ENABLED):
+        self.enabled = enabled
+        self.workers = workers
+        self._executor = None
+        self._pending: dict[str, tuple[str, Future]] = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, requirements: str, history: list[dict]) -> Future | None:
+        """Start planning for a session, replacing a plan for other inputs."""
+        if not self.enabled:
+            return None
+        key = _key(requirements, history)
+        with self._lock:
+            current = self._pending.get(session_id)
+            if current and current[0] == key:
+                return current[1]
+            if current:
+                del self._pending[session_id]
+            saturated = self._in_flight >= self.workers
+            if not saturated:
+                ctx = BuildContext.for_session(session_id, priority=BULK)
+                future = self._submit(requirements, history, ctx)
+                self._pending[session_id] = (key, future)
+                self._in_flight += 1
+        if current:
+            _drop(current[1], "stale")
+        if saturated:
+            metrics.PLAN_PREFETCH.inc(outcome="skipped")
+            return None
+        future.add_done_callback(self._finished)
+        metrics.PLAN_PREFETCH.inc(outcome="started")
+        return future
+
+    def take(self, session_id: str, requirements: str, history: list[dict]) -> Future | None:
+        """Remove and return the session's plan if it was made from these inputs.
+
+        The future may still be running; the caller waits on it. One still
+        queued is cancelled instead, as planning inline is no slower.
+        """
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if not entry:
+            return None
+        key, future = entry
+        if key != _key(requirements, history):
+            _drop(future, "stale")
+            return None
+        if not self._started(future):
+            _drop(future, "queued")
+            return None
+        metrics.PLAN_PREFETCH.inc(outcome="used")
+        return future
+
+    def cancel(self, session_id: str):
+        """Drop the session's speculative plan, if any.
+
+        A plan not yet started never runs; one in flight finishes its model
+        call, and the result is discarded.
+        """
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry:
+            _drop(entry[1], "cancelled")
+
+    def shutdown(self, wait: bool = True):
+        if self._executor:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _started(self, future: Future) -> bool:
+        return future.running() or future.done()
+
+    def _submit(self, requirements: str, history: list[dict], ctx: BuildContext) -> Future:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="prefetch")
+        return self._executor.submit(_plan, requirements, history, ctx)
+
+
+class AsyncPlanPrefetcher(PlanPrefetcher):
+    """``PlanPrefetcher`` whose plans are tasks running ``plan.run_async``.
+
+    ``take`` returns the ``asyncio.Task`` to await, and cancelling a plan
+    stops its model call. Call it from the event loop.
+    """
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for _, task in pending.values():
+            task.cancel()
+
+    def _started(self, task) -> bool:
+        return True  # tasks are not queued; each one runs as soon as the loop is free
+
+    def _submit(self, requirements: str, history: list[dict], ctx: BuildContext):
+        return asyncio.ensure_future(_plan_async(requirements, history, ctx))
+
+
+def _plan(requirements: str, history: list[dict], ctx: BuildContext):
+    game_plan, history = plan.run(requirements, history, ctx)
+    return game_plan, history, ctx
+
+
+async def _plan_async(requirements: str, history: list[dict], ctx: BuildContext):
+    game_plan, history = await plan.run_async(requirements, history, ctx)
+    return game_plan, history, ctx
+
+
+def _drop(future: Future, outcome: str):
+    future.cancel()
+    metrics.PLAN_PREFETCH.inc(outcome=outcome)
+
+
+def _key(requirements: str, history: list[dict]) -> str:
+    data = json.dumps([requirements, history], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
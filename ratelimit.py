@@ -0,0 +1,301 @@
+"""Rate limiting and adaptive concurrency for model requests.
+
+``RateLimiter`` paces requests and tokens per minute with token buckets,
+kept in memory or in a SQLite file shared by several processes.
+``AdaptiveConcurrency`` caps in-flight requests and adjusts the cap AIMD
+style: it creeps up while requests succeed and halves on quota errors.
+Both serve ``INTERACTIVE`` waiters (clarification turns a user is watching)
+before ``BULK`` ones (builds, batch runs). ``SpendBudget`` bounds the tokens
+spent on duplicate requests (hedging, best-of-N) relative to the rest.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class RateLimiter:
+    """Token buckets allowing ``per_minute`` requests and ``tokens_per_minute`` tokens.
+
+    The request bucket holds up to ``burst`` requests and refills
+    continuously, so requests are spread evenly instead of arriving in
+    bursts. The token bucket is debited by an estimate before each request
+    and by the actual output afterwards (``charge``), so it may go into debt
+    and hold later requests back. Either limit may be 0 (unlimited).
+
+    With ``path`` set, the buckets live in that SQLite file and every
+    process using it shares the limits. ``clock`` gives the time the buckets
+    refill by (tests pass a fake one).
+    """
+
+    def __init__(self, per_minute: float, burst: int | None = None,
+                 tokens_per_minute: float = 0, path: str | None = None,
+                 clock=time.time):
+        limits = {}
+        if per_minute > 0:
+            limits["requests"] = (per_minute / 60.0, burst or max(1, int(per_minute // 10)))
+        if tokens_per_minute > 0:
+            limits["tokens"] = (tokens_per_minute / 60.0, tokens_per_minute / 6.0)
+        self.limits = limits
+        self._buckets = (_SQLiteBuckets(path, limits, clock) if path
+                         else _Buckets(limits, clock))
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens: float = 0.0, priority: str = BULK) -> float:
+        """Block until a request and ``tokens`` are available, then take them.
+
+        Bulk requests wait while any interactive request is waiting.
+
+        Returns:
+            Seconds spent waiting.
+        """
+        wanted = {"requests": 1.0, "tokens": tokens}
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    if priority == BULK and self._waiting[INTERACTIVE]:
+                        self._cond.wait(0.1)
+                        continue
+                    wait = self._buckets.take(wanted)
+                    if wait <= 0:
+                        return time.monotonic() - start
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    async def acquire_async(self, tokens: float = 0.0, priority: str = BULK) -> float:
+        """``acquire`` for coroutines: waits with ``asyncio.sleep``, not a thread."""
+        wanted = {"requests": 1.0, "tokens": tokens}
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._cond:
+                    if priority == BULK and self._waiting[INTERACTIVE]:
+                        wait = 0.1
+                    else:
+                        wait = self._buckets.take(wanted)
+                if wait <= 0:
+                    return time.monotonic() - start
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def charge(self, tokens: float):
+        """Debit tokens used beyond the estimate taken in ``acquire``."""
+        if tokens > 0:
+            self._buckets.charge("tokens", tokens)
+
+
+class AdaptiveConcurrency:
+    """Caps in-flight requests, adapting the cap to quota errors (AIMD).
+
+    Each success raises the limit by ``1 / limit`` (about one per round of
+    requests); each quota or overload error halves it, never below
+    ``minimum`` or above ``maximum``.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.active = 0
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, priority: str = BULK):
+        """Hold one request slot; yields a dict whose ``overloaded`` flag feeds AIMD."""
+        outcome = {"overloaded": False}
+        self.acquire(priority)
+        try:
+            yield outcome
+        finally:
+            self.release(outcome["overloaded"])
+
+    @asynccontextmanager
+    async def slot_async(self, priority: str = BULK):
+        """``slot`` for coroutines."""
+        outcome = {"overloaded": False}
+        await self.acquire_async(priority)
+        try:
+            yield outcome
+        finally:
+            self.release(outcome["overloaded"])
+
+    def acquire(self, priority: str = BULK):
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while (self.active >= int(self.limit)
+                       or (priority == BULK and self._waiting[INTERACTIVE])):
+                    self._cond.wait()
+                self.active += 1
+            finally:
+                self._waiting[priority] -= 1
+
+    async def acquire_async(self, priority: str = BULK):
+        """Wait for a slot by polling, so that a thread releasing a slot
+        needs no handle on the event loop."""
+        delay = 0.005
+        with self._cond:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._cond:
+                    if self.active < int(self.limit) and not (
+                            priority == BULK and self._waiting[INTERACTIVE]):
+                        self.active += 1
+                        return
+                await asyncio.sleep(delay)
+                delay = min(0.1, delay * 2)
+        finally:
+            with self._cond:
+                self._waiting[priority] -= 1
+
+    def release(self, overloaded: bool = False):
+        with self._cond:
+            self.active -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class SpendBudget:
+    """Caps extra spend at ``ratio`` of base spend, plus a ``burst`` allowance.
+
+    Base requests ``earn`` their tokens. An extra request ``reserve``s the
+    mean size of a base request before it starts (the whole ``burst`` until
+    one has been seen) and is refused if that would exceed the cap; once it
+    ends it is ``charge``d what it actually used.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.base = 0.0
+        self.base_requests = 0
+        self.extra = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self, tokens: float):
+        with self._lock:
+            self.base += tokens
+            self.base_requests += 1
+
+    def reserve(self) -> float | None:
+        """Reserve the expected cost of one extra request; None if over budget."""
+        with self._lock:
+            cost = self.base / self.base_requests if self.base_requests else self.burst
+            if self.extra + cost > self.ratio * self.base + self.burst:
+                return None
+            self.extra += cost
+            return cost
+
+    def charge(self, reserved: float, tokens: float):
+        """Replace a reservation with the tokens the request actually used."""
+        with self._lock:
+            self.extra += tokens - reserved
+
+
+class _Buckets:
+    """Named token buckets updated together, held in this process."""
+
+    def __init__(self, limits: dict[str, tuple[float, float]], clock=time.time):
+        # name -> (refill per second, capacity)
+        self.limits = limits
+        self.clock = clock
+        self._levels = {name: (capacity, clock())
+                        for name, (_, capacity) in limits.items()}
+        self._lock = threading.Lock()
+
+    def take(self, wanted: dict[str, float]) -> float:
+        """Take every wanted amount and return 0, or take nothing and return
+        the seconds until all of them are available."""
+        with self._state() as levels:
+            now = self.clock()
+            current, wait = {}, 0.0
+            for name, (rate, capacity) in self.limits.items():
+                level, updated = levels[name]
+                level = min(capacity, level + (now - updated) * rate)
+                current[name] = level
+                # A request larger than the bucket waits for a full bucket
+                need = min(wanted.get(name, 0.0), capacity)
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+            for name, level in current.items():
+                taken = wanted.get(name, 0.0) if wait <= 0 else 0.0
+                levels[name] = (level - taken, now)
+            return wait
+
+    def charge(self, name: str, amount: float):
+        if name not in self.limits:
+            return
+        with self._state() as levels:
+            level, updated = levels[name]
+            levels[name] = (level - amount, updated)
+
+    @contextmanager
+    def _state(self):
+        with self._lock:
+            yield self._levels
+
+
+class _SQLiteBuckets(_Buckets):
+    """Buckets in a SQLite file, so separate processes share one limit."""
+
+    def __init__(self, path: str, limits: dict[str, tuple[float, float]],
+                 clock=time.time):
+        super().__init__(limits, clock)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                   "name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+        db.executemany("INSERT OR IGNORE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                       [(name, level, updated)
+                        for name, (level, updated) in self._levels.items()])
+        db.commit()
+
+    @contextmanager
+    def _state(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")  # one writer at a time across processes
+        try:
+            levels = {name: (level, updated) for name, level, updated
+                      in db.execute("SELECT name, level, updated FROM buckets")}
+            levels.update({name: self._levels[name]
+                           for name in self.limits if name not in levels})
+            yield levels
+            db.executemany("INSERT OR REPLACE INTO buckets (name, level, updated) "
+                           "VALUES (?, ?, ?)",
+                           [(name, level, updated)
+                            for name, (level, updated) in levels.items()])
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,212 @@
+"""Web session stores — bounded in-memory LRU or shared SQLite, with expiry."""
+
+import abc
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    OUTPUT_DIR, SESSION_STORE, SESSION_DB_PATH, SESSION_TTL,
+    SESSION_MAX_ENTRIES, SESSION_MAX_MB, SESSION_SWEEP_INTERVAL,
+)
+
+
+class SessionStore(abc.ABC):
+    """Interface shared by the session stores.
+
+    Sessions are plain JSON-serializable dicts. Callers ``get`` a session,
+    change it, and ``save`` it back; a session is idle once it has not been
+    read or saved for ``ttl`` seconds.
+    """
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> dict | None:
+        """The session, or None if it does not exist."""
+
+    @abc.abstractmethod
+    def save(self, session_id: str, session: dict):
+        """Store the session, replacing any previous one."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str):
+        """Drop the session if it exists."""
+
+    @abc.abstractmethod
+    def exists(self, session_id: str) -> bool:
+        """Whether the session exists, without counting as an access."""
+
+    @abc.abstractmethod
+    def expire(self) -> list[str]:
+        """Drop idle (and evicted) sessions and return their ids."""
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU store capped by entry count and serialized size."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # session_id -> (session, size, last_access)
+        self._sessions: OrderedDict[str, tuple[dict, int, float]] = OrderedDict()
+        self._evicted: list[str] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> dict | None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            session, size, _ = entry
+            self._sessions[session_id] = (session, size, time.time())
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session_id: str, session: dict):
+        size = len(json.dumps(session))
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old:
+                self._bytes -= old[1]
+            self._sessions[session_id] = (session, size, time.time())
+            self._bytes += size
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_entries
+                                               or self._bytes > self.max_bytes):
+                evicted_id, (_, evicted_size, _) = self._sessions.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evicted.append(evicted_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old:
+                self._bytes -= old[1]
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def expire(self) -> list[str]:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired, self._evicted = self._evicted, []
+            for session_id, (_, size, last_access) in list(self._sessions.items()):
+                if last_access < cutoff:
+                    del self._sessions[session_id]
+                    self._bytes -= size
+                    expired.append(session_id)
+        return expired
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store backed by one SQLite file that several worker processes can share."""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed_at)"
+        )
+        db.commit()
+
+    def get(self, session_id: str) -> dict | None:
+        db = self._db()
+        row = db.execute("SELECT data FROM sessions WHERE id = ?",
+                         (session_id,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE sessions SET accessed_at = ? WHERE id = ?",
+                   (time.time(), session_id))
+        db.commit()
+        return json.loads(row[0])
+
+    def save(self, session_id: str, session: dict):
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, accessed_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(session), time.time()),
+        )
+        db.commit()
+
+    def delete(self, session_id: str):
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        db.commit()
+
+    def exists(self, session_id: str) -> bool:
+        row = self._db().execute("SELECT 1 FROM sessions WHERE id = ?",
+                                 (session_id,)).fetchone()
+        return row is not None
+
+    def expire(self) -> list[str]:
+        db = self._db()
+        with db:
+            rows = db.execute(
+                "SELECT id FROM sessions WHERE accessed_at < ? "
+                "UNION SELECT id FROM sessions WHERE id NOT IN "
+                "(SELECT id FROM sessions ORDER BY accessed_at DESC LIMIT ?)",
+                (time.time() - self.ttl, self.max_entries),
+            ).fetchall()
+            expired = [row[0] for row in rows]
+            db.executemany("DELETE FROM sessions WHERE id = ?",
+                           [(session_id,) for session_id in expired])
+        return expired
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers and the writer overlap."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+def create_store() -> SessionStore:
+    """Build the session store selected by ``SESSION_STORE``."""
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH, SESSION_TTL, SESSION_MAX_ENTRIES)
+    if SESSION_STORE == "memory":
+        return MemorySessionStore(SESSION_MAX_ENTRIES, SESSION_MAX_MB * 1024 * 1024,
+                                  SESSION_TTL)
+    raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE!r} (use memory or sqlite)")
+
+
+def start_sweeper(store: SessionStore, on_expire=None,
+                  interval: float = SESSION_SWEEP_INTERVAL) -> threading.Thread:
+    """Expire sessions every ``interval`` seconds on a daemon thread.
+
+    Each expired session's ``OUTPUT_DIR/<session_id>`` directory is deleted,
+    then ``on_expire(session_id)`` is called for any other cleanup.
+    """
+    def sweep():
+        while True:
+            time.sleep(interval)
+            try:
+                for session_id in store.expire():
+                    shutil.rmtree(os.path.join(OUTPUT_DIR, session_id),
+                                  ignore_errors=True)
+                    if on_expire:
+                        on_expire(session_id)
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+    thread = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+    thread.start()
+    return thread
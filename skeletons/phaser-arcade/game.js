@@ -0,0 +1,98 @@
+// {{title_comment}} — game.js
+// Phaser boot config, scenes, input, HUD and game flow come from the
+// phaser-arcade skeleton; the game itself is in the "Game" section.
+
+const W = {{width}}, H = {{height}};
+const TITLE = {{title_js}};
+const TEXT = { fontFamily: 'system-ui, sans-serif', color: '#ffffff' };
+let best = 0;
+
+// ── Game ───────────────────────────────────────────────────────────────────
+{{hooks}}
+
+// ── Scenes ─────────────────────────────────────────────────────────────────
+class MenuScene extends Phaser.Scene {
+  constructor() { super('menu'); }
+
+  create() {
+    this.add.text(W / 2, H / 2 - 40, TITLE, { ...TEXT, fontSize: '42px', fontStyle: 'bold' })
+      .setOrigin(0.5);
+    this.add.text(W / 2, H / 2 + 20, 'Press Space or click to start', { ...TEXT, fontSize: '20px' })
+      .setOrigin(0.5);
+    this.input.keyboard.once('keydown-SPACE', () => this.scene.start('playing'));
+    this.input.once('pointerdown', () => this.scene.start('playing'));
+  }
+}
+
+class PlayScene extends Phaser.Scene {
+  constructor() { super('playing'); }
+
+  preload() {
+    if (typeof preloadGame === 'function') preloadGame(this);
+  }
+
+  create() {
+    this.score = 0;
+    this.lives = 3;
+    this.ended = false;
+    this.cursors = this.input.keyboard.createCursorKeys();
+    this.keys = this.input.keyboard.addKeys('W,A,S,D,SPACE');
+    createGame(this);
+    this.hud = this.add.text(16, 12, '', { ...TEXT, fontSize: '20px' })
+      .setScrollFactor(0).setDepth(1000);
+    this.updateHud();
+  }
+
+  update(time, delta) {
+    if (this.ended) return;
+    updateGame(this, Math.min(0.05, delta / 1000));
+    if (this.lives !== null && this.lives <= 0) this.endGame();
+    this.updateHud();
+  }
+
+  addScore(points) {
+    this.score += points;
+  }
+
+  loseLife() {
+    if (this.lives !== null) this.lives -= 1;
+  }
+
+  updateHud() {
+    const lives = this.lives !== null ? `   Lives: ${this.lives}` : '';
+    this.hud.setText(`Score: ${this.score}${lives}`);
+  }
+
+  endGame() {
+    if (this.ended) return;
+    this.ended = true;
+    best = Math.max(best, this.score);
+    this.scene.start('game_over', { score: this.score });
+  }
+}
+
+class GameOverScene extends Phaser.Scene {
+  constructor() { super('game_over'); }
+
+  create(data) {
+    this.add.text(W / 2, H / 2 - 50, 'GAME OVER', { ...TEXT, fontSize: '42px', fontStyle: 'bold' })
+      .setOrigin(0.5);
+    this.add.text(W / 2, H / 2 + 5, `Score: ${data.score}   Best: ${best}`, { ...TEXT, fontSize: '22px' })
+      .setOrigin(0.5);
+    this.add.text(W / 2, H / 2 + 45, 'Press Space or click to play again', { ...TEXT, fontSize: '20px' })
+      .setOrigin(0.5);
+    this.input.keyboard.once('keydown-SPACE', () => this.scene.start('playing'));
+    this.input.once('pointerdown', () => this.scene.start('playing'));
+  }
+}
+
+// ── Boot ───────────────────────────────────────────────────────────────────
+new Phaser.Game({
+  type: Phaser.AUTO,
+  width: W,
+  height: H,
+  parent: 'game',
+  backgroundColor: '#111111',
+  physics: { default: 'arcade', arcade: { gravity: { y: {{gravity}} }, debug: false } },
+  scene: [MenuScene, PlayScene, GameOverScene],
+});
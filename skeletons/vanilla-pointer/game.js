@@ -0,0 +1,130 @@
+// {{title_comment}} — game.js
+// Canvas, pointer and keyboard input, state machine, HUD and main loop come
+// from the vanilla-pointer skeleton; the game itself is in the "Game" section.
+
+// ── Canvas ─────────────────────────────────────────────────────────────────
+const canvas = document.getElementById('game');
+const ctx = canvas.getContext('2d');
+const W = canvas.width, H = canvas.height;
+const TITLE = {{title_js}};
+
+// ── Helpers ────────────────────────────────────────────────────────────────
+const clamp = (v, lo, hi) => Math.max(lo, Math.min(hi, v));
+const rand = (lo, hi) => lo + Math.random() * (hi - lo);
+const randInt = (lo, hi) => Math.floor(rand(lo, hi + 1));
+// Axis-aligned boxes with x, y (top-left), w and h
+const overlaps = (a, b) =>
+  a.x < b.x + b.w && a.x + a.w > b.x && a.y < b.y + b.h && a.y + a.h > b.y;
+// Circles with x, y (centre) and r
+const circlesOverlap = (a, b) => Math.hypot(a.x - b.x, a.y - b.y) < a.r + b.r;
+
+// ── State ──────────────────────────────────────────────────────────────────
+const game = { state: 'menu', score: 0, lives: 3, time: 0, best: 0 };
+
+function startGame() {
+  Object.assign(game, { state: 'playing', score: 0, lives: 3, time: 0 });
+  setupGame(game);
+}
+
+function endGame() {
+  if (game.state !== 'playing') return;
+  game.state = 'game_over';
+  game.best = Math.max(game.best, game.score);
+}
+
+// ── Input ──────────────────────────────────────────────────────────────────
+const keys = {};
+const SCROLL_KEYS = ['ArrowUp', 'ArrowDown', 'ArrowLeft', 'ArrowRight', ' '];
+
+addEventListener('keydown', e => {
+  if (SCROLL_KEYS.includes(e.key)) e.preventDefault();
+  const pressed = !keys[e.key];
+  keys[e.key] = true;
+  if (game.state !== 'playing') {
+    if (e.key === ' ' || e.key === 'Enter') startGame();
+  } else if (pressed && typeof onKeyDown === 'function') {
+    onKeyDown(game, e.key);
+  }
+});
+addEventListener('keyup', e => { keys[e.key] = false; });
+addEventListener('blur', () => {
+  for (const key in keys) keys[key] = false;
+  pointer.down = false;
+});
+
+// Pointer position in canvas pixels, whatever size the canvas is shown at
+const pointer = { x: W / 2, y: H / 2, down: false };
+
+function movePointer(e) {
+  const rect = canvas.getBoundingClientRect();
+  pointer.x = (e.clientX - rect.left) * (W / rect.width);
+  pointer.y = (e.clientY - rect.top) * (H / rect.height);
+}
+
+canvas.style.touchAction = 'none';
+canvas.addEventListener('pointermove', movePointer);
+canvas.addEventListener('pointerdown', e => {
+  movePointer(e);
+  pointer.down = true;
+  if (game.state !== 'playing') {
+    startGame();
+  } else if (typeof onPointerDown === 'function') {
+    onPointerDown(game, pointer.x, pointer.y);
+  }
+});
+addEventListener('pointerup', () => { pointer.down = false; });
+
+// ── Game ───────────────────────────────────────────────────────────────────
+{{hooks}}
+
+// ── Screens and HUD ────────────────────────────────────────────────────────
+function drawScreen(heading, lines) {
+  ctx.fillStyle = 'rgba(0, 0, 0, 0.6)';
+  ctx.fillRect(0, 0, W, H);
+  ctx.textAlign = 'center';
+  ctx.fillStyle = '#fff';
+  ctx.font = 'bold 42px system-ui, sans-serif';
+  ctx.fillText(heading, W / 2, H / 2 - 40);
+  ctx.font = '20px system-ui, sans-serif';
+  lines.forEach((line, i) => ctx.fillText(line, W / 2, H / 2 + 10 + i * 30));
+}
+
+function drawHud() {
+  ctx.textAlign = 'left';
+  ctx.fillStyle = '#fff';
+  ctx.font = '20px system-ui, sans-serif';
+  ctx.fillText(`Score: ${game.score}`, 16, 30);
+  if (game.lives !== null && game.lives !== undefined) {
+    ctx.textAlign = 'right';
+    ctx.fillText(`Lives: ${game.lives}`, W - 16, 30);
+  }
+}
+
+// ── Main loop ──────────────────────────────────────────────────────────────
+function frame(dt) {
+  if (game.state === 'playing') {
+    game.time += dt;
+    updateGame(game, dt);
+    if (game.lives !== null && game.lives <= 0) endGame();
+  }
+
+  ctx.clearRect(0, 0, W, H);
+  if (game.state === 'menu') {
+    drawScreen(TITLE, ['Click or press Space to start']);
+    return;
+  }
+  drawGame(ctx, game);
+  drawHud();
+  if (game.state === 'game_over') {
+    drawScreen('GAME OVER', [`Score: ${game.score}   Best: ${game.best}`,
+                             'Click or press Space to play again']);
+  }
+}
+
+let last = performance.now();
+function loop(now) {
+  frame(Math.min(0.05, (now - last) / 1000));
+  last = now;
+  requestAnimationFrame(loop);
+}
+requestAnimationFrame(loop);
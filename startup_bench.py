@@ -0,0 +1,132 @@
+"""Cold-start checks — import-time budget and time to first response.
+
+Every measurement runs in a fresh interpreter, as a container scaling from
+zero would:
+
+- ``python -X importtime -c "import <entry point>"`` for the web app and the
+  CLI, reporting the slowest modules. The check fails if an import takes
+  longer than the budget, or if a module that must load lazily (the Gemini
+  SDK) is imported at startup.
+- The time until the app has served ``/`` and the static UI, measured
+  from interpreter start through the Flask test client.
+
+Usage:
+    python startup_bench.py --budget-ms 400 --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ("app", "main")
+# Must not be imported until the first model request
+LAZY_MODULES = ("google.generativeai", "grpc")
+
+FIRST_RESPONSE = """
+import time
+start = time.perf_counter()
+from app import app
+client = app.test_client()
+assert client.get("/").status_code == 200
+assert client.get("/static/style.css").status_code == 200
+import sys, json
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "lazy_loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time.")
+    parser.add_argument("--budget-ms", type=float, default=400,
+                        help="fail if importing an entry point takes longer (default: 400)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="fresh interpreters per measurement (default: 5)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="slowest imports to list (default: 10)")
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results, failures = {"imports": {}, "first_response": {}}, []
+    for module in ENTRY_POINTS:
+        runs = [import_profile(module) for _ in range(args.runs)]
+        total_ms = statistics.median(run["total_ms"] for run in runs)
+        loaded = sorted({m for run in runs for m in run["lazy_loaded"]})
+        results["imports"][module] = {"median_ms": total_ms, "lazy_loaded": loaded,
+                                      "slowest": runs[-1]["slowest"][:args.top]}
+
+        print(f"\nimport {module}: {total_ms:.0f} ms median over {args.runs} run(s) "
+              f"(budget {args.budget_ms:.0f} ms)")
+        for name, cumulative_ms in runs[-1]["slowest"][:args.top]:
+            print(f"  {cumulative_ms:8.1f} ms  {name}")
+        if total_ms > args.budget_ms:
+            failures.append(f"import {module} took {total_ms:.0f} ms "
+                            f"(budget {args.budget_ms:.0f} ms)")
+        if loaded:
+            failures.append(f"import {module} loaded {', '.join(loaded)} eagerly")
+
+    samples = [first_response() for _ in range(args.runs)]
+    in_process = [s["seconds"] * 1000 for s in samples]
+    process = [s["process_seconds"] * 1000 for s in samples]
+    results["first_response"] = {
+        "median_ms": statistics.median(in_process),
+        "max_ms": max(in_process),
+        "process_median_ms": statistics.median(process),
+    }
+    print(f"\nFirst response (/ and static UI): {statistics.median(in_process):.0f} ms "
+          f"median after interpreter start, {statistics.median(process):.0f} ms "
+          "including interpreter startup and exit")
+    if any(s["lazy_loaded"] for s in samples):
+        failures.append("serving / loaded the Gemini SDK")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nStartup within budget.")
+
+
+def import_profile(module: str) -> dict:
+    """Import ``module`` in a fresh interpreter with ``-X importtime``."""
+    proc = _run(["-X", "importtime", "-c", f"import {module}"])
+    slowest, total_ms, imported = [], 0.0, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name, cumulative_ms = name.strip(), int(cumulative) / 1000
+        imported.add(name)
+        slowest.append((name, cumulative_ms))
+        if name == module:
+            total_ms = cumulative_ms  # excludes interpreter startup (site, encodings)
+    slowest.sort(key=lambda item: item[1], reverse=True)
+    return {"total_ms": total_ms, "slowest": slowest,
+            "lazy_loaded": [m for m in LAZY_MODULES if m in imported]}
+
+
+def first_response() -> dict:
+    start = time.perf_counter()
+    proc = _run(["-c", FIRST_RESPONSE])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def _run(args: list[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    # Startup never calls the API, but config.py requires a key for the real backend
+    env.setdefault("GOOGLE_API_KEY", "startup-check")
+    proc = subprocess.run([sys.executable, *args], capture_output=True, text=True,
+                          env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+    return proc
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Test setup: the offline fake model, no response cache, a throwaway output dir."""
+
+import os
+import re
+import tempfile
+
+# Before anything reads config: never touch the network, the shared cache or ./output
+os.environ["MODEL_BACKEND"] = "fake"
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["LLM_RECORD_PATH"] = ""
+os.environ["OUTPUT_DIR"] = tempfile.mkdtemp(prefix="test-output-")
+os.environ["ARTIFACT_GC_INTERVAL"] = "0"
+
+import pytest
+
+import llm
+from fake_model import FakeBackend
+
+TAG = re.compile(r"\bTag\d+\b")
+
+
+class TaggedBackend(FakeBackend):
+    """Canned replies carrying the ``Tag<n>`` named in the session's own messages.
+
+    The tag goes into the requirements and replaces the canned game title,
+    so it reaches the plan and every generated page; a file or event with
+    another session's tag was produced for the wrong session.
+    """
+
+    def respond(self, system_prompt: str, message: str,
+                history: list[dict]) -> tuple[str, str]:
+        text, finish_reason = super().respond(system_prompt, message, history)
+        seen = TAG.search(" ".join([message, *(p for m in history for p in m["parts"])]))
+        if not seen:
+            return text, finish_reason
+        tag = seen.group()
+        if text.startswith("REQUIREMENTS_CLEAR"):
+            text += f"- The game is called {tag}\n"
+        return text.replace("Star Catcher", tag).replace("STAR CATCHER", tag), finish_reason
+
+
+@pytest.fixture
+def tagged_backend():
+    """Swap in a ``TaggedBackend`` with a short first-token delay, so builds overlap."""
+    previous = llm.backend
+    llm.set_backend(TaggedBackend(ttft=0.01))
+    yield llm.backend
+    llm.set_backend(previous)
@@ -0,0 +1,16 @@
+"""Linking store objects into session directories."""
+
+import os
+
+from artifact_store import ArtifactStore
+
+
+def test_relinking_the_same_object_leaves_no_temporary_files(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    path = tmp_path / "game.js"
+    for data in [b"v1", b"v1", b"v1", b"v2", b"v2", b"v1"]:
+        store.store(str(path), data)
+        assert path.read_bytes() == data
+
+    assert sorted(os.listdir(tmp_path)) == ["game.js", "store"]
+    assert os.path.samefile(path, store.path(store.put(b"v1")))
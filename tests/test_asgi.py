@@ -0,0 +1,128 @@
+"""Load test: hundreds of slow builds in flight at once on the ASGI server's one loop."""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import llm
+
+from conftest import TAG, TaggedBackend
+
+BUILDS = 200
+TTFT = 0.25  # seconds before each fake reply starts
+
+
+class CountingBackend(TaggedBackend):
+    """``TaggedBackend`` that counts the model calls made."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def respond(self, system_prompt, message, history):
+        with self._lock:
+            self.calls += 1
+        return super().respond(system_prompt, message, history)
+
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    """A slow fake model, with no cap on concurrent model calls."""
+    monkeypatch.setattr(llm, "concurrency", None)
+    previous = llm.backend
+    llm.set_backend(CountingBackend(ttft=TTFT))
+    yield llm.backend
+    llm.set_backend(previous)
+
+
+async def request(app, method: str, path: str, body: dict | None = None):
+    """Call an ASGI app in-process; ``(status, headers, body)``, streams read to the end."""
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json")]}
+    pending = [json.dumps(body).encode() if body is not None else b""]
+    sent = asyncio.Event()
+    response = {"body": b""}
+
+    async def receive():
+        if pending:
+            return {"type": "http.request", "body": pending.pop()}
+        await sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                sent.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def _session(app, tag: str) -> dict:
+    """The browser's flow: clarify, build, follow the events, load the game."""
+    _, _, started = await request(app, "POST", "/api/start",
+                                  {"game_idea": f"A game called {tag}"})
+    started = json.loads(started)
+    session_id = started["session_id"]
+    if not started["is_clear"]:
+        await request(app, "POST", "/api/message",
+                      {"session_id": session_id, "message": "Go ahead"})
+    status, _, built = await request(app, "POST", "/api/build", {"session_id": session_id})
+    assert status == 202, built
+    job_id = json.loads(built)["job_id"]
+    _, _, stream = await request(app, "GET", f"/api/jobs/{job_id}/events")
+    events = [json.loads(line[len("data: "):]) for line in stream.decode().splitlines()
+              if line.startswith("data: ")]
+    page = await request(app, "GET", events[-1]["preview_url"])
+    return {"session_id": session_id, "events": events, "page": page}
+
+
+def test_hundreds_of_slow_builds_share_one_loop(slow_backend, monkeypatch):
+    import asgi
+    monkeypatch.setattr(asgi.build_queue, "max_queued", BUILDS)
+    tags = [f"Tag{n}" for n in range(1000, 1000 + BUILDS)]
+
+    async def run():
+        return await asyncio.gather(*(_session(asgi.app, tag) for tag in tags))
+
+    threads = threading.active_count()
+    peak = threads
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, threading.active_count() - 1)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run())
+    finally:
+        done.set()
+        sampler.join()
+    wall = time.perf_counter() - start
+
+    for tag, result in zip(tags, results):
+        done_event = result["events"][-1]
+        assert done_event["type"] == "done", result["events"][-3:]
+        assert done_event["preview_url"].startswith(f"/api/preview/{result['session_id']}/")
+        assert set(TAG.findall(json.dumps(result["events"]))) == {tag}
+        status, headers, page = result["page"]
+        assert status == 200 and set(TAG.findall(page.decode())) == {tag}
+        assert headers["content-type"] == "text/html; charset=utf-8"
+        assert headers["content-disposition"].startswith("inline; filename=")
+
+    # One after another the model calls would take calls × TTFT; most of them overlapped
+    serial = slow_backend.calls * TTFT
+    assert wall < serial / 10, f"{BUILDS} builds took {wall:.1f}s ({serial:.0f}s serially)"
+    # ...while blocking work stayed on the default executor's few worker threads
+    assert peak - threads < 40, f"{peak - threads} threads started for {BUILDS} builds"
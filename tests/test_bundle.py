@@ -0,0 +1,62 @@
+"""Minified CSS and JS in the single-file bundle stay valid and equivalent."""
+
+import pytest
+
+from phases import bundle, validate
+
+
+@pytest.mark.parametrize("code, minified", [
+    # A line break after return ends the statement; joining would return x
+    ("function f() {\n  return\n  x;\n}", "function f(){return\nx;}"),
+    ("a = b\n++c", "a=b\n++c"),
+    ("let c = a + +b;", "let c=a+ +b;"),
+    ("let d = a - --b;", "let d=a- --b;"),
+    ("let e = a - -b;", "let e=a- -b;"),
+    ("if (ok) return /ab+c/.test(s);", "if(ok)return/ab+c/.test(s);"),
+    ("let m = s.match(/[/]+/g);", "let m=s.match(/[/]+/g);"),
+    ("x = f(/a\\/b/, 1);", "x=f(/a\\/b/,1);"),
+    ("const s = `a ${ b ? `in ${ c + 1 }` : \"\" } d`;", "const s=`a ${b?`in ${c+1}`:\"\"} d`;"),
+    ("const o = { a: `${ {x: 1}.x }` };", "const o={a:`${{x:1}.x}`};"),
+    ("const t = \"</script>\"; let u = 1;", "const t=\"</script>\";let u=1;"),
+])
+def test_minified_js_is_valid_and_equivalent(code, minified):
+    assert bundle.minify_js(code) == minified
+    assert validate.check_js(minified) == []
+
+
+@pytest.mark.parametrize("code", [
+    "let s = \"abc",
+    "let s = `abc ${x",
+    "let s = `abc",
+    "/* never closed",
+    "let r = (/abc;",
+])
+def test_unterminated_js_is_returned_unchanged(code):
+    assert bundle.minify_js(code) == code
+
+
+def test_minified_css_keeps_strings_and_descendant_combinators():
+    css = "a { color : red ; /* note */ }\n.b::after { content: \" } \" ; }\nul :hover { x: 1 }"
+    assert bundle.minify_css(css) == 'a{color :red}.b::after{content:" } "}ul :hover{x:1}'
+
+
+@pytest.mark.parametrize("css", ["a { color: red; /* open", "a { content: \"open }"])
+def test_unterminated_css_is_returned_unchanged(css):
+    assert bundle.minify_css(css) == css
+
+
+def test_build_inlines_files_and_moves_a_deferred_script_to_the_end_of_the_body():
+    files = {
+        "index.html": ('<html><head><link rel="stylesheet" href="style.css">'
+                       '<script defer src="game.js"></script></head>'
+                       '<body><canvas id="game"></canvas></body></html>'),
+        "style.css": "canvas { display: block; }",
+        "game.js": "const tag = \"</script>\";\nconsole.log(tag);\n",
+    }
+    html, report = bundle.build(files, minify=True)
+
+    assert report["inlined"] == ["style.css", "game.js"] == report["minified"]
+    head, body = html.split("<body>")
+    assert "<style>\ncanvas{display:block}\n</style>" in head and "<script" not in head
+    assert body == ('<canvas id="game"></canvas><script>\n'
+                    'const tag="<\\/script>";console.log(tag);\n</script>\n</body></html>')
@@ -0,0 +1,85 @@
+"""Concurrent builds must never see each other's files or events."""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from phases import clarify, execute, plan
+from phases.context import BuildContext
+
+from conftest import TAG
+
+GAME_FILES = {"index.html", "style.css", "game.js"}
+
+
+def _tags(text: str) -> set[str]:
+    return set(TAG.findall(text))
+
+
+def _build(tag: str) -> tuple[BuildContext, str]:
+    """Clarify, plan and generate one tagged game in its own session."""
+    ctx = BuildContext.for_session(f"session-{tag}")
+    idea = f"A star catching game called {tag}"
+    _, is_clear, requirements, history = clarify.run_web(idea, ctx=ctx)
+    if not is_clear:
+        _, _, requirements, history = clarify.run_web(idea, history, "Go ahead", ctx=ctx)
+    game_plan, history = plan.run(requirements, history, ctx)
+    assert game_plan["title"] == tag
+    return ctx, execute.run(game_plan, history, ctx)
+
+
+def test_parallel_builds_write_only_their_own_files(tagged_backend):
+    tags = [f"Tag{n}" for n in range(24)]
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = dict(zip(tags, pool.map(_build, tags)))
+
+    for tag, (ctx, output_path) in results.items():
+        assert output_path == os.path.abspath(os.path.join(config.OUTPUT_DIR, f"session-{tag}"))
+        files = set(os.listdir(output_path))
+        assert GAME_FILES <= files, f"{tag} is missing {GAME_FILES - files}"
+        assert not {name for name in files if ".tmp" in name}
+        for name in files:
+            with open(os.path.join(output_path, name), encoding="utf-8") as f:
+                found = _tags(f.read())
+            assert found <= {tag}, f"{tag}/{name} holds another session's game: {found}"
+        with open(os.path.join(output_path, "index.html"), encoding="utf-8") as f:
+            assert tag in f.read()
+        # Token usage was booked to this build's own context
+        assert {"clarify", "plan"} <= set(ctx.tokens)
+        assert any(phase.startswith("execute") for phase in ctx.tokens)
+
+
+def test_parallel_web_builds_stream_only_their_own_events(tagged_backend):
+    from app import app, build_queue
+
+    def session(tag: str) -> dict:
+        client = app.test_client()
+        started = client.post("/api/start", json={"game_idea": f"A game called {tag}"})
+        session_id = started.get_json()["session_id"]
+        if not started.get_json()["is_clear"]:
+            client.post("/api/message", json={"session_id": session_id, "message": "Go ahead"})
+        built = client.post("/api/build", json={"session_id": session_id})
+        assert built.status_code == 202, built.get_json()
+        job_id = built.get_json()["job_id"]
+        stream = client.get(f"/api/jobs/{job_id}/events").get_data(as_text=True)
+        events = [json.loads(line[len("data: "):]) for line in stream.splitlines()
+                  if line.startswith("data: ")]
+        page = client.get(events[-1]["preview_url"]).get_data(as_text=True)
+        return {"session_id": session_id, "job": build_queue.get(job_id),
+                "events": events, "page": page}
+
+    tags = [f"Tag{n}" for n in range(100, 112)]  # within BUILD_QUEUE_DEPTH
+    with ThreadPoolExecutor(max_workers=len(tags)) as pool:
+        results = dict(zip(tags, pool.map(session, tags)))
+
+    for tag, result in results.items():
+        session_id, events = result["session_id"], result["events"]
+        assert result["job"].session_id == session_id
+        assert result["job"].status == "done", result["job"].error
+        assert _tags(json.dumps(events)) == {tag}
+        assert [e["title"] for e in events if e["type"] == "plan"] == [tag]
+        done = events[-1]
+        assert done["type"] == "done"
+        assert done["preview_url"].startswith(f"/api/preview/{session_id}/")
+        assert _tags(result["page"]) == {tag}
@@ -0,0 +1,72 @@
+"""Applying the model's unified diffs to the game files."""
+
+import pytest
+
+from phases.edit import PatchError, apply_reply
+
+GAME_JS = """\
+const W = 800;
+const H = 600;
+
+function update(dt) {
+    player.x += player.speed * dt;
+    if (player.x > W) player.x = 0;
+}
+
+function draw(ctx) {
+    ctx.fillRect(player.x, player.y, 10, 10);
+}
+"""
+FILES = {"game.js": GAME_JS}
+
+
+def _reply(hunk: str) -> str:
+    return f"Here is the change:\n\n```diff\n--- a/game.js\n+++ b/game.js\n{hunk}```\n"
+
+
+def test_exact_hunk():
+    changed = apply_reply(_reply(
+        "@@ -4,4 +4,4 @@\n"
+        " function update(dt) {\n"
+        "-    player.x += player.speed * dt;\n"
+        "+    player.x += player.speed * 2 * dt;\n"
+        "     if (player.x > W) player.x = 0;\n"
+        " }\n"), FILES)
+    assert changed == {"game.js": GAME_JS.replace("player.speed * dt", "player.speed * 2 * dt")}
+
+
+def test_hunk_with_shifted_line_numbers():
+    changed = apply_reply(_reply(
+        "@@ -30,3 +30,3 @@\n"
+        " function draw(ctx) {\n"
+        "-    ctx.fillRect(player.x, player.y, 10, 10);\n"
+        "+    ctx.fillRect(player.x, player.y, 20, 20);\n"
+        " }\n"), FILES)
+    assert changed["game.js"] == GAME_JS.replace("10, 10", "20, 20")
+
+
+def test_hunk_with_whitespace_drift():
+    # Context re-indented with tabs and stray spaces, as models often do
+    changed = apply_reply(_reply(
+        "@@ -5,2 +5,2 @@\n"
+        "-\tplayer.x += player.speed*dt;\n"
+        "+    player.x -= player.speed * dt;\n"
+        " \tif (player.x > W)  player.x = 0;\n"), FILES)
+    lines = changed["game.js"].split("\n")
+    assert lines[4] == "    player.x -= player.speed * dt;"
+    assert changed["game.js"].count("player.speed") == 1
+
+
+def test_hunk_whose_context_is_missing():
+    with pytest.raises(PatchError, match="does not match"):
+        apply_reply(_reply(
+            "@@ -4,3 +4,3 @@\n"
+            " function tick(dt) {\n"
+            "-    enemy.x += enemy.speed * dt;\n"
+            "+    enemy.x += enemy.speed * 3 * dt;\n"
+            " }\n"), FILES)
+
+
+def test_reply_without_a_diff_block():
+    with pytest.raises(PatchError, match="no ```diff block"):
+        apply_reply("Sure! Just make the player faster in update().", FILES)
@@ -0,0 +1,107 @@
+"""Fan-out generation: interface first, the rest in parallel, no truncated parts."""
+
+import asyncio
+
+import pytest
+
+import llm
+from config import CONTINUE_PROMPT
+from fake_model import CANNED_PLAN, CANNED_SUBSYSTEMS, FakeBackend
+from phases import execute, fanout, validate
+from phases.context import BuildContext
+
+CUT_PART = "Write ONLY the `loop` part"
+CONTINUATION = CONTINUE_PROMPT.split("\n", 1)[0]
+
+
+class CuttingBackend(FakeBackend):
+    """Cuts the ``loop`` part off halfway; each continuation adds the rest
+    unless ``cut_every_time``, in which case it is cut off again."""
+
+    def __init__(self, cut_every_time: bool = False):
+        super().__init__()
+        self.cut_every_time = cut_every_time
+        self.continuations = 0
+
+    def respond(self, system_prompt, message, history):
+        text, finish_reason = super().respond(system_prompt, message, history)
+        asked = [p for m in history for p in m["parts"] if m["role"] == "user"]
+        if CUT_PART in message:
+            return text[:len(text) // 2], "MAX_TOKENS"
+        if message.startswith(CONTINUATION) and asked and CUT_PART in asked[0]:
+            self.continuations += 1
+            if self.cut_every_time:
+                return "  // still going\n", "MAX_TOKENS"
+            full = f"```js\n{CANNED_SUBSYSTEMS['loop']}```"
+            # Repeats a little of the cut-off text, as models often do
+            return full[len(full) // 2 - 20:], "STOP"
+        return text, finish_reason
+
+
+@pytest.fixture
+def backend(request):
+    """A fresh backend from the factory in ``request.param``."""
+    previous = llm.backend
+    llm.set_backend(request.param())
+    yield llm.backend
+    llm.set_backend(previous)
+
+
+def _run(ctx: BuildContext, use_async: bool) -> list[dict]:
+    if not use_async:
+        return list(execute.run_stream(CANNED_PLAN, [], ctx))
+
+    async def collect():
+        return [event async for event in execute.run_stream_async(CANNED_PLAN, [], ctx)]
+    return asyncio.run(collect())
+
+
+def _fanout_ctx(tmp_path) -> BuildContext:
+    return BuildContext(output_dir=str(tmp_path), execute_mode="fanout")
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("backend", [FakeBackend], indirect=True)
+def test_parts_are_generated_against_the_interface(backend, tmp_path, monkeypatch, use_async):
+    monkeypatch.setattr(execute, "SKELETONS_ENABLED", False)
+    ctx = _fanout_ctx(tmp_path)
+    events = _run(ctx, use_async)
+
+    done = [e["module"] for e in events if e["type"] == "module_done"]
+    assert done.index("interface") < min(done.index(part) for part in fanout.SUBSYSTEMS)
+    assert set(done) == {"interface", "page", "Player", "Star", "Rock", *fanout.SUBSYSTEMS}
+    game_js = (tmp_path / "game.js").read_text()
+    sections = [line for line in game_js.splitlines() if line.startswith("// ── ")]
+    assert sections[0].startswith("// ── Interface")
+    assert sections[-1] == "// ── Subsystem: loop ──"
+    assert events[-1]["type"] == "done" and events[-1]["problems"] == 0
+    assert validate.check_js(game_js) == []
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("backend", [CuttingBackend], indirect=True)
+def test_a_cut_off_part_is_continued(backend, tmp_path, monkeypatch, use_async):
+    monkeypatch.setattr(execute, "SKELETONS_ENABLED", False)
+    events = _run(_fanout_ctx(tmp_path), use_async)
+
+    assert backend.continuations
+    assert "module_failed" not in {e["type"] for e in events}
+    game_js = (tmp_path / "game.js").read_text()
+    # Stitched back together exactly, without the repeated overlap
+    assert f"// ── Subsystem: loop ──\n{CANNED_SUBSYSTEMS['loop'].strip()}\n" in game_js
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("backend", [lambda: CuttingBackend(cut_every_time=True)], indirect=True)
+def test_a_part_still_cut_off_falls_back_to_one_response(backend, tmp_path, monkeypatch,
+                                                         use_async):
+    monkeypatch.setattr(execute, "SKELETONS_ENABLED", False)
+    events = _run(_fanout_ctx(tmp_path), use_async)
+
+    assert {"type": "module_failed", "module": "loop"} in events
+    assert not any(e["type"] == "file_done" and "Subsystem" in e.get("content", "")
+                   for e in events)
+    # The single response wrote the whole game instead
+    game_js = (tmp_path / "game.js").read_text()
+    assert "assembled from generated modules" not in game_js
+    assert events[-1]["type"] == "done"
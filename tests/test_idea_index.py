@@ -0,0 +1,45 @@
+"""Near-duplicate lookup in the idea index, at the default threshold."""
+
+import pytest
+
+from config import IDEA_MATCH_THRESHOLD
+from idea_index import IdeaIndex
+
+IDEA = "A space shooter where you dodge asteroids and shoot alien ships"
+REQUIREMENTS = ("Arrow keys move the ship, space fires. Asteroids drift down the screen; "
+                "alien ships fire back. Three lives, score goes up per kill.")
+PLAN = {"title": "Astro Blaster", "description": "Shoot aliens, dodge rocks",
+        "mechanics": ["lives", "scoring"], "entities": [{"name": "Player ship"}]}
+MANIFEST = {"files": {"index.html": {"objects": {"identity": "0" * 64}}}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    ideas = IdeaIndex(str(tmp_path / "ideas.db"), max_entries=10,
+                      threshold=IDEA_MATCH_THRESHOLD)
+    ideas.add(IDEA, REQUIREMENTS, PLAN, MANIFEST)
+    ideas.add("A platformer with a frog collecting coins",
+              "Jump between platforms, collect every coin to finish the level.",
+              {"title": "Frog Hop"}, MANIFEST)
+    return ideas
+
+
+def test_identical_request_matches(index):
+    match = index.lookup(IDEA, REQUIREMENTS)
+    assert match is not None and match["title"] == "Astro Blaster"
+    assert match["score"] == 1.0
+
+
+def test_near_duplicate_matches(index):
+    match = index.lookup(
+        "Make a space shooter game: dodge the asteroids, shoot the alien ships",
+        "Arrow keys move the ship and space fires. Asteroids drift down the screen, "
+        "alien ships fire back. Three lives; score goes up for each kill.")
+    assert match is not None and match["title"] == "Astro Blaster"
+    assert IDEA_MATCH_THRESHOLD <= match["score"] < 1.0
+
+
+def test_different_idea_does_not_match(index):
+    assert index.lookup(
+        "A cooking game where you serve burgers to customers",
+        "Click ingredients to stack a burger, serve it before the customer leaves.") is None
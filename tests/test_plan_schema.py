@@ -0,0 +1,40 @@
+"""Lenient parsing of the plan's JSON out of a model reply."""
+
+import pytest
+
+from phases.plan_schema import parse_json
+
+
+@pytest.mark.parametrize("reply, expected", [
+    # Trailing commas
+    ('{"title": "Pong", "mechanics": ["bounce", "score",],}',
+     {"title": "Pong", "mechanics": ["bounce", "score"]}),
+    # Truncated object, array and string: closed where they stop
+    ('```json\n{"title": "Pong", "controls": {"up": "W",',
+     {"title": "Pong", "controls": {"up": "W"}}),
+    ('{"title": "Pong", "mechanics": ["bounce", "sc',
+     {"title": "Pong", "mechanics": ["bounce", "sc"]}),
+    ('{"title": "Pong", "entities": [{"name": "Ball", "role":',
+     {"title": "Pong", "entities": [{"name": "Ball"}]}),
+    # Single quotes, with an escaped one inside
+    ("{'title': 'Pong\\'s revenge', 'framework': 'vanilla'}",
+     {"title": "Pong's revenge", "framework": "vanilla"}),
+    # Missing commas
+    ('{"a": 1 "b": [1 2]}', {"a": 1, "b": [1, 2]}),
+])
+def test_damaged_json_is_repaired(reply, expected):
+    assert parse_json(reply) == (expected, True)
+
+
+@pytest.mark.parametrize("reply", [
+    'Sure! Here is the plan:\n{"title": "Pong", "framework": "vanilla"}\nWant changes?',
+    'Here you go:\n```json\n{"title": "Pong", "framework": "vanilla"}\n```\nOr {"x": 1}',
+])
+def test_surrounding_prose_is_ignored(reply):
+    assert parse_json(reply) == ({"title": "Pong", "framework": "vanilla"}, False)
+
+
+@pytest.mark.parametrize("reply", ["I could not come up with a plan.", '["not", "an object"]'])
+def test_reply_without_an_object_is_rejected(reply):
+    with pytest.raises(ValueError):
+        parse_json(reply)
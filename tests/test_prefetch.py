@@ -0,0 +1,59 @@
+"""Speculative plans never queue up behind each other."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import prefetch
+from prefetch import PlanPrefetcher
+
+HISTORY = [{"role": "user", "parts": ["A star catching game"]}]
+
+
+@pytest.fixture
+def release(monkeypatch):
+    """Make every speculative plan wait until the returned event is set."""
+    event = threading.Event()
+
+    def blocked(requirements, history, ctx):
+        event.wait(5)
+        return {"title": requirements}, history, ctx
+    monkeypatch.setattr(prefetch, "_plan", blocked)
+    yield event
+    event.set()
+
+
+def _eventually(predicate, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_no_plan_starts_while_the_workers_are_busy(release):
+    prefetcher = PlanPrefetcher(workers=1, enabled=True)
+    first = prefetcher.start("a", "first", HISTORY)
+    assert first is not None
+    assert prefetcher.start("b", "second", HISTORY) is None
+    assert prefetcher.take("b", "second", HISTORY) is None
+
+    release.set()
+    assert first.result(5)[0] == {"title": "first"}
+    # A worker is free again
+    assert _eventually(lambda: prefetcher.start("b", "second", HISTORY) is not None)
+    prefetcher.shutdown()
+
+
+def test_a_queued_plan_is_cancelled_when_taken(release):
+    prefetcher = PlanPrefetcher(workers=2, enabled=True)
+    prefetcher._executor = ThreadPoolExecutor(max_workers=1)  # one plan runs, one waits
+    running = prefetcher.start("a", "first", HISTORY)
+    queued = prefetcher.start("b", "second", HISTORY)
+    assert _eventually(running.running)
+
+    assert prefetcher.take("b", "second", HISTORY) is None
+    assert queued.cancelled()
+    assert prefetcher.take("a", "first", HISTORY) is running
+    prefetcher.shutdown(wait=False)
@@ -0,0 +1,144 @@
+"""Rate limiter buckets and AIMD concurrency, on a clock the tests move."""
+
+import threading
+import time
+
+from ratelimit import BULK, INTERACTIVE, AdaptiveConcurrency, RateLimiter
+
+
+class FakeClock:
+    """Time that only moves when a test says so."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def _start(fn, *args, **kwargs) -> threading.Thread:
+    """Run ``fn`` on a daemon thread, as a request that may have to wait."""
+    thread = threading.Thread(target=fn, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def _until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_request_bucket_refills_with_time_up_to_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(480, burst=2, clock=clock)  # one request per 0.125s
+    limiter.acquire()
+    limiter.acquire()
+
+    waiter = _start(limiter.acquire)
+    waiter.join(0.3)
+    assert waiter.is_alive()  # bucket empty and the clock stands still
+    clock.advance(0.125)
+    waiter.join(2)
+    assert not waiter.is_alive()
+
+    # A long pause refills only up to the burst
+    clock.advance(60)
+    limiter.acquire()
+    limiter.acquire()
+    waiter = _start(limiter.acquire)
+    waiter.join(0.3)
+    assert waiter.is_alive()
+    clock.advance(0.125)
+    waiter.join(2)
+    assert not waiter.is_alive()
+
+
+def test_charged_tokens_hold_back_later_requests():
+    clock = FakeClock()
+    limiter = RateLimiter(0, tokens_per_minute=4800, clock=clock)  # 80/s, 800 at most
+    limiter.acquire(tokens=800)
+    limiter.charge(5)  # the reply was longer than its estimate
+
+    waiter = _start(limiter.acquire, tokens=5)
+    clock.advance(0.0625)  # enough for 5 tokens, not for the 5 owed as well
+    waiter.join(0.3)
+    assert waiter.is_alive()
+    clock.advance(0.0625)
+    waiter.join(2)
+    assert not waiter.is_alive()
+
+
+def test_interactive_request_is_admitted_before_queued_bulk_one():
+    clock = FakeClock()
+    limiter = RateLimiter(480, burst=1, clock=clock)
+    limiter.acquire()
+    admitted = []
+
+    def acquire(priority):
+        limiter.acquire(priority=priority)
+        admitted.append(priority)
+
+    bulk = _start(acquire, BULK)
+    _until(lambda: limiter._waiting[BULK])
+    interactive = _start(acquire, INTERACTIVE)
+    _until(lambda: limiter._waiting[INTERACTIVE])
+
+    clock.advance(0.125)  # room for one request
+    interactive.join(2)
+    bulk.join(0.3)
+    assert admitted == [INTERACTIVE]
+    clock.advance(0.125)
+    bulk.join(2)
+    assert admitted == [INTERACTIVE, BULK]
+
+
+def test_quota_errors_halve_the_limit_and_successes_win_it_back():
+    concurrency = AdaptiveConcurrency(maximum=8, minimum=1)
+    for expected in (4, 2, 1, 1):
+        with concurrency.slot() as outcome:
+            outcome["overloaded"] = True
+        assert concurrency.limit == expected
+
+    # About one more slot per round of `limit` successes
+    concurrency.limit = 4.0
+    for _ in range(4):
+        with concurrency.slot():
+            pass
+    assert int(concurrency.limit) == 4
+    with concurrency.slot():
+        pass
+    assert int(concurrency.limit) == 5
+
+    for _ in range(100):
+        with concurrency.slot():
+            pass
+    assert concurrency.limit == 8
+    assert concurrency.active == 0
+
+
+def test_interactive_waiter_gets_the_next_slot_before_bulk():
+    concurrency = AdaptiveConcurrency(maximum=1)
+    concurrency.acquire()
+    admitted = []
+
+    def acquire(priority):
+        concurrency.acquire(priority)
+        admitted.append(priority)
+
+    bulk = _start(acquire, BULK)
+    _until(lambda: concurrency._waiting[BULK])
+    interactive = _start(acquire, INTERACTIVE)
+    _until(lambda: concurrency._waiting[INTERACTIVE])
+
+    concurrency.release()
+    interactive.join(2)
+    bulk.join(0.3)
+    assert admitted == [INTERACTIVE]
+    concurrency.release()
+    bulk.join(2)
+    assert admitted == [INTERACTIVE, BULK]
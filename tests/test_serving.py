@@ -0,0 +1,68 @@
+"""Built games are served with the right headers."""
+
+import json
+import shutil
+
+import pytest
+
+
+@pytest.fixture
+def built(tagged_backend):
+    """A Flask test client and the ``done`` event of one finished build."""
+    from app import app
+
+    client = app.test_client()
+    started = client.post("/api/start", json={"game_idea": "A star catching game"})
+    session_id = started.get_json()["session_id"]
+    if not started.get_json()["is_clear"]:
+        client.post("/api/message", json={"session_id": session_id, "message": "Go ahead"})
+    job_id = client.post("/api/build", json={"session_id": session_id}).get_json()["job_id"]
+    stream = client.get(f"/api/jobs/{job_id}/events").get_data(as_text=True)
+    done = [json.loads(line[len("data: "):]) for line in stream.splitlines()
+            if line.startswith("data: ")][-1]
+    assert done["type"] == "done"
+    return client, done
+
+
+@pytest.mark.parametrize("filename, content_type", [
+    ("index.html", "text/html; charset=utf-8"),
+    ("style.css", "text/css; charset=utf-8"),
+    ("game.js", "application/javascript; charset=utf-8"),
+])
+def test_game_files_are_named_and_carry_one_charset(built, filename, content_type):
+    client, done = built
+    url = done["preview_url"].rsplit("/", 1)[0] + "/" + filename
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == content_type
+    assert response.headers["Content-Disposition"] == f"inline; filename={filename}"
+
+
+def test_evicted_game_is_no_longer_served_or_edited(built, monkeypatch):
+    import api
+    import artifacts
+
+    client, done = built
+    session_id = done["preview_url"].split("/")[3]
+    monkeypatch.setattr(artifacts.store, "grace", 0)
+    stats = artifacts.collect(api.sessions.exists, max_bytes=1, on_evict=api._output_evicted)
+    assert stats["removed_outputs"]["quota"] >= 1
+
+    assert api.sessions.get(session_id)["output_path"] is None
+    assert client.get(done["preview_url"]).status_code == 404
+    response = client.post("/api/edit", json={"session_id": session_id,
+                                              "instruction": "Make it faster"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Nothing built yet"
+
+
+def test_edit_of_a_deleted_output_is_not_found(built):
+    import api
+
+    client, done = built
+    session_id = done["preview_url"].split("/")[3]
+    shutil.rmtree(api.sessions.get(session_id)["output_path"])
+    response = client.post("/api/edit", json={"session_id": session_id,
+                                              "instruction": "Make it faster"})
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Game not built yet"
@@ -0,0 +1,79 @@
+"""Phase steps run the same under the thread and the coroutine drivers."""
+
+import asyncio
+
+import pytest
+
+from phases import steps
+
+
+def _fail():
+    raise ValueError("disk full")
+
+
+def _doubled(n):
+    return (yield steps.Call(lambda: n * 2))
+
+
+def _step(log: list):
+    yield {"type": "started"}
+    value = yield steps.Call(sum, [1, 2, 3])
+    try:
+        yield steps.Call(_fail)
+    except ValueError as e:
+        log.append(str(e))
+    parts = steps.Group(2)
+    for n in range(3):
+        parts.add(f"part{n}", _doubled(n))
+    results = {}
+    try:
+        while parts:
+            key, result = yield parts
+            results[key] = result
+    finally:
+        parts.cancel()
+    yield {"type": "parts", "results": results}
+    return value
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_drivers_give_the_same_events_and_value(use_async):
+    log = []
+    if use_async:
+        outcome = {}
+
+        async def collect():
+            return [event async for event in steps.run_async(_step(log), outcome)]
+        events = asyncio.run(collect())
+        value = outcome["value"]
+    else:
+        runner = steps.run(_step(log))
+        events = []
+        while True:
+            try:
+                events.append(next(runner))
+            except StopIteration as stop:
+                value = stop.value
+                break
+
+    assert events == [{"type": "started"},
+                      {"type": "parts", "results": {"part0": 0, "part1": 2, "part2": 4}}]
+    assert value == 6
+    # A failed request raises inside the step, where it can be handled
+    assert log == ["disk full"]
+
+
+def test_unhandled_request_error_reaches_the_caller_and_closes_the_step():
+    closed = []
+
+    def step():
+        try:
+            yield steps.Call(_fail)
+        finally:
+            closed.append(True)
+
+    with pytest.raises(ValueError, match="disk full"):
+        steps.call(step())
+    with pytest.raises(ValueError, match="disk full"):
+        asyncio.run(steps.call_async(step()))
+    assert closed == [True, True]
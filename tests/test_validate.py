@@ -0,0 +1,55 @@
+"""Static checks of generated files: missing files, and the fallback JavaScript
+tokenizer used when esprima is not installed."""
+
+import pytest
+
+from fake_model import CANNED_CSS, CANNED_CORE_JS, CANNED_HTML, CANNED_PLAN
+from phases import bundle, steps, validate
+from phases.context import BuildContext
+
+
+@pytest.mark.parametrize("code", [
+    "let half = i++ / 2;",
+    "let half = i-- / 2 / 1;",
+    "let n = a[i++] / b[j--];",
+    "let x = ++i / 2;",
+    "const ok = /a\\/b/g.test(s) && x / y > 1;",
+    "function f() { return /\\d+/.exec(s); }",
+    "const s = `a ${b / 2} c`;",
+])
+def test_valid_code_has_no_problems(code):
+    assert validate._scan_js(code) == []
+
+
+@pytest.mark.parametrize("code, message", [
+    ("let r = x = /abc;", "unterminated regular expression"),
+    ("let s = 'abc;", "unterminated string literal"),
+    ("function f() {\n  return 1;\n", "'{' is never closed (file ends at line 3)"),
+])
+def test_broken_code_is_reported(code, message):
+    assert [p["message"] for p in validate._scan_js(code)] == [message]
+
+
+def test_minified_division_after_postfix_update_is_kept():
+    code = "let a = i++ / 2;\nlet b = j-- / 4;\nlet c = x + ++y;\n"
+    assert bundle.minify_js(code) == "let a=i++/2;let b=j--/4;let c=x+ ++y;"
+
+
+def test_missing_required_files_are_reported_once():
+    problems = validate.check({"style.css": CANNED_CSS})
+    assert [(p["file"], p["line"]) for p in problems] == [("index.html", None), ("game.js", None)]
+
+    # index.html links game.js: reported by that check, not twice
+    problems = validate.check({"index.html": CANNED_HTML, "style.css": CANNED_CSS})
+    assert [p["file"] for p in problems] == ["game.js"]
+    assert "links it" in problems[0]["message"]
+
+
+def test_missing_index_html_is_regenerated(tmp_path):
+    files = {"style.css": CANNED_CSS, "game.js": CANNED_CORE_JS}
+    written = {}
+    problems, repairs = steps.call(validate.run(
+        CANNED_PLAN, files, BuildContext(output_dir=str(tmp_path)), written.__setitem__))
+    assert problems == [] and repairs == 1
+    assert written == {"index.html": files["index.html"]}
+    assert '<script src="game.js">' in files["index.html"]